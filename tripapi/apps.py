@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class TripapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tripapi'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .metrics import install_query_timer
+
+        # Count and time every database query for /api/metrics/ and Server-Timing
+        connection_created.connect(install_query_timer)
@@ -0,0 +1,34 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor():
+    """Single thread that runs the async views' database work in this process"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-db')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def db_sync_to_async(func):
+    """
+    sync_to_async for ORM code called from async views. Django gives every
+    ASGI request its own thread for sync_to_async, so hundreds of concurrent
+    plans would be hundreds of concurrent SQLite writers failing with
+    "database is locked"; running them all on one thread serializes the
+    writes instead.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        return func(*args, **kwargs)
+    return sync_to_async(run, thread_sensitive=False, executor=get_db_executor())
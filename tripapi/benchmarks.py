@@ -0,0 +1,139 @@
+import math
+import resource
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of `samples` (pct in 0-100)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    ms = [s * 1000 for s in samples]
+    return {
+        'runs': len(ms),
+        'mean_ms': round(statistics.fmean(ms), 3) if ms else 0.0,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'max_ms': round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def time_calls(fn, repeat, warmup=1, setup=None):
+    """
+    Call fn() warmup + repeat times and return the timed durations in seconds.
+    `setup()`, if given, runs untimed before every call.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def compare_results(baseline, current, threshold_pct=10.0, min_delta=1.0, metric='p95_ms', section=''):
+    """
+    Compare two benchmark reports section by section. A section regresses
+    when its `metric` grew by more than threshold_pct percent and by more
+    than min_delta (so sub-millisecond stages don't flag on noise), or when
+    it ran more database queries than before. Returns one row per section
+    found in both.
+    """
+    rows = []
+    if not isinstance(baseline, dict) or not isinstance(current, dict):
+        return rows
+    if metric in baseline and metric in current:
+        old, new = baseline[metric], current[metric]
+        change = (new - old) / old * 100 if old else 0.0
+        row = {
+            'section': section,
+            'baseline': old,
+            'current': new,
+            'change_pct': round(change, 1),
+            'regressed': change > threshold_pct and new - old > min_delta,
+        }
+        if 'queries' in baseline and 'queries' in current:
+            row['baseline_queries'] = baseline['queries']
+            row['current_queries'] = current['queries']
+            row['regressed'] = row['regressed'] or current['queries'] > baseline['queries']
+        rows.append(row)
+    for key, value in baseline.items():
+        if key in current:
+            rows.extend(compare_results(value, current[key], threshold_pct, min_delta, metric,
+                                        f"{section}.{key}" if section else key))
+    return rows
+
+
+def sample_day_entries(driving_hours=11.0, start_hour=6.0):
+    """Drawing entries for a typical driving day, as produced by generate_eld_drawing_data"""
+    drive_start = start_hour + 0.5
+    drive_end = min(drive_start + driving_hours, 22.0)
+    day = [
+        ('off_duty', 0.0, start_hour),
+        ('on_duty', start_hour, drive_start),
+        ('driving', drive_start, drive_end),
+        ('sleeper', drive_end, 24.0),
+    ]
+    entries = []
+    for status, start, end in day:
+        entries.append((start, status))
+        entries.append((end, status))
+    return entries
+
+
+def sample_plan_results(days, start=None):
+    """
+    Rest-stop and ELD-log results shaped like plan_rest_stops and
+    generate_eld_logs output for a trip of `days` driving days
+    """
+    start = start or datetime(2025, 1, 6, 6, 0)
+    entries = sample_day_entries()
+    log_entries = [
+        {'status': status, 'start_hour': start_hour, 'end_hour': end_hour}
+        for (start_hour, status), (end_hour, _) in zip(entries[::2], entries[1::2])
+    ]
+    rest_stops = []
+    eld_logs = []
+    for day in range(days):
+        day_start = start + timedelta(days=day)
+        rest_stops.append({
+            'location': 'Rest Area',
+            'arrival_time': day_start + timedelta(hours=11.5),
+            'departure_time': day_start + timedelta(hours=21.5),
+            'rest_duration': 10,
+            'is_fuel_stop': day % 2 == 1,
+        })
+        eld_logs.append({
+            'date': date.fromordinal(day_start.toordinal()),
+            'log_entries': log_entries,
+            'total_off_duty_hours': 6.0,
+            'total_sleeper_hours': 6.5,
+            'total_driving_hours': 11.0,
+            'total_on_duty_hours': 0.5,
+            'total_hours': 24.0,
+            'total_miles': 605.0,
+        })
+    return {'rest_stops': rest_stops}, eld_logs
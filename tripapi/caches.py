@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for a named cache"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0}
+
+    def incr(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def hit(self):
+        self.incr('hits')
+
+    def miss(self):
+        self.incr('misses')
+
+    def reset(self):
+        with self._lock:
+            self._counters = {'hits': 0, 'misses': 0}
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self._counters)
+        lookups = data['hits'] + data['misses']
+        data['hit_rate'] = data['hits'] / lookups if lookups else 0.0
+        return data
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_cache_stats(name):
+    """Return the process-wide stats object for the cache called `name`"""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = CacheStats(name)
+        return _registry[name]
+
+
+def all_cache_stats():
+    with _registry_lock:
+        stats = list(_registry.values())
+    return {s.name: s.snapshot() for s in stats}
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache with a time-to-live per entry and LRU
+    eviction once it holds more than max_entries. Lookups are counted in the
+    stats registry under `name`.
+    """
+
+    def __init__(self, name, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = get_cache_stats(name)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.stats.incr('expired')
+                entry = None
+            if entry is None:
+                self.stats.miss()
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hit()
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.incr('evictions')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """Process-wide cache of ORS directions responses (see TripPlannerService.route_between)"""
+    global _route_cache
+    with _route_cache_lock:
+        if _route_cache is None:
+            _route_cache = TTLCache(
+                'route',
+                ttl=getattr(settings, 'ROUTE_CACHE_TTL', 60 * 60),
+                max_entries=getattr(settings, 'ROUTE_CACHE_MAX_ENTRIES', 256),
+            )
+        return _route_cache
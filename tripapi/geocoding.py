@@ -0,0 +1,52 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import GeocodeCacheEntry
+
+
+def normalize_address(location):
+    """Canonical cache key for a free-text address ("Dallas,  TX" == "dallas, tx")"""
+    key = re.sub(r'\s*,\s*', ', ', location.strip().lower())
+    return re.sub(r'\s+', ' ', key).strip(' ,')
+
+
+class GeocodeCache:
+    """
+    Persistent address -> coordinates cache backed by GeocodeCacheEntry.
+    Entries expire after `ttl` seconds and the least recently used rows are
+    evicted once the table grows past `max_entries`.
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'GEOCODE_CACHE_TTL', 60 * 60 * 24 * 30)
+        self.max_entries = max_entries if max_entries is not None else getattr(settings, 'GEOCODE_CACHE_MAX_ENTRIES', 5000)
+
+    def get(self, key):
+        entry = GeocodeCacheEntry.objects.filter(query=key).first()
+        if entry is None:
+            return None
+        if entry.created_at < timezone.now() - timedelta(seconds=self.ttl):
+            entry.delete()
+            return None
+
+        GeocodeCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+        return entry.coordinates
+
+    def set(self, key, coordinates):
+        GeocodeCacheEntry.objects.update_or_create(
+            query=key,
+            defaults={'coordinates': coordinates, 'hits': 0, 'created_at': timezone.now()}
+        )
+        self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries beyond max_entries"""
+        stale_ids = list(
+            GeocodeCacheEntry.objects.order_by('-last_used_at').values_list('id', flat=True)[self.max_entries:]
+        )
+        if stale_ids:
+            GeocodeCacheEntry.objects.filter(id__in=stale_ids).delete()
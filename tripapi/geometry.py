@@ -0,0 +1,109 @@
+import numpy as np
+
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def decode_polyline(encoded, precision=5):
+    """
+    Decode an encoded polyline (as returned by ORS) into an (n, 2) array of
+    [longitude, latitude] pairs. The varint decoding is done with array
+    operations so long routes don't go through a per-character Python loop.
+    """
+    if not encoded:
+        return np.empty((0, 2))
+
+    chars = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    # A chunk without the 0x20 continuation bit terminates a value
+    ends = np.flatnonzero(chars < 0x20)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value_index = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shift = 5 * (np.arange(len(value_index)) - starts[value_index])
+
+    values = np.zeros(len(ends), dtype=np.int64)
+    np.add.at(values, value_index, (chars[:len(value_index)] & 0x1f) << shift)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    lat_lon = np.cumsum(deltas[:len(deltas) // 2 * 2].reshape(-1, 2), axis=0) / 10 ** precision
+    return lat_lon[:, ::-1]
+
+
+def encode_polyline(coordinates, precision=5):
+    """Encode [longitude, latitude] pairs into a polyline string"""
+    lat_lon = np.round(np.asarray(coordinates, dtype=float)[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(lat_lon, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    encoded = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        encoded.append(chr(value + 63))
+    return ''.join(encoded)
+
+
+def haversine_miles(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+class RouteGeometry:
+    """
+    A route polyline with cumulative along-route distances, used to turn a
+    mile marker into the coordinate that is actually on the road there.
+    """
+
+    def __init__(self, coordinates, total_miles=None):
+        self.coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        segment_miles = haversine_miles(
+            self.coordinates[:-1, 0], self.coordinates[:-1, 1],
+            self.coordinates[1:, 0], self.coordinates[1:, 1]
+        )
+        self.cumulative_miles = np.concatenate(([0.0], np.cumsum(segment_miles)))
+
+        # Mile markers come from the routed distance, which is slightly longer
+        # than the great-circle length of the simplified polyline
+        length = self.cumulative_miles[-1]
+        self.scale = length / total_miles if total_miles and length else 1.0
+
+    @classmethod
+    def from_route_data(cls, route_data, total_miles=None):
+        """Build from an ORS directions response, or None if it has no usable geometry"""
+        routes = (route_data or {}).get('routes') or []
+        parts = []
+        for route in routes:
+            geometry = route.get('geometry')
+            if isinstance(geometry, str):
+                parts.append(decode_polyline(geometry))
+            elif isinstance(geometry, dict) and geometry.get('coordinates'):
+                parts.append(np.asarray(geometry['coordinates'], dtype=float)[:, :2])
+        if not parts:
+            return None
+
+        coordinates = np.concatenate(parts)
+        if len(coordinates) < 2:
+            return None
+        return cls(coordinates, total_miles=total_miles)
+
+    @property
+    def length_miles(self):
+        return self.cumulative_miles[-1]
+
+    def points_at(self, miles):
+        """Return an (n, 2) array of [lon, lat] for each mile marker in `miles`"""
+        distances = np.clip(np.asarray(miles, dtype=float) * self.scale, 0, self.length_miles)
+        index = np.clip(np.searchsorted(self.cumulative_miles, distances, side='right') - 1,
+                        0, len(self.cumulative_miles) - 2)
+
+        start = self.cumulative_miles[index]
+        span = self.cumulative_miles[index + 1] - start
+        fraction = np.divide(distances - start, span, out=np.zeros_like(distances), where=span > 0)
+
+        a = self.coordinates[index]
+        b = self.coordinates[index + 1]
+        return a + (b - a) * fraction[..., None]
+
+    def point_at(self, miles):
+        return self.points_at([miles])[0].tolist()
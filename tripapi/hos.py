@@ -0,0 +1,256 @@
+from datetime import timedelta
+
+import numpy as np
+
+# Limits used by TripPlannerService.simulate_rest_stops
+MAX_DAILY_DRIVING = 11     # Max driving hours per day
+MAX_DAILY_DUTY = 14        # Max on-duty hours per day
+MIN_REST_PERIOD = 10       # Rest hours after a day's driving
+MAX_CYCLE_HOURS = 70       # Max duty hours in 8-day cycle
+CYCLE_RESTART_HOURS = 34   # Off-duty hours that reset the cycle
+FUEL_DISTANCE = 1000       # Miles between fuel stops
+FUEL_STOP_HOURS = 0.5
+AVG_SPEED = 55             # Average speed in miles/hour
+
+# Names of the limits above that TripPlannerService also defines
+RULE_NAMES = (
+    'MAX_DAILY_DRIVING', 'MAX_DAILY_DUTY', 'MIN_REST_PERIOD', 'MAX_CYCLE_HOURS',
+    'CYCLE_RESTART_HOURS', 'FUEL_DISTANCE', 'FUEL_STOP_HOURS', 'AVG_SPEED',
+)
+
+# Hours of the day the driver may drive (6 AM to 10 PM), as in generate_eld_logs
+DRIVING_WINDOW = (6.0, 22.0)
+
+DEPARTURE_OBJECTIVES = ('elapsed', 'rests')
+
+CYCLE_EPSILON = 1e-6
+CLOCK_EPSILON = 1e-6
+MILES_EPSILON = 1e-6  # Left over when driving times are rounded to the microsecond
+
+
+def simulate_hos(distance_miles, cycle_used, departure_hour=0.0, max_iterations=10000, rules=None,
+                 driving_window=DRIVING_WINDOW):
+    """
+    Run the rest-stop simulation of TripPlannerService.simulate_rest_stops for
+    many scenarios at once. Inputs are broadcast against each other; every
+    scenario advances one stop per iteration, so the loop runs once per stop
+    of the longest trip rather than once per scenario.
+
+    `rules` overrides the limits above by name (see RULE_NAMES). Driving
+    only happens between the (start_hour, end_hour) of `driving_window`, as
+    in simulate_rest_stops: a departure outside it waits for the window to
+    open, and a driver still on the road when it closes stops for a rest that
+    lasts until it opens again (at least MIN_REST_PERIOD). Pass None to
+    drive around the clock.
+
+    Returns a dict of arrays: arrival_hours (hours after departure),
+    driving_hours, stops, fuel_stops, restarts, days (calendar days from the
+    departure day to the arrival day) and completed (False if max_iterations
+    ran out first).
+    """
+    rules = {name: float(value) for name, value in {**default_rules(), **(rules or {})}.items()}
+    max_daily_driving = rules['MAX_DAILY_DRIVING']
+    max_daily_duty = rules['MAX_DAILY_DUTY']
+    min_rest_period = rules['MIN_REST_PERIOD']
+    max_cycle_hours = rules['MAX_CYCLE_HOURS']
+    cycle_restart_hours = rules['CYCLE_RESTART_HOURS']
+    fuel_distance = rules['FUEL_DISTANCE']
+    fuel_stop_hours = rules['FUEL_STOP_HOURS']
+    avg_speed = rules['AVG_SPEED']
+
+    distance_miles, cycle_used, departure_hour = np.broadcast_arrays(
+        np.asarray(distance_miles, dtype=float),
+        np.asarray(cycle_used, dtype=float),
+        np.asarray(departure_hour, dtype=float),
+    )
+    shape = distance_miles.shape
+    size = distance_miles.size
+
+    result = {
+        'arrival_hours': np.zeros(size),
+        'driving_hours': np.zeros(size),
+        'stops': np.zeros(size, dtype=np.int64),
+        'fuel_stops': np.zeros(size, dtype=np.int64),
+        'restarts': np.zeros(size, dtype=np.int64),
+        'completed': np.zeros(size, dtype=bool),
+    }
+
+    # State of the scenarios still driving; finished ones are written to
+    # `result` and dropped so long-running outliers don't slow down the rest
+    index = np.arange(size)
+    total = distance_miles.ravel().copy()
+    start_hour = departure_hour.ravel().copy()
+    miles = np.zeros(size)
+    driving_hours = np.zeros(size)
+    elapsed = np.zeros(size)
+    since_fuel = np.zeros(size)
+    remaining_driving = np.full(size, max_daily_driving)
+    remaining_duty = np.full(size, max_daily_duty)
+    remaining_cycle = max_cycle_hours - cycle_used.ravel()
+    stops = np.zeros(size, dtype=np.int64)
+    fuel_stops = np.zeros(size, dtype=np.int64)
+    restarts = np.zeros(size, dtype=np.int64)
+
+    if driving_window is not None:
+        window_open, window_close = (float(hour) for hour in driving_window)
+
+        def window_state(elapsed):
+            """(inside the window, hours until it closes, hours until it next opens)"""
+            clock = np.mod(start_hour + elapsed, 24.0)
+            inside = (clock >= window_open - CLOCK_EPSILON) & (clock < window_close - CLOCK_EPSILON)
+            return inside, window_close - clock, np.where(inside, 0.0, np.mod(window_open - clock, 24.0))
+
+    for _ in range(max_iterations + 1):
+        done = miles >= total
+        if done.any():
+            finished = index[done]
+            result['arrival_hours'][finished] = elapsed[done]
+            result['driving_hours'][finished] = driving_hours[done]
+            result['stops'][finished] = stops[done]
+            result['fuel_stops'][finished] = fuel_stops[done]
+            result['restarts'][finished] = restarts[done]
+            result['completed'][finished] = True
+
+            keep = ~done
+            index, total, start_hour, miles, driving_hours, elapsed, since_fuel = (
+                index[keep], total[keep], start_hour[keep], miles[keep], driving_hours[keep], elapsed[keep],
+                since_fuel[keep]
+            )
+            remaining_driving, remaining_duty, remaining_cycle = (
+                remaining_driving[keep], remaining_duty[keep], remaining_cycle[keep]
+            )
+            stops, fuel_stops, restarts = stops[keep], fuel_stops[keep], restarts[keep]
+        if not index.size:
+            break
+
+        drivable = np.minimum(np.minimum(remaining_driving, remaining_duty), remaining_cycle)
+        if driving_window is None:
+            active = np.ones(index.size, dtype=bool)
+        else:
+            active, until_close, until_open = window_state(elapsed)
+            drivable = np.where(active, np.minimum(drivable, until_close), drivable)
+
+            # Window closed: wait at the start, otherwise rest until it opens
+            closed = ~active
+            on_road = closed & ((miles > 0) | (stops > 0))
+            wait = np.where(on_road, np.maximum(until_open, min_rest_period), until_open)
+            elapsed = np.where(closed, elapsed + wait, elapsed)
+            remaining_driving = np.where(on_road, max_daily_driving, remaining_driving)
+            remaining_duty = np.where(on_road, max_daily_duty, remaining_duty)
+            stops += on_road
+        drivable_miles = drivable * avg_speed
+
+        restart = active & (remaining_cycle < CYCLE_EPSILON)
+        hours_to_fuel = (fuel_distance - since_fuel) / avg_speed
+        fuel_due = (active & ~restart & (since_fuel + drivable_miles > fuel_distance)
+                    & (miles + fuel_distance - since_fuel < total))
+        # The fuel stop is on duty; if the cycle runs out first, drive to the pump and restart there
+        fuel = fuel_due & (hours_to_fuel + fuel_stop_hours <= remaining_cycle + CYCLE_EPSILON)
+        pump_restart = fuel_due & ~fuel
+        drivable = np.where(pump_restart, hours_to_fuel, drivable)
+        drivable_miles = np.where(pump_restart, fuel_distance - since_fuel, drivable_miles)
+        other = active & ~restart & ~fuel
+        hours_needed = (total - miles) / avg_speed
+        finish = other & (hours_needed <= drivable)
+        rest = other & ~finish
+
+        # Cycle exhausted: 34-hour restart
+        elapsed = np.where(restart, elapsed + cycle_restart_hours, elapsed)
+        remaining_cycle = np.where(restart, max_cycle_hours, remaining_cycle)
+        restarts += restart
+
+        # Drive to the next fuel stop and refuel; the stop is on duty, so it counts towards the cycle
+        miles = np.where(fuel, miles + fuel_distance - since_fuel, miles)
+        driving_hours = np.where(fuel, driving_hours + hours_to_fuel, driving_hours)
+        elapsed = np.where(fuel, elapsed + hours_to_fuel + fuel_stop_hours, elapsed)
+        since_fuel = np.where(fuel, 0.0, since_fuel)
+        remaining_driving = np.where(fuel, remaining_driving - hours_to_fuel, remaining_driving)
+        remaining_duty = np.where(fuel, remaining_duty - hours_to_fuel - fuel_stop_hours, remaining_duty)
+        remaining_cycle = np.where(fuel, remaining_cycle - hours_to_fuel - fuel_stop_hours, remaining_cycle)
+        fuel_stops += fuel
+
+        # Drive the rest of the trip
+        miles = np.where(finish, total, miles)
+        driving_hours = np.where(finish, driving_hours + hours_needed, driving_hours)
+        elapsed = np.where(finish, elapsed + hours_needed, elapsed)
+        remaining_cycle = np.where(finish, remaining_cycle - hours_needed, remaining_cycle)
+
+        # Drive as far as the limits allow, then take the required rest: a 34-hour
+        # restart when the cycle is what ran out, otherwise a 10-hour rest
+        cycle_rest = rest & (pump_restart | (drivable >= remaining_cycle - CYCLE_EPSILON))
+        miles = np.where(rest, miles + drivable_miles, miles)
+        driving_hours = np.where(rest, driving_hours + drivable, driving_hours)
+        since_fuel = np.where(rest, since_fuel + drivable_miles, since_fuel)
+        elapsed = np.where(rest, elapsed + drivable + np.where(cycle_rest, cycle_restart_hours, min_rest_period),
+                           elapsed)
+        remaining_cycle = np.where(cycle_rest, max_cycle_hours, np.where(rest, remaining_cycle - drivable,
+                                                                         remaining_cycle))
+        restarts += cycle_rest
+
+        reset = restart | rest
+        if driving_window is not None:
+            # A rest that ends while the window is closed lasts until it opens
+            elapsed = np.where(reset, elapsed + window_state(elapsed)[2], elapsed)
+        remaining_driving = np.where(reset, max_daily_driving, remaining_driving)
+        remaining_duty = np.where(reset, max_daily_duty, remaining_duty)
+        stops += restart | fuel | rest
+
+    # Scenarios cut off by max_iterations report where they had got to
+    result['arrival_hours'][index] = elapsed
+    result['driving_hours'][index] = driving_hours
+    result['stops'][index] = stops
+    result['fuel_stops'][index] = fuel_stops
+    result['restarts'][index] = restarts
+
+    result = {name: values.reshape(shape) for name, values in result.items()}
+    result['days'] = np.floor((departure_hour + result['arrival_hours']) / 24).astype(np.int64) + 1
+    return result
+
+
+def default_rules():
+    return {name: globals()[name] for name in RULE_NAMES}
+
+
+def recommend_departures(distance_miles, cycle_used, earliest, window_hours=48, step_minutes=15,
+                         objective='elapsed', limit=5, rules=None, driving_window=DRIVING_WINDOW):
+    """
+    Evaluate every departure from `earliest` (a datetime) to `window_hours`
+    later in `step_minutes` steps with one simulate_hos call and return the
+    `limit` best. The 'elapsed' objective ranks by hours from departure to
+    arrival, then by rests; 'rests' ranks by the number of rests (10-hour
+    rests plus 34-hour restarts), then by elapsed hours. Ties go to the
+    earlier departure. Scenarios the simulation couldn't finish are never
+    recommended.
+    """
+    if objective not in DEPARTURE_OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective!r}")
+
+    offsets = np.arange(0, window_hours * 60 + 1, step_minutes) / 60.0
+    start_hour = earliest.hour + earliest.minute / 60.0 + earliest.second / 3600.0
+    result = simulate_hos(distance_miles, cycle_used, start_hour + offsets, rules=rules,
+                          driving_window=driving_window)
+
+    # Hours spent waiting for the window before the first mile count as elapsed too
+    elapsed = np.round(result['arrival_hours'], 6)
+    rests = result['stops'] - result['fuel_stops']
+    if objective == 'elapsed':
+        order = np.lexsort((offsets, rests, elapsed))
+    else:
+        order = np.lexsort((offsets, elapsed, rests))
+    # Where an unfinished scenario stopped says nothing about when it would arrive
+    order = order[result['completed'][order]]
+
+    options = []
+    for i in order[:limit]:
+        departure_time = earliest + timedelta(hours=float(offsets[i]))
+        options.append({
+            'departure_time': departure_time,
+            'arrival_time': departure_time + timedelta(hours=float(result['arrival_hours'][i])),
+            'elapsed_hours': round(float(result['arrival_hours'][i]), 2),
+            'driving_hours': round(float(result['driving_hours'][i]), 2),
+            'rests': int(rests[i]),
+            'fuel_stops': int(result['fuel_stops'][i]),
+            'restarts': int(result['restarts'][i]),
+            'days': int(result['days'][i]),
+        })
+    return options
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+from .caches import get_cache_stats
+from .log_templates import get_log_template
+from .rendering import ELDRenderer, get_renderer, render_many, render_workers
+
+
+def image_cache_key(hours, renderer=None, template=None):
+    """
+    Content address of a rendered day: the drawing entries plus the template
+    pixels and the renderer that would draw them. Identical days share a key.
+    """
+    if not isinstance(renderer, ELDRenderer):
+        renderer = get_renderer(renderer)
+    payload = json.dumps({
+        'entries': [[round(float(hour), 6), status] for hour, status in hours],
+        'template': get_log_template(template).digest,
+        'renderer': renderer.name,
+        'version': renderer.version,
+    }, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ImageCache:
+    """
+    Size-bounded on-disk store of rendered log PNGs, shared by every worker
+    that points at the same directory. Reads refresh a file's mtime and the
+    least recently used files are deleted once the store outgrows max_bytes.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = Path(root or getattr(settings, 'ELD_IMAGE_CACHE_DIR', Path(settings.MEDIA_ROOT) / 'eld_cache'))
+        self.max_bytes = max_bytes if max_bytes is not None else getattr(settings, 'ELD_IMAGE_CACHE_MAX_BYTES', 512 * 1024 ** 2)
+        self.stats = get_cache_stats('eld_images')
+        self._lock = threading.Lock()
+        self._approx_bytes = None
+
+    def path(self, key):
+        return self.root / key[:2] / f"{key}.png"
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self.stats.miss()
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # Evicted by another worker in between
+        self.stats.hit()
+        self.stats.incr('bytes_saved', len(data))
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so other workers never read a partial PNG
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.stats.incr('bytes_written', len(data))
+
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._disk_usage()
+            else:
+                self._approx_bytes += len(data)
+            if self._approx_bytes > self.max_bytes:
+                self._approx_bytes = self.evict()
+
+    def _files(self):
+        if not self.root.exists():
+            return []
+        files = []
+        for path in self.root.glob('*/*.png'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _disk_usage(self):
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self):
+        """Delete least recently used images down to 90% of max_bytes; returns bytes kept"""
+        files = sorted(self._files(), key=lambda item: item[0])
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                self.stats.incr('evictions')
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
+
+
+def render_days(days, renderer=None, template=None):
+    """
+    Return PNG bytes for each day's entries, in order. Cached images are
+    reused; the remaining distinct days are rendered on the render pool and
+    stored for next time.
+    """
+    cache = get_image_cache()
+    renderer = get_renderer(renderer)
+    keys = [image_cache_key(hours, renderer, template) for hours in days]
+
+    images = {}
+    to_render = {}
+    for key, hours in zip(keys, days):
+        if key in images or key in to_render:
+            continue
+        data = cache.get(key)
+        if data is not None:
+            images[key] = data
+        else:
+            to_render[key] = hours
+
+    if to_render:
+        rendered = render_many(list(to_render.values()), renderer=renderer.name, template=template)
+        for key, data in zip(to_render, rendered):
+            cache.put(key, data)
+            images[key] = data
+
+    return [images[key] for key in keys]
+
+
+def iter_render_days(days, renderer=None, template=None):
+    """
+    Like render_days, but yields each day's PNG in order as soon as it is
+    ready. Days are rendered one render-pool batch at a time, so only that
+    many images are held in memory at once.
+    """
+    batch_size = max(1, render_workers())
+    for start in range(0, len(days), batch_size):
+        yield from render_days(days[start:start + batch_size], renderer=renderer, template=template)
+
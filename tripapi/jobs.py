@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PlanTripJob
+from .pipeline import get_plan_driver, run_plan_trip
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    """Thread pool that runs queued plan-trip jobs inside this worker process"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PLAN_JOB_WORKERS', 2),
+                thread_name_prefix='plan-trip-job',
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def submit_plan_job(input_data):
+    """Queue a plan-trip job in the database and start it on the local pool"""
+    job = PlanTripJob.objects.create(input_data=input_data)
+    get_job_executor().submit(run_job, job.id)
+    return job
+
+
+def claim_job(job_id):
+    """
+    Atomically move a queued job to running; returns the claim's attempt
+    number, or None if another worker got it first
+    """
+    now = timezone.now()
+    claimed = PlanTripJob.objects.filter(id=job_id, status=PlanTripJob.QUEUED).update(
+        status=PlanTripJob.RUNNING,
+        started_at=now,
+        heartbeat_at=now,
+        attempts=F('attempts') + 1,
+    )
+    if not claimed:
+        return None
+    return PlanTripJob.objects.values_list('attempts', flat=True).get(id=job_id)
+
+
+def requeue_stale_jobs():
+    """
+    Queue running jobs whose lease expired (no progress for PLAN_JOB_LEASE_SECONDS)
+    again, or fail them once they have used up PLAN_JOB_MAX_ATTEMPTS claims.
+    Returns (requeued, failed) counts.
+    """
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'PLAN_JOB_LEASE_SECONDS', 600))
+    stale = PlanTripJob.objects.filter(status=PlanTripJob.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    max_attempts = getattr(settings, 'PLAN_JOB_MAX_ATTEMPTS', 3)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=PlanTripJob.FAILED,
+        error="The worker running this job stopped responding",
+        finished_at=timezone.now()
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=PlanTripJob.QUEUED, stage='')
+    if requeued or failed:
+        logger.warning("Requeued %d and failed %d plan trip jobs with expired leases", requeued, failed)
+    return requeued, failed
+
+
+def claim_next_job():
+    """
+    Claim the oldest queued job, after requeueing jobs abandoned by dead
+    workers. Returns (job id, attempt), or None when the queue is empty.
+    """
+    requeue_stale_jobs()
+    for job_id in PlanTripJob.objects.filter(status=PlanTripJob.QUEUED).order_by('created_at').values_list('id', flat=True)[:10]:
+        attempt = claim_job(job_id)
+        if attempt is not None:
+            return job_id, attempt
+    return None
+
+
+def run_job(job_id, attempt=None):
+    """
+    Run the plan-trip pipeline for a job, recording stage progress and the
+    result. `attempt` is the claim number from claim_next_job; without it the
+    job is claimed here. Every write is conditional on the claim still being
+    ours, so a job requeued after its lease expired isn't overwritten.
+    """
+    close_old_connections()
+    try:
+        if attempt is None:
+            attempt = claim_job(job_id)
+            if attempt is None:
+                return
+
+        job = PlanTripJob.objects.get(id=job_id)
+        data = job.input_data
+        owned = PlanTripJob.objects.filter(id=job_id, status=PlanTripJob.RUNNING, attempts=attempt)
+
+        def on_stage(stage, stages):
+            # Progress doubles as the heartbeat that keeps the lease
+            owned.update(stage=stage, progress={'stages': stages}, heartbeat_at=timezone.now())
+
+        try:
+            driver = get_plan_driver(data.get('driver_id'))
+            base_url = data.get('base_url', '')
+            result = run_plan_trip(
+                data,
+                driver,
+                absolute_url=lambda path: base_url.rstrip('/') + path,
+                inline_images=data.get('inline_images', False),
+                fields=set(data['fields']) if data.get('fields') else None,
+                expand=set(data['expand']) if data.get('expand') else None,
+                on_stage=on_stage,
+            )
+        except Exception as e:
+            logger.exception("Plan trip job %s failed", job_id)
+            owned.update(
+                status=PlanTripJob.FAILED,
+                error=str(e),
+                finished_at=timezone.now()
+            )
+            return
+
+        owned.update(
+            status=PlanTripJob.SUCCEEDED,
+            stage='',
+            result=result,
+            finished_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
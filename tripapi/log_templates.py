@@ -0,0 +1,84 @@
+import hashlib
+import threading
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+
+class LogTemplate:
+    """
+    A blank driver's daily log decoded once per process.
+    The pixel arrays are read-only and shared by every render; renderers
+    draw on copies. `layout` holds where the duty-status grid sits.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.digest = hashlib.sha256(data).hexdigest()
+
+        image_bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image_bgr is None:
+            raise ValueError(f"Could not decode log template {self.path}")
+        self.image_bgr = _read_only(image_bgr)
+        self.image = _read_only(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB))
+        self.layout = self._compute_layout(*image_bgr.shape[:2])
+
+        self._scaled = {}
+        self._scaled_lock = threading.Lock()
+
+    @staticmethod
+    def _compute_layout(height, width):
+        # Define the log graph area coordinates
+        graph_top = int(height * 0.376)
+        graph_bottom = int(height * 0.47)
+        graph_left = int(width * 0.1265)
+        graph_right = int(width * 0.885)
+        return {
+            'height': height,
+            'width': width,
+            'graph_top': graph_top,
+            'graph_bottom': graph_bottom,
+            'graph_left': graph_left,
+            'graph_right': graph_right,
+            'hour_step': (graph_right - graph_left) / 24,
+            # Duty status levels (approximate pixel positions)
+            'status_levels': {
+                'off_duty': graph_top,
+                'sleeper': graph_top + (graph_bottom - graph_top) * 0.35,
+                'driving': graph_top + (graph_bottom - graph_top) * 0.645,
+                'on_duty': graph_bottom
+            },
+        }
+
+    def scaled_bgr(self, size):
+        """Read-only BGR copy of the template resized to (width, height), cached per size"""
+        with self._scaled_lock:
+            if size not in self._scaled:
+                resized = cv2.resize(self.image_bgr, size, interpolation=cv2.INTER_LINEAR)
+                self._scaled[size] = _read_only(resized)
+            return self._scaled[size]
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_log_template(name=None):
+    """Return the decoded template called `name` (default settings.ELD_LOG_TEMPLATE)"""
+    name = name or getattr(settings, 'ELD_LOG_TEMPLATE', 'default')
+    with _templates_lock:
+        if name not in _templates:
+            paths = getattr(settings, 'ELD_LOG_TEMPLATES', {})
+            if name not in paths:
+                raise ValueError(f"Unknown ELD log template '{name}'")
+            _templates[name] = LogTemplate(name, paths[name])
+        return _templates[name]
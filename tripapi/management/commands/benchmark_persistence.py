@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tripapi.benchmarks import sample_plan_results, summarize, time_calls
+from tripapi.models import Driver, TripPlan
+from tripapi.pipeline import build_eld_logs, build_rest_stops, build_trip_plan, persist_trip_plans
+
+ROUTE_RESULT = {
+    'coordinates': {'current': [-74.0, 40.7], 'pickup': [-87.6, 41.9], 'dropoff': [-104.9, 39.7]},
+    'route_data': {'routes': []},
+    'distance_miles': 1800.0,
+    'duration_hours': 30.0,
+}
+
+
+class Command(BaseCommand):
+    help = ("Measure how the plan-trip persistence stage scales with trip length, "
+            "bulk inserts against one create() per row, and print the results as JSON. "
+            "Rows written by the benchmark are deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, nargs='+', default=[1, 5, 10, 20, 40],
+                            help="Trip lengths in days to benchmark")
+        parser.add_argument('--repeat', type=int, default=10, help="Timed writes per trip length")
+
+    def handle(self, *args, **options):
+        driver, _ = Driver.objects.get_or_create(
+            name="Benchmark Driver",
+            defaults={'license_number': 'BENCH', 'carrier_name': 'Benchmark', 'home_terminal': 'Benchmark'}
+        )
+        data = {
+            'current_location': 'Benchmark origin',
+            'pickup_location': 'Benchmark pickup',
+            'dropoff_location': 'Benchmark dropoff',
+            'current_cycle_used': 0,
+        }
+
+        def bulk(rest_stops_result, eld_logs_result):
+            trip_plan = build_trip_plan(driver, data, ROUTE_RESULT)
+            persist_trip_plans([(
+                trip_plan,
+                build_rest_stops(trip_plan, rest_stops_result),
+                build_eld_logs(trip_plan, eld_logs_result),
+            )])
+
+        def per_row(rest_stops_result, eld_logs_result):
+            # The previous write path: autocommit create() per row
+            trip_plan = build_trip_plan(driver, data, ROUTE_RESULT)
+            trip_plan.save()
+            for obj in build_rest_stops(trip_plan, rest_stops_result) + build_eld_logs(trip_plan, eld_logs_result):
+                obj.save()
+
+        results = {}
+        try:
+            for days in options['days']:
+                rest_stops_result, eld_logs_result = sample_plan_results(days)
+                results[days] = {'rows': 1 + len(rest_stops_result['rest_stops']) + len(eld_logs_result)}
+                for name, write in (('bulk', bulk), ('per_row', per_row)):
+                    results[days][name] = summarize(time_calls(
+                        lambda: write(rest_stops_result, eld_logs_result), options['repeat']
+                    ))
+        finally:
+            TripPlan.objects.filter(driver=driver).delete()
+            driver.delete()
+
+        self.stdout.write(json.dumps({'database': connection.vendor, 'persist_by_days': results}, indent=2))
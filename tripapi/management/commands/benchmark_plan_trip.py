@@ -0,0 +1,287 @@
+import json
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from tripapi.benchmarks import compare_results, peak_rss_mb, summarize, time_calls
+from tripapi.caches import get_route_cache
+from tripapi.geocoding import normalize_address
+from tripapi.mock_ors import MockORS, start_in_thread
+from tripapi.models import Driver, GeocodeCacheEntry, TripPlan
+from tripapi.ors import ORSClient, use_ors_client
+from tripapi.pipeline import save_plan
+from tripapi.services import TripPlannerService
+from tripapi.views import plan_trip
+
+# (lon, lat) the ORS stand-in answers for each corpus address
+PLACES = {
+    'New York, NY': (-74.006, 40.7128),
+    'Chicago, IL': (-87.6298, 41.8781),
+    'Los Angeles, CA': (-118.2437, 34.0522),
+    'St. Louis, MO': (-90.1994, 38.627),
+    'Kansas City, MO': (-94.5786, 39.0997),
+    'Dallas, TX': (-96.797, 32.7767),
+    'Fort Worth, TX': (-97.3308, 32.7555),
+    'Austin, TX': (-97.7431, 30.2672),
+}
+
+# About 280, 610 and 2950 road miles with the stand-in's road factor
+TRIPS = {
+    'short': ('Dallas, TX', 'Fort Worth, TX', 'Austin, TX'),
+    'medium': ('Chicago, IL', 'St. Louis, MO', 'Kansas City, MO'),
+    'cross_country': ('New York, NY', 'Chicago, IL', 'Los Angeles, CA'),
+}
+
+# Stage runs depart at this hour today so trip shapes don't depend on when the benchmark runs
+DEPARTURE_HOUR = 8
+
+STAGES = ('calculate_route', 'plan_rest_stops', 'generate_eld_logs', 'generate_eld_drawing_data',
+          'draw_eld_lines', 'persistence', 'plan_trip')
+
+
+def git_commit():
+    """(commit hash, working tree has uncommitted changes) of the checkout, or (None, None)"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the plan-trip pipeline end to end and stage by stage on short, medium and "
+            "cross-country trips against a local ORS stand-in, then measure plan_trip throughput at "
+            "each concurrency level. Prints p50/p95/p99 latency, database query counts and peak RSS "
+            "as JSON tagged with the git commit; --compare flags regressions against an earlier report. "
+            "The benchmark plans trips for a driver it creates and deletes that driver's rows afterwards; "
+            "geocode cache entries for the corpus addresses are put back as they were.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trip', action='append', choices=sorted(TRIPS),
+                            help="Trip to benchmark (repeatable, default: all)")
+        parser.add_argument('--repeat', type=int, default=10, help="Timed runs per stage and trip")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                            help="Concurrent plan_trip clients to measure throughput at")
+        parser.add_argument('--requests', type=int, default=32, help="plan_trip requests per concurrency level")
+        parser.add_argument('--latency', type=float, default=0.05, help="Seconds the ORS stand-in waits per request")
+        parser.add_argument('--jitter', type=float, default=0.0, help="Extra random ORS delay of up to this many seconds")
+        parser.add_argument('--ors-url', help="Use an ORS stand-in already running here (see run_mock_ors) "
+                                              "instead of starting one")
+        parser.add_argument('--warm', action='store_true',
+                            help="Keep geocode and route caches between runs (default: every run misses them)")
+        parser.add_argument('--output', help="Also write the JSON report to this file")
+        parser.add_argument('--compare', help="Earlier JSON report to compare against")
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help="Percent p95 slowdown that counts as a regression")
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help="Smallest p95 slowdown in milliseconds that counts as a regression")
+
+    def handle(self, *args, **options):
+        server = None
+        mock = None
+        ors_url = options['ors_url']
+        if not ors_url:
+            mock = MockORS(latency=options['latency'], jitter=options['jitter'], places=PLACES, seed=0)
+            server, ors_url = start_in_thread(mock)
+
+        # A driver of its own, so cleaning up can't touch anyone else's plans
+        marker = f"BENCH-{uuid.uuid4().hex[:12]}"
+        driver = Driver.objects.create(
+            name=f"Benchmark Driver {marker}", license_number=marker,
+            carrier_name='Benchmark', home_terminal='Benchmark'
+        )
+        addresses = [normalize_address(address) for address in PLACES]
+        # Real cached geocodes for the corpus addresses, restored once the stand-in's answers are gone
+        saved_geocodes = list(GeocodeCacheEntry.objects.filter(query__in=addresses))
+
+        def reset_caches():
+            if not options['warm']:
+                GeocodeCacheEntry.objects.filter(query__in=addresses).delete()
+                get_route_cache().clear()
+
+        client = ORSClient(base_url=ors_url)
+        try:
+            with use_ors_client(client):
+                trips = {
+                    name: self.benchmark_trip(TRIPS[name], driver, options['repeat'], reset_caches)
+                    for name in options['trip'] or TRIPS
+                }
+                concurrency = {
+                    str(clients): self.benchmark_concurrency(clients, options['requests'], driver, reset_caches)
+                    for clients in options['concurrency']
+                }
+        finally:
+            client.close()
+            if server:
+                server.shutdown()
+                server.server_close()
+            TripPlan.objects.filter(driver=driver).delete()
+            driver.delete()
+            GeocodeCacheEntry.objects.filter(query__in=addresses).delete()
+            GeocodeCacheEntry.objects.bulk_create(saved_geocodes)
+
+        commit, dirty = git_commit()
+        report = {
+            'commit': commit,
+            'dirty': dirty,
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': sys.version.split()[0],
+            'ors': {
+                'url': ors_url,
+                'latency_s': options['latency'] if mock else None,
+                'requests': mock.requests if mock else None,
+            },
+            'caches': 'warm' if options['warm'] else 'cold',
+            'trips': trips,
+            'concurrency': concurrency,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+        regressions = []
+        if options['compare']:
+            baseline = json.loads(Path(options['compare']).read_text())
+            rows = compare_results(baseline, report, options['threshold'], options['min_delta_ms'])
+            regressions = [row for row in rows if row['regressed']]
+            report['comparison'] = {
+                'baseline_commit': baseline.get('commit'),
+                'threshold_pct': options['threshold'],
+                'min_delta_ms': options['min_delta_ms'],
+                'sections': rows,
+            }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output + '\n')
+        self.stdout.write(output)
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark sections regressed: "
+                               + ', '.join(row['section'] for row in regressions))
+
+    def benchmark_trip(self, addresses, driver, repeat, reset_caches):
+        """Time each pipeline stage on one trip, then the whole plan_trip request"""
+        current_location, pickup_location, dropoff_location = addresses
+        data = {
+            'current_location': current_location,
+            'pickup_location': pickup_location,
+            'dropoff_location': dropoff_location,
+            'current_cycle_used': 20,
+        }
+        trip_planner = TripPlannerService()
+        departure_time = trip_planner.default_departure_time().replace(hour=DEPARTURE_HOUR)
+
+        def calculate_route():
+            # A new service each run so the per-request geocode memo starts empty
+            return TripPlannerService().calculate_route(current_location, pickup_location, dropoff_location)
+
+        # Each stage runs on the output of the one before it
+        reset_caches()
+        route_result = calculate_route()
+        coordinates = route_result['coordinates']
+
+        def plan_rest_stops():
+            return trip_planner.plan_rest_stops(
+                route_result,
+                data['current_cycle_used'],
+                current_location_coordinates=coordinates['current'],
+                pickup_location_coordinates=coordinates['pickup'],
+                dropoff_location_coordinates=coordinates['dropoff'],
+                departure_time=departure_time,
+            )
+
+        rest_stops_result = plan_rest_stops()
+        eld_logs_result = trip_planner.generate_eld_logs(route_result, rest_stops_result, data['current_cycle_used'])
+        drawing_data = trip_planner.generate_eld_drawing_data(eld_logs_result)
+
+        stages = {
+            'calculate_route': (calculate_route, reset_caches),
+            'plan_rest_stops': (plan_rest_stops, None),
+            'generate_eld_logs': (lambda: trip_planner.generate_eld_logs(
+                route_result, rest_stops_result, data['current_cycle_used']), None),
+            'generate_eld_drawing_data': (lambda: trip_planner.generate_eld_drawing_data(eld_logs_result), None),
+            'draw_eld_lines': (lambda: [trip_planner.draw_eld_lines(day['entries']) for day in drawing_data], None),
+            'persistence': (lambda: save_plan(driver, data, route_result, rest_stops_result, eld_logs_result,
+                                              lambda path: path), None),
+            'plan_trip': (lambda: self.post_plan_trip({**data, 'driver_id': driver.id}), reset_caches),
+        }
+        results = {}
+        for name in STAGES:
+            fn, setup = stages[name]
+            results[name] = summarize(time_calls(fn, repeat, setup=setup))
+            if setup:
+                setup()
+            with CaptureQueriesContext(connection) as queries:
+                response = fn()
+            if name == 'plan_trip' and response.status_code != 201:
+                raise CommandError(f"plan_trip failed with {response.status_code}: {response.data}")
+            results[name]['queries'] = len(queries)
+
+        return {
+            'distance_miles': round(route_result['distance_miles'], 1),
+            'days': len(eld_logs_result),
+            'rest_stops': len(rest_stops_result['rest_stops']),
+            'stages': results,
+        }
+
+    def benchmark_concurrency(self, clients, requests, driver, reset_caches):
+        """Send `requests` plan_trip requests from `clients` threads, cycling through the corpus"""
+        payloads = []
+        for i in range(requests):
+            current_location, pickup_location, dropoff_location = list(TRIPS.values())[i % len(TRIPS)]
+            payloads.append({
+                'current_location': current_location,
+                'pickup_location': pickup_location,
+                'dropoff_location': dropoff_location,
+                'current_cycle_used': 20,
+                'driver_id': driver.id,
+            })
+
+        def send(payload):
+            start = time.perf_counter()
+            try:
+                response = self.post_plan_trip(payload)
+                error = None if response.status_code == 201 else response.data.get('error', response.status_code)
+            except Exception as e:
+                error = str(e)
+            finally:
+                close_old_connections()
+            return time.perf_counter() - start, error
+
+        reset_caches()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            outcomes = list(pool.map(send, payloads))
+        wall = time.perf_counter() - start
+
+        succeeded = [duration for duration, error in outcomes if error is None]
+        return {
+            **summarize(succeeded),
+            'requests': requests,
+            'errors': requests - len(succeeded),
+            'error_messages': dict(Counter(str(error) for _, error in outcomes if error is not None)),
+            'wall_s': round(wall, 3),
+            'throughput_rps': round(len(succeeded) / wall, 2) if wall else 0.0,
+        }
+
+    @staticmethod
+    def post_plan_trip(payload):
+        """Call the plan_trip view like a client would and return the rendered response"""
+        request = APIRequestFactory().post('/api/plan-trip/', payload, format='json', SERVER_NAME='localhost')
+        response = plan_trip(request)
+        response.render()
+        return response
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from tripapi.benchmarks import sample_day_entries, summarize, time_calls
+from tripapi.rendering import RENDERERS, get_renderer
+
+
+class Command(BaseCommand):
+    help = "Measure per-day ELD log render time for each renderer and print the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Timed renders per renderer")
+        parser.add_argument('--renderer', action='append', choices=sorted(RENDERERS),
+                            help="Renderer to benchmark (repeatable, default: all)")
+
+    def handle(self, *args, **options):
+        entries = sample_day_entries()
+        results = {}
+        for name in options['renderer'] or sorted(RENDERERS):
+            renderer = get_renderer(name)
+            results[name] = summarize(time_calls(lambda: renderer.render(entries), options['repeat']))
+            results[name]['png_bytes'] = len(renderer.render(entries))
+
+        self.stdout.write(json.dumps({'per_day_render': results}, indent=2))
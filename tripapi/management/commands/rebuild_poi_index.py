@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tripapi.poi import get_poi_index, load_pois
+
+
+class Command(BaseCommand):
+    help = (
+        "Load fuel stations, rest areas and truck stops from a CSV/GeoJSON file "
+        "into the PointOfInterest table and rebuild the spatial index. Running "
+        "workers pick up the new data after a restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(settings.POI_DATA_FILE), help="CSV or GeoJSON file to load")
+        parser.add_argument('--append', action='store_true', help="Keep existing POIs instead of replacing them")
+
+    def handle(self, *args, **options):
+        try:
+            count = load_pois(options['path'], replace=not options['append'])
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f"Failed to load {options['path']}: {e}")
+
+        if not count:
+            self.stderr.write(self.style.WARNING(
+                f"{options['path']} has no POIs; stops will fall back to ORS searches (see POI_REMOTE_FALLBACK)"
+            ))
+
+        start = time.perf_counter()
+        index = get_poi_index()
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {count} POIs; index holds {len(index)} points in {len(index.cells)} cells (built in {elapsed:.1f} ms)"
+        ))
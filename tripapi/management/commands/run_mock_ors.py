@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tripapi.mock_ors import MODES, MockORS, make_server
+
+DEFAULT_UPSTREAM = 'https://api.openrouteservice.org'
+
+
+class Command(BaseCommand):
+    help = ("Serve a local stand-in for the OpenRouteService API. Point the app at it "
+            "with ORS_BASE_URL=http://<host>:<port>. Responses are synthetic, recorded "
+            "from the real API into fixtures, or replayed from those fixtures, with "
+            "optional injected latency and errors.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--mode', choices=MODES, default='synthetic')
+        parser.add_argument('--fixtures', default=str(settings.BASE_DIR / 'tripapi' / 'fixtures' / 'ors'),
+                            help="Directory record mode writes to and replay mode reads from")
+        parser.add_argument('--upstream', default=DEFAULT_UPSTREAM, help="API that record mode forwards to")
+        parser.add_argument('--api-key', default=None,
+                            help="Key record mode sends upstream (default: the one the client sent)")
+        parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+        parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many more seconds, at random")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail")
+        parser.add_argument('--error-status', type=int, default=503, help="Status of injected failures")
+        parser.add_argument('--points-per-mile', type=float, default=5,
+                            help="Density of synthetic route geometry")
+        parser.add_argument('--seed', type=int, default=None, help="Seed for latency jitter and failures")
+
+    def handle(self, *args, **options):
+        mock = MockORS(
+            mode=options['mode'],
+            fixtures_dir=options['fixtures'],
+            upstream=options['upstream'],
+            api_key=options['api_key'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            points_per_mile=options['points_per_mile'],
+            seed=options['seed'],
+        )
+        server = make_server(mock, options['host'], options['port'])
+        host, port = server.server_address[:2]
+        self.stdout.write(f"Mock ORS ({options['mode']}) listening on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tripapi.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued plan-trip jobs from the database. Use this as a separate "
+        "worker process, or to pick up jobs left queued by a restarted web worker. "
+        "Running jobs whose worker died are queued again once their lease expires."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds between polls of an empty queue")
+
+    def handle(self, *args, **options):
+        while True:
+            claimed = claim_next_job()
+            if claimed is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            job_id, attempt = claimed
+            self.stdout.write(f"Running plan trip job {job_id} (attempt {attempt})")
+            run_job(job_id, attempt=attempt)
@@ -0,0 +1,231 @@
+import contextvars
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from .caches import all_cache_stats
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Metric families exported at /api/metrics/: name -> (type, help)
+METRICS = {
+    'tripapi_http_requests_total': ('counter', "HTTP requests handled, by view, method and status"),
+    'tripapi_http_request_duration_seconds': ('summary', "Time spent handling HTTP requests, by view"),
+    'tripapi_span_duration_seconds': ('summary', "Time spent in each instrumented stage"),
+    'tripapi_ors_requests_total': ('counter', "OpenRouteService requests, by endpoint and status"),
+    'tripapi_ors_request_duration_seconds': ('summary', "OpenRouteService response time, retries included"),
+    'tripapi_db_queries_total': ('counter', "Database queries run"),
+    'tripapi_db_query_duration_seconds': ('summary', "Time spent running database queries"),
+    'tripapi_renders_total': ('counter', "ELD log days rendered (image cache misses), by renderer"),
+    'tripapi_cache_requests_total': ('counter', "Cache lookups, by cache and result"),
+    'tripapi_cache_events_total': ('counter', "Other cache events (evictions, expiries, ...), by cache"),
+}
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and summaries (count and sum) for this worker
+    process, rendered in the Prometheus text format. Like the cache stats,
+    each worker keeps its own numbers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}  # (family, suffix, labels) -> value
+
+    def incr(self, name, amount=1, **labels):
+        key = (name, '', tuple(sorted(labels.items())))
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        labels = tuple(sorted(labels.items()))
+        with self._lock:
+            self._samples[(name, '_count', labels)] = self._samples.get((name, '_count', labels), 0) + 1
+            self._samples[(name, '_sum', labels)] = self._samples.get((name, '_sum', labels), 0.0) + seconds
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+
+    def samples(self):
+        with self._lock:
+            return dict(self._samples)
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry"""
+    return _registry
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _cache_samples():
+    """Cache stats from the caches registry as metric samples"""
+    samples = {}
+    for cache, stats in all_cache_stats().items():
+        for counter, value in stats.items():
+            if counter in ('hits', 'misses'):
+                labels = (('cache', cache), ('result', counter[:-1] if counter == 'hits' else 'miss'))
+                samples[('tripapi_cache_requests_total', '', labels)] = value
+            elif counter != 'hit_rate':
+                samples[('tripapi_cache_events_total', '', (('cache', cache), ('event', counter)))] = value
+    return samples
+
+
+def prometheus_text():
+    """All metrics, cache stats included, in the Prometheus text exposition format"""
+    samples = {**get_metrics().samples(), **_cache_samples()}
+    families = {}
+    for (name, suffix, labels), value in samples.items():
+        families.setdefault(name, []).append((suffix, labels, value))
+
+    lines = []
+    for name in sorted(families):
+        metric_type, help_text = METRICS.get(name, ('untyped', ''))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for suffix, labels, value in sorted(families[name], key=lambda sample: (sample[1], sample[0])):
+            label_text = ','.join(f'{key}="{_label_value(label)}"' for key, label in labels)
+            lines.append(f"{name}{suffix}{{{label_text}}} {value}" if label_text else f"{name}{suffix} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class Timings:
+    """Time spent per span while handling one request, for Server-Timing and the request log"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}  # name -> [count, seconds]
+
+    def add(self, name, seconds):
+        with self._lock:
+            entry = self._spans.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {name: {'count': count, 'ms': round(seconds * 1000, 1)} for name, (count, seconds) in self._spans.items()}
+
+    def server_timing(self):
+        """Server-Timing header value: one entry per span with its total duration and call count"""
+        return ', '.join(
+            f'{name};dur={entry["ms"]};desc="{entry["count"]}x"' for name, entry in self.as_dict().items()
+        )
+
+
+_timings = contextvars.ContextVar('tripapi_timings', default=None)
+
+
+def current_timings():
+    """Timings of the request being handled, or None outside a request"""
+    return _timings.get()
+
+
+def start_timings():
+    """Collect spans into a new Timings until stop_timings(token) is called"""
+    timings = Timings()
+    return timings, _timings.set(timings)
+
+
+def stop_timings(token):
+    _timings.reset(token)
+
+
+def in_request_context(func):
+    """
+    Wrap func so spans it records on another thread (e.g. in a thread pool)
+    count towards the current request
+    """
+    timings = _timings.get()
+    if timings is None:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _timings.set(timings)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _timings.reset(token)
+    return wrapper
+
+
+def record_span(name, seconds, family=None, **labels):
+    """
+    Add `seconds` to the current request's `name` span and observe it in
+    `family` (default tripapi_span_duration_seconds, labelled with the span)
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+    if family is None:
+        family, labels = 'tripapi_span_duration_seconds', {'span': name}
+    get_metrics().observe(family, seconds, **labels)
+
+
+class span:
+    """
+    Time a block, or every call of a (sync or async) function when used as a
+    decorator, as the span `name`: the duration goes to the current request's
+    Server-Timing header and to tripapi_span_duration_seconds.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_span(self.name, time.perf_counter() - self._started)
+
+    def __call__(self, func):
+        name = self.name
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return func(*args, **kwargs)
+        return wrapper
+
+
+def record_ors_request(endpoint, status, seconds):
+    """Count one OpenRouteService call; status is the HTTP status or 'error'"""
+    get_metrics().incr('tripapi_ors_requests_total', endpoint=endpoint, status=status)
+    record_span(f'ors.{endpoint}', seconds, family='tripapi_ors_request_duration_seconds', endpoint=endpoint)
+
+
+def record_renders(renderer, count):
+    get_metrics().incr('tripapi_renders_total', count, renderer=renderer)
+
+
+def time_query(execute, sql, params, many, context):
+    """Database execute wrapper counting every query (see TripapiConfig.ready)"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        get_metrics().incr('tripapi_db_queries_total')
+        record_span('db', time.perf_counter() - started, family='tripapi_db_query_duration_seconds')
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver that adds time_query to each new connection"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
@@ -0,0 +1,74 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import get_metrics, start_timings, stop_timings
+
+logger = logging.getLogger('tripapi.requests')
+
+
+class ServerTimingMiddleware:
+    """
+    Time every request and the spans recorded while handling it (ORS calls,
+    database queries, pipeline stages, renders). The spans are sent back in a
+    Server-Timing header, logged with the request, and the request is counted
+    in the /api/metrics/ totals. For a streaming response the header only
+    covers the work done before the first byte.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = start_timings()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_timings(token)
+        self.finish(request, response, timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timings, token = start_timings()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_timings(token)
+        self.finish(request, response, timings, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def finish(request, response, timings, seconds):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        metrics = get_metrics()
+        metrics.incr('tripapi_http_requests_total', view=view, method=request.method, status=response.status_code)
+        metrics.observe('tripapi_http_request_duration_seconds', seconds, view=view)
+
+        server_timing = timings.server_timing()
+        total = f'total;dur={round(seconds * 1000, 1)}'
+        response['Server-Timing'] = f'{server_timing}, {total}' if server_timing else total
+
+        spans = timings.as_dict()
+        logger.info(
+            "%s %s %s %.1fms %s", request.method, request.path, response.status_code, seconds * 1000,
+            ' '.join(f"{name}={span['ms']}ms/{span['count']}" for name, span in spans.items()),
+            extra={
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(seconds * 1000, 1),
+                'spans': spans,
+            },
+        )
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-16 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripapi', '0005_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointOfInterest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=200)),
+                ('category', models.CharField(choices=[('fuel', 'Fuel station'), ('rest_area', 'Rest area'), ('truck_stop', 'Truck stop')], db_index=True, max_length=20)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('address', models.CharField(blank=True, max_length=255)),
+                ('source', models.CharField(blank=True, help_text='Dataset the row was loaded from', max_length=100)),
+            ],
+        ),
+    ]
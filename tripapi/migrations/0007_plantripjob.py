@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-16 22:36
+
+import django.core.serializers.json
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripapi', '0006_pointofinterest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanTripJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], db_index=True, default='queued', max_length=20)),
+                ('stage', models.CharField(blank=True, help_text='Pipeline stage currently running', max_length=50)),
+                ('progress', models.JSONField(default=dict, help_text='Status and duration of each pipeline stage')),
+                ('input_data', models.JSONField(help_text='Validated plan-trip input')),
+                ('result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
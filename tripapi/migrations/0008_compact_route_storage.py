@@ -0,0 +1,132 @@
+# Generated by Django 5.1.7 on 2026-10-16 22:44
+
+import json
+import zlib
+
+from django.db import migrations, models
+
+ROUTE_COLUMNS = ('route_geometry', 'route_distance', 'route_duration', 'route_bbox', 'route_way_points', 'route_details')
+BATCH_SIZE = 100
+
+
+# A frozen copy of tripapi.route_storage as of this migration, so later
+# changes to that module don't change what this migration does
+
+
+def pack_route_data(route_data):
+    columns = dict.fromkeys(ROUTE_COLUMNS)
+    if route_data is None:
+        return columns
+
+    details = json.loads(json.dumps(route_data))
+    routes = details.get('routes') if isinstance(details, dict) else None
+    if routes and isinstance(routes[0], dict):
+        route = routes[0]
+        if isinstance(route.get('geometry'), str):
+            columns['route_geometry'] = route['geometry']
+            route['geometry'] = None
+        for key in ('bbox', 'way_points'):
+            if route.get(key) is not None:
+                columns[f'route_{key}'] = route[key]
+                route[key] = None
+        summary = route.get('summary')
+        if isinstance(summary, dict):
+            for key in ('distance', 'duration'):
+                if isinstance(summary.get(key), (int, float)):
+                    columns[f'route_{key}'] = summary[key]
+                    summary[key] = None
+
+    columns['route_details'] = zlib.compress(json.dumps(details, separators=(',', ':')).encode('utf-8'), 6)
+    return columns
+
+
+def unpack_route_data(route_details, route_geometry=None, route_distance=None, route_duration=None,
+                      route_bbox=None, route_way_points=None):
+    if route_details is None:
+        return None
+
+    route_data = json.loads(zlib.decompress(bytes(route_details)).decode('utf-8'))
+    routes = route_data.get('routes') if isinstance(route_data, dict) else None
+    if routes and isinstance(routes[0], dict):
+        route = routes[0]
+        for key, value in (('geometry', route_geometry), ('bbox', route_bbox), ('way_points', route_way_points)):
+            if key in route and route[key] is None:
+                route[key] = value
+        summary = route.get('summary')
+        if isinstance(summary, dict):
+            for key, value in (('distance', route_distance), ('duration', route_duration)):
+                if key in summary and summary[key] is None:
+                    summary[key] = value
+    return route_data
+
+
+def pack_routes(apps, schema_editor):
+    TripPlan = apps.get_model('tripapi', 'TripPlan')
+    batch = []
+    for trip_plan in TripPlan.objects.only('id', 'route_data').iterator(chunk_size=BATCH_SIZE):
+        for name, value in pack_route_data(trip_plan.route_data).items():
+            setattr(trip_plan, name, value)
+        batch.append(trip_plan)
+        if len(batch) >= BATCH_SIZE:
+            TripPlan.objects.bulk_update(batch, ROUTE_COLUMNS)
+            batch = []
+    if batch:
+        TripPlan.objects.bulk_update(batch, ROUTE_COLUMNS)
+
+
+def unpack_routes(apps, schema_editor):
+    TripPlan = apps.get_model('tripapi', 'TripPlan')
+    batch = []
+    for trip_plan in TripPlan.objects.only('id', *ROUTE_COLUMNS).iterator(chunk_size=BATCH_SIZE):
+        trip_plan.route_data = unpack_route_data(**{name: getattr(trip_plan, name) for name in ROUTE_COLUMNS})
+        batch.append(trip_plan)
+        if len(batch) >= BATCH_SIZE:
+            TripPlan.objects.bulk_update(batch, ['route_data'])
+            batch = []
+    if batch:
+        TripPlan.objects.bulk_update(batch, ['route_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripapi', '0007_plantripjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tripplan',
+            name='route_bbox',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tripplan',
+            name='route_details',
+            field=models.BinaryField(blank=True, help_text='zlib-compressed JSON of the rest of the response', null=True),
+        ),
+        migrations.AddField(
+            model_name='tripplan',
+            name='route_geometry',
+            field=models.TextField(blank=True, help_text='Encoded polyline of the route', null=True),
+        ),
+        migrations.AddField(
+            model_name='tripplan',
+            name='route_distance',
+            field=models.FloatField(blank=True, help_text='Route distance in meters', null=True),
+        ),
+        migrations.AddField(
+            model_name='tripplan',
+            name='route_duration',
+            field=models.FloatField(blank=True, help_text='Route duration in seconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='tripplan',
+            name='route_way_points',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_routes, unpack_routes),
+        migrations.RemoveField(
+            model_name='tripplan',
+            name='route_data',
+        ),
+    ]
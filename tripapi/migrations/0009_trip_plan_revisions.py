@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-16 22:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripapi', '0008_compact_route_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reststop',
+            name='mile_marker',
+            field=models.FloatField(blank=True, help_text='Miles from the start of the trip', null=True),
+        ),
+        migrations.AddField(
+            model_name='tripplan',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='tripapi.tripplan'),
+        ),
+        migrations.AddField(
+            model_name='tripplan',
+            name='revision',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripapi', '0009_trip_plan_revisions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plantripjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, help_text='Times a worker has claimed the job'),
+        ),
+        migrations.AddField(
+            model_name='plantripjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life from the worker running it', null=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_lineages(apps, schema_editor):
+    """
+    Point every revision at the original plan of its lineage and renumber
+    revisions that were saved with a duplicate number, oldest first.
+    """
+    TripPlan = apps.get_model('tripapi', 'TripPlan')
+    parents = dict(TripPlan.objects.values_list('id', 'parent_id'))
+
+    def find_root(plan_id):
+        seen = set()
+        while parents.get(plan_id) is not None and plan_id not in seen:
+            seen.add(plan_id)
+            plan_id = parents[plan_id]
+        return plan_id
+
+    lineages = {}
+    for plan_id in parents:
+        if parents[plan_id] is not None:
+            lineages.setdefault(find_root(plan_id), []).append(plan_id)
+    for root_id, plan_ids in lineages.items():
+        used = {TripPlan.objects.get(id=root_id).revision}
+        for plan in TripPlan.objects.filter(id__in=plan_ids).order_by('revision', 'created_at', 'id'):
+            if plan.revision in used:
+                plan.revision = max(used) + 1
+            used.add(plan.revision)
+            plan.root_id = root_id
+            plan.save(update_fields=['root', 'revision'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tripapi', '0010_plantripjob_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tripplan',
+            name='root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lineage', to='tripapi.tripplan'),
+        ),
+        migrations.RunPython(link_lineages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tripplan',
+            constraint=models.UniqueConstraint(fields=('root', 'revision'), name='unique_revision_per_lineage'),
+        ),
+    ]
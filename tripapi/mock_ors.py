@@ -0,0 +1,280 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import requests
+
+from .geometry import encode_polyline, haversine_miles
+
+METERS_PER_MILE = 1609.34
+ROAD_FACTOR = 1.2          # Road distance over straight-line distance
+SYNTHETIC_SPEED_MPH = 55
+STEP_MILES = 25            # One turn-by-turn step per this many miles
+
+# Continental US, where synthetic addresses are placed
+US_BOUNDS = (-124.0, 25.0, -70.0, 49.0)
+
+MODES = ('synthetic', 'record', 'replay')
+
+
+class MockORS:
+    """
+    Stand-in for the parts of the OpenRouteService API TripPlannerService
+    uses: GET /geocode/search and POST /v2/directions/<profile>.
+
+    - synthetic: answers every request locally. Addresses hash to a fixed
+      point in the continental US (or to its entry in `places`, a mapping of
+      lowercased address to (lon, lat)), POI searches land near their focus
+      point, and routes follow the straight lines between the waypoints.
+    - record: forwards requests to `upstream` and saves each response as a
+      fixture in `fixtures_dir`.
+    - replay: answers from the saved fixtures only, with a 404 for a request
+      that was never recorded.
+
+    Every response can be delayed by `latency` seconds plus up to `jitter`,
+    and a fraction `error_rate` of requests fail with `error_status`.
+    """
+
+    def __init__(self, mode='synthetic', fixtures_dir=None, upstream=None, api_key=None, latency=0.0,
+                 jitter=0.0, error_rate=0.0, error_status=503, points_per_mile=5, seed=None, places=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r}")
+        if mode in ('record', 'replay') and not fixtures_dir:
+            raise ValueError(f"{mode} mode needs a fixtures directory")
+        if mode == 'record' and not upstream:
+            raise ValueError("record mode needs an upstream URL")
+        self.mode = mode
+        self.fixtures_dir = Path(fixtures_dir) if fixtures_dir else None
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.api_key = api_key
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.points_per_mile = points_per_mile
+        self.places = {name.strip().lower(): point for name, point in (places or {}).items()}
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.requests = 0
+
+    def handle(self, method, path, query, body, headers=None):
+        """
+        Answer one request; `query` is a list of (name, value) pairs and `body`
+        the decoded JSON body or None. Returns (status, JSON-serializable body).
+        """
+        with self._random_lock:
+            self.requests += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return self.error_status, {'error': {'code': self.error_status, 'message': "Injected failure"}}
+
+        if self.mode == 'replay':
+            fixture = self.read_fixture(method, path, query, body)
+            if fixture is None:
+                return 404, {'error': {'message': f"No fixture recorded for {method} {path}"}}
+            return fixture['status'], fixture['body']
+        if self.mode == 'record':
+            return self.record(method, path, query, body, headers or {})
+
+        if method == 'GET' and path == '/geocode/search':
+            return 200, self.geocode(query)
+        if method == 'POST' and path.startswith('/v2/directions/'):
+            if len((body or {}).get('coordinates') or []) < 2:
+                return 400, {'error': {'code': 2003, 'message': "At least two coordinates are required"}}
+            return 200, self.directions(path.rsplit('/', 1)[-1], body)
+        return 404, {'error': {'message': f"Unsupported endpoint {method} {path}"}}
+
+    # Record / replay
+
+    @staticmethod
+    def fixture_key(method, path, query, body):
+        """Fixture name for a request; the API key is left out so fixtures can be shared"""
+        query = sorted((name, value) for name, value in query if name != 'api_key')
+        payload = json.dumps([method, path, query, body], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def fixture_path(self, method, path, query, body):
+        return self.fixtures_dir / f"{self.fixture_key(method, path, query, body)}.json"
+
+    def read_fixture(self, method, path, query, body):
+        try:
+            return json.loads(self.fixture_path(method, path, query, body).read_text())
+        except FileNotFoundError:
+            return None
+
+    def record(self, method, path, query, body, headers):
+        # The client's credentials are passed on unless an API key was configured
+        params = list(query)
+        upstream_headers = {'Authorization': headers.get('Authorization', '')}
+        if self.api_key:
+            params = [(name, self.api_key if name == 'api_key' else value) for name, value in params]
+            upstream_headers['Authorization'] = self.api_key
+        response = requests.request(method, f"{self.upstream}{path}", params=params, json=body,
+                                    headers=upstream_headers, timeout=120)
+        try:
+            response_body = response.json()
+        except ValueError:
+            response_body = {'error': {'message': response.text}}
+
+        if response.status_code == 200:
+            self.fixtures_dir.mkdir(parents=True, exist_ok=True)
+            self.fixture_path(method, path, query, body).write_text(json.dumps({
+                'request': {
+                    'method': method,
+                    'path': path,
+                    'query': sorted((name, value) for name, value in query if name != 'api_key'),
+                    'body': body,
+                },
+                'status': response.status_code,
+                'body': response_body,
+            }))
+        return response.status_code, response_body
+
+    # Synthetic responses
+
+    @staticmethod
+    def _unit_hash(text):
+        """Two numbers in [0, 1) derived from `text`"""
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') / 2 ** 64, int.from_bytes(digest[8:16], 'big') / 2 ** 64
+
+    def geocode(self, query):
+        params = dict(query)
+        text = params.get('text', '')
+        u, v = self._unit_hash(text.strip().lower())
+        if 'focus.point.lon' in params and 'focus.point.lat' in params:
+            # POI search: a match within about 3 miles of the focus point
+            lon = float(params['focus.point.lon']) + (u - 0.5) * 0.08
+            lat = float(params['focus.point.lat']) + (v - 0.5) * 0.08
+        elif text.strip().lower() in self.places:
+            lon, lat = self.places[text.strip().lower()]
+        else:
+            min_lon, min_lat, max_lon, max_lat = US_BOUNDS
+            lon = min_lon + u * (max_lon - min_lon)
+            lat = min_lat + v * (max_lat - min_lat)
+        lon, lat = round(lon, 6), round(lat, 6)
+        return {
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                'properties': {'label': text, 'confidence': 1, 'source': 'mock'},
+            }],
+            'geocoding': {'query': {'text': text, 'size': int(params.get('size', 10))}},
+        }
+
+    def directions(self, profile, payload):
+        waypoints = np.asarray(payload.get('coordinates') or [], dtype=float)[:, :2]
+        legs = []
+        for start, end in zip(waypoints[:-1], waypoints[1:]):
+            miles = float(haversine_miles(start[0], start[1], end[0], end[1])) * ROAD_FACTOR
+            count = max(2, int(miles * self.points_per_mile) + 1)
+            fractions = np.linspace(0.0, 1.0, count)[:, None]
+            legs.append((miles, start + (end - start) * fractions))
+
+        points = [legs[0][1][0]]
+        way_points = [0]
+        segments = []
+        for miles, leg_points in legs:
+            first = len(points) - 1
+            points.extend(leg_points[1:])
+            last = len(points) - 1
+            way_points.append(last)
+
+            step_count = max(1, int(miles // STEP_MILES))
+            bounds = np.linspace(first, last, step_count + 1).round().astype(int)
+            steps = [{
+                'distance': round(miles / step_count * METERS_PER_MILE, 1),
+                'duration': round(miles / step_count / SYNTHETIC_SPEED_MPH * 3600, 1),
+                'type': 11 if i == 0 else 6,
+                'instruction': "Head out" if i == 0 else "Continue",
+                'name': '-',
+                'way_points': [int(bounds[i]), int(bounds[i + 1])],
+            } for i in range(step_count)]
+            steps.append({'distance': 0.0, 'duration': 0.0, 'type': 10, 'instruction': "Arrive", 'name': '-',
+                          'way_points': [last, last]})
+            segments.append({
+                'distance': round(miles * METERS_PER_MILE, 1),
+                'duration': round(miles / SYNTHETIC_SPEED_MPH * 3600, 1),
+                'steps': steps,
+            })
+
+        distance = sum(segment['distance'] for segment in segments)
+        duration = sum(segment['duration'] for segment in segments)
+        bbox = [float(value) for value in (*waypoints.min(axis=0), *waypoints.max(axis=0))]
+        return {
+            'bbox': bbox,
+            'routes': [{
+                'summary': {'distance': round(distance, 1), 'duration': round(duration, 1)},
+                'segments': segments,
+                'bbox': bbox,
+                'geometry': encode_polyline(points),
+                'way_points': way_points,
+            }],
+            'metadata': {
+                'attribution': 'mock ORS',
+                'service': 'routing',
+                'timestamp': int(time.time() * 1000),
+                'query': {**payload, 'profile': profile, 'format': 'json'},
+            },
+        }
+
+
+class MockORSRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    mock = None  # Set on the subclass made by make_server
+
+    def _respond(self, method):
+        url = urlsplit(self.path)
+        query = parse_qsl(url.query, keep_blank_values=True)
+        body = None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                body = None
+        status, payload = self.mock.handle(method, url.path, query, body, headers=self.headers)
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client timed out and hung up, as it would on the real API
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(mock, host='127.0.0.1', port=0):
+    """HTTP server for `mock`; port 0 picks a free port (see server.server_address)"""
+    handler = type('Handler', (MockORSRequestHandler,), {'mock': mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(mock, host='127.0.0.1', port=0):
+    """Serve `mock` on a background thread; returns (server, base_url). Call server.shutdown() to stop."""
+    server = make_server(mock, host, port)
+    threading.Thread(target=server.serve_forever, name='mock-ors', daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
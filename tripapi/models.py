@@ -1,4 +1,10 @@
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
+
+from .route_storage import pack_route_data, unpack_route_data
 
 class Driver(models.Model):
     name = models.CharField(max_length=100)
@@ -20,14 +26,48 @@ class TripPlan(models.Model):
     current_cycle_used = models.FloatField(help_text="Hours already used in the current cycle")
     created_at = models.DateTimeField(auto_now_add=True)
     
-    # Route details stored as JSON
-    route_data = models.JSONField(null=True, blank=True)
+    # Route details in compact form (see route_storage); use the route_data
+    # property to read or write the full ORS directions response
+    route_geometry = models.TextField(null=True, blank=True, help_text="Encoded polyline of the route")
+    route_distance = models.FloatField(null=True, blank=True, help_text="Route distance in meters")
+    route_duration = models.FloatField(null=True, blank=True, help_text="Route duration in seconds")
+    route_bbox = models.JSONField(null=True, blank=True)
+    route_way_points = models.JSONField(null=True, blank=True)
+    route_details = models.BinaryField(null=True, blank=True, help_text="zlib-compressed JSON of the rest of the response")
     estimated_miles = models.FloatField(null=True, blank=True)
     estimated_duration = models.FloatField(null=True, blank=True)  # In hours
+
+    # Re-plans are saved as new revisions of the plan they were made from
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='revisions')
+    # The original plan of the lineage; empty on the original itself
+    root = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='lineage')
+    revision = models.PositiveIntegerField(default=1)
+
+    # Columns the route_data property is built from, for defer()/only()
+    ROUTE_COLUMNS = ('route_geometry', 'route_distance', 'route_duration', 'route_bbox', 'route_way_points', 'route_details')
+    property_columns = {'route_data': ROUTE_COLUMNS}
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['root', 'revision'], name='unique_revision_per_lineage'),
+        ]
     
     def __str__(self):
         return f"Trip from {self.pickup_location} to {self.dropoff_location}"
 
+    @property
+    def route_data(self):
+        """The ORS directions response, rebuilt from the compact route columns on first access"""
+        if not hasattr(self, '_route_data'):
+            self._route_data = unpack_route_data(**{name: getattr(self, name) for name in self.ROUTE_COLUMNS})
+        return self._route_data
+
+    @route_data.setter
+    def route_data(self, value):
+        for name, column in pack_route_data(value).items():
+            setattr(self, name, column)
+        self._route_data = value
+
 class RestStop(models.Model):
     trip = models.ForeignKey(TripPlan, on_delete=models.CASCADE, related_name='rest_stops')
     location = models.CharField(max_length=200)
@@ -35,6 +75,7 @@ class RestStop(models.Model):
     departure_time = models.DateTimeField()
     rest_duration = models.FloatField(help_text="Duration of rest in hours")
     is_fuel_stop = models.BooleanField(default=False)
+    mile_marker = models.FloatField(null=True, blank=True, help_text="Miles from the start of the trip")
     
     def __str__(self):
         stop_type = "Fuel & Rest" if self.is_fuel_stop else "Rest"
@@ -57,4 +98,65 @@ class ELDLog(models.Model):
 
 class Location(models.Model):
     name = models.CharField(max_length=255)
-    image = models.ImageField(upload_to="eld/")
\ No newline at end of file
+    image = models.ImageField(upload_to="eld/")
+
+
+class GeocodeCacheEntry(models.Model):
+    query = models.CharField(max_length=255, unique=True, help_text="Normalized address text")
+    coordinates = models.JSONField(help_text="[longitude, latitude] returned by the geocoder")
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.query} -> {self.coordinates}"
+
+
+class PointOfInterest(models.Model):
+    FUEL = 'fuel'
+    REST_AREA = 'rest_area'
+    TRUCK_STOP = 'truck_stop'
+    CATEGORY_CHOICES = [
+        (FUEL, 'Fuel station'),
+        (REST_AREA, 'Rest area'),
+        (TRUCK_STOP, 'Truck stop'),
+    ]
+
+    name = models.CharField(max_length=200, blank=True)
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, db_index=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    address = models.CharField(max_length=255, blank=True)
+    source = models.CharField(max_length=100, blank=True, help_text="Dataset the row was loaded from")
+
+    def __str__(self):
+        return f"{self.get_category_display()}: {self.name or 'unnamed'}"
+
+
+class PlanTripJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    stage = models.CharField(max_length=50, blank=True, help_text="Pipeline stage currently running")
+    progress = models.JSONField(default=dict, help_text="Status and duration of each pipeline stage")
+    input_data = models.JSONField(help_text="Validated plan-trip input")
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the worker running it")
+    attempts = models.PositiveIntegerField(default=0, help_text="Times a worker has claimed the job")
+
+    def __str__(self):
+        return f"Plan trip job {self.id} ({self.status})"
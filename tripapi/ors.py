@@ -0,0 +1,192 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import record_ors_request
+
+
+DEFAULT_TIMEOUTS = {
+    'geocode': (5, 30),      # (connect, read) seconds
+    'directions': (5, 120),
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ORSError(Exception):
+    """An ORS request that got no response: a timeout or a connection failure, after any retries"""
+
+
+class ORSClient:
+    """
+    Shared HTTP client for the OpenRouteService API.
+    Keeps a keep-alive connection pool, retries transient failures with
+    exponential backoff and caps the number of requests in flight.
+    """
+
+    def __init__(self, api_key=None, base_url=None, timeouts=None, max_retries=None,
+                 backoff_factor=None, max_concurrency=None):
+        self.api_key = api_key or settings.ORS_API_KEY
+        self.base_url = (base_url or settings.ORS_BASE_URL).rstrip('/')
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or getattr(settings, 'ORS_TIMEOUTS', {}))}
+        max_retries = max_retries if max_retries is not None else getattr(settings, 'ORS_MAX_RETRIES', 3)
+        backoff_factor = backoff_factor if backoff_factor is not None else getattr(settings, 'ORS_BACKOFF_FACTOR', 0.5)
+        max_concurrency = max_concurrency or getattr(settings, 'ORS_MAX_CONCURRENCY', 8)
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, endpoint, **kwargs):
+        """Send a request, using the timeout configured for `endpoint`"""
+        kwargs.setdefault('timeout', self.timeouts.get(endpoint, DEFAULT_TIMEOUTS['geocode']))
+        with self._slots:
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                response = self.session.request(method, self.url(path), **kwargs)
+                status = response.status_code
+                return response
+            except requests.RequestException as e:
+                raise ORSError(f"OpenRouteService {endpoint} request failed: {e}") from e
+            finally:
+                record_ors_request(endpoint, status, time.perf_counter() - started)
+
+    def geocode(self, params):
+        return self.request('GET', '/geocode/search', 'geocode', params={'api_key': self.api_key, **params})
+
+    def directions(self, profile, payload):
+        headers = {
+            "Authorization": self.api_key,  # API Key in Authorization Header
+            "Content-Type": "application/json"
+        }
+        return self.request('POST', f'/v2/directions/{profile}', 'directions', json=payload, headers=headers)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncORSClient:
+    """
+    ORSClient for asyncio code, on an httpx.AsyncClient bound to one event
+    loop. Slow ORS calls don't hold a thread, so one worker can keep up to
+    ORS_ASYNC_MAX_CONCURRENCY requests in flight. Responses have the same
+    status_code/text/json() interface as ORSClient's.
+    """
+
+    def __init__(self, api_key=None, base_url=None, timeouts=None, max_retries=None,
+                 backoff_factor=None, max_concurrency=None, transport=None):
+        self.api_key = api_key or settings.ORS_API_KEY
+        self.base_url = (base_url or settings.ORS_BASE_URL).rstrip('/')
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or getattr(settings, 'ORS_TIMEOUTS', {}))}
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'ORS_MAX_RETRIES', 3)
+        self.backoff_factor = backoff_factor if backoff_factor is not None else getattr(settings, 'ORS_BACKOFF_FACTOR', 0.5)
+        max_concurrency = max_concurrency or getattr(settings, 'ORS_ASYNC_MAX_CONCURRENCY', 256)
+
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=transport,
+        )
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def request(self, method, path, endpoint, **kwargs):
+        """Send a request, retrying connection errors, 429 and 5xx with exponential backoff"""
+        connect, read = self.timeouts.get(endpoint, DEFAULT_TIMEOUTS['geocode'])
+        kwargs.setdefault('timeout', httpx.Timeout(read, connect=connect))
+        async with self._slots:
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = await self.client.request(method, self.url(path), **kwargs)
+                    except httpx.TransportError as e:
+                        if attempt == self.max_retries:
+                            raise ORSError(f"OpenRouteService {endpoint} request failed: {e!r}") from e
+                    else:
+                        if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                            status = response.status_code
+                            return response
+                    await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+            finally:
+                record_ors_request(endpoint, status, time.perf_counter() - started)
+
+    async def geocode(self, params):
+        return await self.request('GET', '/geocode/search', 'geocode', params={'api_key': self.api_key, **params})
+
+    async def directions(self, profile, payload):
+        headers = {
+            "Authorization": self.api_key,  # API Key in Authorization Header
+            "Content-Type": "application/json"
+        }
+        return await self.request('POST', f'/v2/directions/{profile}', 'directions', json=payload, headers=headers)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_ors_client():
+    """Return the ORS client for this worker process, creating it on first use"""
+    global _client, _client_pid
+    with _client_lock:
+        # Connection pools must not be shared across forked gunicorn workers
+        if _client is None or _client_pid != os.getpid():
+            _client = ORSClient()
+            _client_pid = os.getpid()
+        return _client
+
+
+@contextmanager
+def use_ors_client(client):
+    """Make get_ors_client() return `client` in this process until the block exits"""
+    global _client, _client_pid
+    with _client_lock:
+        previous = _client, _client_pid
+        _client, _client_pid = client, os.getpid()
+    try:
+        yield client
+    finally:
+        with _client_lock:
+            _client, _client_pid = previous
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_ors_client():
+    """Return the AsyncORSClient for the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncORSClient()
+    return client
+
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TripPlanCursorPagination(CursorPagination):
+    """
+    Newest trip plans first. Cursor pages stay stable while new plans are
+    created and don't need a COUNT over the whole table.
+    """
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
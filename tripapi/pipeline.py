@@ -0,0 +1,531 @@
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .asyncdb import db_sync_to_async
+from .geocoding import normalize_address
+from .geometry import RouteGeometry, decode_polyline
+from .image_cache import iter_render_days, render_days
+from .metrics import span
+from .models import Driver, TripPlan, RestStop, ELDLog
+from .serializers import TripPlanSerializer
+from .services import TripPlannerService
+
+LOCATION_FIELDS = ('current_location', 'pickup_location', 'dropoff_location')
+REST_STOP_EVENT_FIELDS = ('location', 'mile_marker', 'arrival_time', 'departure_time', 'rest_duration', 'is_fuel_stop')
+
+
+def get_plan_driver(driver_id=None):
+    """Driver a plan is made for; raises Driver.DoesNotExist for an unknown id"""
+    if driver_id:
+        return Driver.objects.get(id=driver_id)
+
+    # Create a default driver if not specified
+    driver, created = Driver.objects.get_or_create(
+        name="Default Driver",
+        defaults={
+            'license_number': 'DEFAULT123',
+            'carrier_name': 'Default Carrier',
+            'home_terminal': 'Default Terminal'
+        }
+    )
+    return driver
+
+
+class StageTracker:
+    """
+    Records when each pipeline stage starts and finishes (or fails) and
+    reports it to `callback`
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = {}
+        self.current = None
+        self._started = None
+
+    def start(self, stage):
+        self.current = stage
+        self._started = time.perf_counter()
+        self.stages[stage] = {'status': 'running'}
+        if self.callback:
+            self.callback(stage, self.stages)
+
+    def finish(self, stage):
+        self._end(stage, 'done')
+
+    def fail(self):
+        """Mark the stage that was running when the pipeline raised as failed"""
+        if self.current is not None:
+            self._end(self.current, 'failed')
+
+    def _end(self, stage, status):
+        self.current = None
+        self.stages[stage] = {
+            'status': status,
+            'duration_ms': round((time.perf_counter() - self._started) * 1000, 1),
+        }
+        if self.callback:
+            self.callback(stage, self.stages)
+
+
+def run_plan_trip(data, driver, absolute_url=None, inline_images=False, on_stage=None, fields=None, expand=None):
+    """
+    Plan a trip end to end: route, rest stops, ELD logs, persistence and
+    (for inline_images) rendering. Returns the plan_trip response body,
+    including the best departure times for the trip's `departure_objective`.
+    `absolute_url` turns a path into a full URL for the image links,
+    `on_stage(stage, stages)` is called as each stage starts and finishes,
+    and `fields`/`expand` select the trip_plan fields as in TripPlanSerializer.
+    """
+    images = []
+    for event, payload in iter_plan_trip(data, driver, absolute_url=absolute_url, render_images=inline_images,
+                                         on_stage=on_stage, fields=fields, expand=expand):
+        if event == 'rest_stops':
+            departure_options = payload['departure_options']
+        elif event == 'eld_logs':
+            drawing_data = payload['drawing_data']
+        elif event == 'trip_plan':
+            response_data = payload['trip_plan']
+            image_path = payload['image_path']
+        elif event == 'image':
+            images.append(payload['image'])
+
+    if inline_images:
+        # Legacy clients get base64 PNGs in place of the image links
+        image_path = images
+
+    return {
+        "trip_plan": response_data,
+        "drawing_data": drawing_data,
+        "image_path": image_path,
+        "departure_options": departure_options,
+    }
+
+
+def iter_plan_trip(data, driver, absolute_url=None, render_images=False, on_stage=None, fields=None, expand=None):
+    """
+    Run the plan-trip pipeline as a generator of (event, payload) pairs, each
+    yielded as soon as its stage is done: 'route', 'rest_stops', 'eld_logs',
+    'trip_plan' (after the plan is saved) and, with render_images, one 'image'
+    per day in date order. Arguments are as for run_plan_trip. If a stage
+    raises, it is reported to `on_stage` as failed before the error propagates.
+    """
+    tracker = StageTracker(on_stage)
+    try:
+        yield from _plan_trip_stages(tracker, data, driver, absolute_url or (lambda path: path), render_images,
+                                     fields, expand)
+    except Exception:
+        tracker.fail()
+        raise
+
+
+def _plan_trip_stages(tracker, data, driver, absolute_url, render_images, fields, expand):
+    current_cycle_used = data['current_cycle_used']
+
+    # Initialize trip planner service
+    trip_planner = TripPlannerService()
+
+    # Calculate route
+    tracker.start('route')
+    route_result = trip_planner.calculate_route(
+        data['current_location'],
+        data['pickup_location'],
+        data['dropoff_location']
+    )
+    tracker.finish('route')
+    yield 'route', {
+        'distance_miles': route_result['distance_miles'],
+        'duration_hours': route_result['duration_hours'],
+        'coordinates': route_result['coordinates'],
+    }
+
+    # Plan rest stops
+    tracker.start('rest_stops')
+    rest_stops_result = trip_planner.plan_rest_stops(
+        route_result,
+        current_cycle_used,
+        current_location_coordinates=route_result['coordinates']['current'],
+        pickup_location_coordinates=route_result['coordinates']['pickup'],
+        dropoff_location_coordinates=route_result['coordinates']['dropoff'],
+    )
+    departure_options = trip_planner.recommend_departures(
+        route_result,
+        current_cycle_used,
+        objective=data.get('departure_objective', 'elapsed')
+    )
+    tracker.finish('rest_stops')
+    yield 'rest_stops', rest_stops_summary(rest_stops_result, departure_options)
+
+    # Generate ELD logs
+    tracker.start('eld_logs')
+    eld_logs_result = trip_planner.generate_eld_logs(
+        route_result,
+        rest_stops_result,
+        current_cycle_used
+    )
+    drawing_data = trip_planner.generate_eld_drawing_data(eld_logs_result)
+    tracker.finish('eld_logs')
+    yield 'eld_logs', {'eld_logs': eld_logs_result, 'drawing_data': drawing_data}
+
+    tracker.start('persist')
+    saved = save_plan(driver, data, route_result, rest_stops_result, eld_logs_result, absolute_url, fields, expand)
+    tracker.finish('persist')
+    image_path = saved['image_path']
+    yield 'trip_plan', saved
+
+    if render_images:
+        tracker.start('images')
+        days = [day['entries'] for day in drawing_data]
+        for index, png in enumerate(iter_render_days(days)):
+            yield 'image', {
+                'index': index,
+                'date': drawing_data[index]['date'],
+                'image_path': image_path[index],
+                'image': base64.b64encode(png).decode('utf-8'),
+            }
+        tracker.finish('images')
+
+
+async def arun_plan_trip(data, driver, absolute_url=None, inline_images=False, fields=None, expand=None):
+    """
+    Async run_plan_trip. ORS calls are awaited, with the geocodes and stop
+    lookups of a plan in flight together; database work goes through
+    db_sync_to_async, and the CPU work (HOS simulation, departure
+    recommendations, ELD logs and rendering) runs on the default executor, so
+    the event loop serves other requests while this one waits.
+    """
+    absolute_url = absolute_url or (lambda path: path)
+    current_cycle_used = data['current_cycle_used']
+    trip_planner = TripPlannerService()
+
+    route_result = await trip_planner.acalculate_route(
+        data['current_location'],
+        data['pickup_location'],
+        data['dropoff_location']
+    )
+    rest_stops_result = await trip_planner.aplan_rest_stops(
+        route_result,
+        current_cycle_used,
+        current_location_coordinates=route_result['coordinates']['current'],
+        pickup_location_coordinates=route_result['coordinates']['pickup'],
+        dropoff_location_coordinates=route_result['coordinates']['dropoff'],
+    )
+    departure_options, eld_logs_result, drawing_data = await sync_to_async(_plan_logs, thread_sensitive=False)(
+        trip_planner, route_result, rest_stops_result, current_cycle_used, data.get('departure_objective', 'elapsed')
+    )
+
+    saved = await db_sync_to_async(save_plan)(
+        driver, data, route_result, rest_stops_result, eld_logs_result, absolute_url, fields, expand
+    )
+    image_path = saved['image_path']
+    if inline_images:
+        images = await sync_to_async(render_days, thread_sensitive=False)([day['entries'] for day in drawing_data])
+        image_path = [base64.b64encode(png).decode('utf-8') for png in images]
+
+    return {
+        "trip_plan": saved['trip_plan'],
+        "drawing_data": drawing_data,
+        "image_path": image_path,
+        "departure_options": departure_options,
+    }
+
+
+def _plan_logs(trip_planner, route_result, rest_stops_result, current_cycle_used, objective):
+    """Departure options, ELD logs and drawing data for arun_plan_trip's executor hop"""
+    departure_options = trip_planner.recommend_departures(route_result, current_cycle_used, objective=objective)
+    eld_logs_result = trip_planner.generate_eld_logs(route_result, rest_stops_result, current_cycle_used)
+    return departure_options, eld_logs_result, trip_planner.generate_eld_drawing_data(eld_logs_result)
+
+
+def rest_stops_summary(rest_stops_result, departure_options):
+    return {
+        'departure_time': rest_stops_result['departure_time'],
+        'estimated_arrival': rest_stops_result['estimated_arrival'],
+        'total_driving_hours': rest_stops_result['total_driving_hours'],
+        'rest_stops': [
+            {key: stop.get(key) for key in REST_STOP_EVENT_FIELDS}
+            for stop in rest_stops_result['rest_stops']
+        ],
+        'departure_options': departure_options,
+    }
+
+
+@span('persist')
+def save_plan(driver, data, route_result, rest_stops_result, eld_logs_result, absolute_url, fields=None, expand=None):
+    """
+    Save a planned trip in one transaction and return {"trip_plan": serialized
+    plan, "image_path": links to the day images}. Images are rendered on first
+    request to the eld-log-image endpoint.
+    """
+    # Build the rows in memory and write them in one transaction
+    trip_plan = build_trip_plan(driver, data, route_result)
+    eld_logs = build_eld_logs(trip_plan, eld_logs_result)
+    persist_trip_plans([(trip_plan, build_rest_stops(trip_plan, rest_stops_result), eld_logs)])
+    return {
+        'trip_plan': TripPlanSerializer(
+            trip_plan, fields=fields, expand=expand, context={'absolute_url': absolute_url}
+        ).data,
+        'image_path': [absolute_url(reverse('eld-log-image', args=[eld_log.id])) for eld_log in eld_logs],
+    }
+
+
+def build_trip_plan(driver, data, route_result):
+    """Unsaved TripPlan for a routed trip"""
+    return TripPlan(
+        driver=driver,
+        current_location=data['current_location'],
+        current_location_coordinates=route_result['coordinates']['current'],
+        pickup_location=data['pickup_location'],
+        pickup_location_coordinates=route_result['coordinates']['pickup'],
+        dropoff_location=data['dropoff_location'],
+        dropoff_location_coordinates=route_result['coordinates']['dropoff'],
+        current_cycle_used=data['current_cycle_used'],
+        route_data=route_result['route_data'],
+        estimated_miles=route_result['distance_miles'],
+        estimated_duration=route_result['duration_hours']
+    )
+
+
+def build_rest_stops(trip_plan, rest_stops_result):
+    return [
+        RestStop(
+            trip=trip_plan,
+            location=stop_data['location'],
+            arrival_time=stop_data['arrival_time'],
+            departure_time=stop_data['departure_time'],
+            rest_duration=stop_data['rest_duration'],
+            is_fuel_stop=stop_data['is_fuel_stop'],
+            mile_marker=stop_data.get('mile_marker')
+        )
+        for stop_data in rest_stops_result['rest_stops']
+    ]
+
+
+def build_eld_logs(trip_plan, eld_logs_result):
+    return [
+        ELDLog(
+            trip=trip_plan,
+            date=log_data['date'],
+            log_data={
+                'entries': log_data['log_entries'],
+            },
+            total_off_duty_hours=log_data['total_off_duty_hours'],
+            total_sleeper_hours=log_data['total_sleeper_hours'],
+            total_driving_hours=log_data['total_driving_hours'],
+            total_on_duty_hours=log_data['total_on_duty_hours'],
+            total_hours=log_data['total_hours'],
+            total_miles_driven=log_data['total_miles']
+        )
+        for log_data in eld_logs_result
+    ]
+
+
+def persist_trip_plans(plans):
+    """
+    Save (trip_plan, rest_stops, eld_logs) tuples of unsaved instances with
+    one bulk insert per table, all inside a single transaction.
+    """
+    with transaction.atomic():
+        TripPlan.objects.bulk_create([trip_plan for trip_plan, _, _ in plans])
+        rest_stops = []
+        eld_logs = []
+        for trip_plan, plan_rest_stops, plan_eld_logs in plans:
+            # Re-assign so the children pick up the primary keys bulk_create set
+            for obj in plan_rest_stops + plan_eld_logs:
+                obj.trip = trip_plan
+            rest_stops.extend(plan_rest_stops)
+            eld_logs.extend(plan_eld_logs)
+        RestStop.objects.bulk_create(rest_stops)
+        ELDLog.objects.bulk_create(eld_logs)
+    return plans
+
+
+def run_plan_trip_batch(trips, absolute_url=None):
+    """
+    Plan many trips at once for fleet dispatch.
+    `trips` is a list of (validated data, driver) pairs. Every distinct address
+    in the batch is geocoded once, routes are fetched concurrently, and all
+    successful plans are saved in one transaction. Returns one entry per trip,
+    either {"index", "result"} or {"index", "error"}; a result has the same
+    keys as run_plan_trip's, departure_options included.
+    """
+    absolute_url = absolute_url or (lambda path: path)
+    max_workers = getattr(settings, 'BATCH_PLAN_CONCURRENCY', 8)
+    trip_planner = TripPlannerService()
+    results = [None] * len(trips)
+
+    # One geocode pass over the deduplicated addresses
+    geocoded = trip_planner.get_coordinates_many(
+        [data[field] for data, _ in trips for field in LOCATION_FIELDS],
+        max_workers=max_workers
+    )
+
+    # Route every trip whose addresses all resolved, concurrently
+    def route(data):
+        coordinates = []
+        for field in LOCATION_FIELDS:
+            coords, error = geocoded[normalize_address(data[field])]
+            if error:
+                raise Exception(error)
+            coordinates.append(coords)
+        return trip_planner.route_between(*coordinates)
+
+    def route_or_error(data):
+        try:
+            return route(data), None
+        except Exception as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        routes = list(pool.map(route_or_error, [data for data, _ in trips]))
+
+    # HOS planning and ELD logs are local computation
+    plans = []
+    planned = []
+    for index, ((data, driver), (route_result, error)) in enumerate(zip(trips, routes)):
+        if error:
+            results[index] = {"index": index, "error": error}
+            continue
+        try:
+            rest_stops_result = trip_planner.plan_rest_stops(
+                route_result,
+                data['current_cycle_used'],
+                current_location_coordinates=route_result['coordinates']['current'],
+                pickup_location_coordinates=route_result['coordinates']['pickup'],
+                dropoff_location_coordinates=route_result['coordinates']['dropoff'],
+            )
+            departure_options = trip_planner.recommend_departures(
+                route_result,
+                data['current_cycle_used'],
+                objective=data.get('departure_objective', 'elapsed')
+            )
+            eld_logs_result = trip_planner.generate_eld_logs(route_result, rest_stops_result, data['current_cycle_used'])
+        except Exception as e:
+            results[index] = {"index": index, "error": str(e)}
+            continue
+
+        trip_plan = build_trip_plan(driver, data, route_result)
+        plans.append((trip_plan, build_rest_stops(trip_plan, rest_stops_result), build_eld_logs(trip_plan, eld_logs_result)))
+        planned.append((index, trip_planner.generate_eld_drawing_data(eld_logs_result), departure_options))
+
+    persist_trip_plans(plans)
+
+    saved = TripPlan.objects.filter(id__in=[trip_plan.id for trip_plan, _, _ in plans]).prefetch_related('rest_stops', 'eld_logs')
+    saved = {trip_plan.id: trip_plan for trip_plan in saved}
+    for (index, drawing_data, departure_options), (trip_plan, _, eld_logs) in zip(planned, plans):
+        results[index] = {
+            "index": index,
+            "result": {
+                "trip_plan": TripPlanSerializer(saved[trip_plan.id], context={'absolute_url': absolute_url}).data,
+                "drawing_data": drawing_data,
+                "image_path": [absolute_url(reverse('eld-log-image', args=[eld_log.id])) for eld_log in eld_logs],
+                "departure_options": departure_options,
+            }
+        }
+    return results
+
+
+def stored_route_result(trip_plan):
+    """Rebuild calculate_route's result for a saved plan from its route columns, without the network"""
+    geometry = None
+    if trip_plan.route_geometry:
+        geometry = RouteGeometry(decode_polyline(trip_plan.route_geometry), total_miles=trip_plan.estimated_miles)
+    return {
+        'geometry': geometry,
+        'distance_miles': trip_plan.estimated_miles,
+        'duration_hours': trip_plan.estimated_duration,
+        'coordinates': {
+            'current': trip_plan.current_location_coordinates,
+            'pickup': trip_plan.pickup_location_coordinates,
+            'dropoff': trip_plan.dropoff_location_coordinates,
+        }
+    }
+
+
+def replan_trip(trip_plan, current_cycle_used=None, departure_time=None, absolute_url=None, fields=None, expand=None):
+    """
+    Rerun the HOS schedule of a saved plan with new inputs and save the result
+    as a new revision. The stored coordinates and route are reused and stop
+    locations come from the previous revision or the local POI index, so no
+    network calls are made. Images are content-addressed, so only the days
+    listed in `changed_dates` can ever need rendering again.
+    """
+    absolute_url = absolute_url or (lambda path: path)
+    if current_cycle_used is None:
+        current_cycle_used = trip_plan.current_cycle_used
+    if departure_time is not None and timezone.is_aware(departure_time):
+        # The HOS simulation works in naive server time
+        departure_time = timezone.make_naive(departure_time)
+
+    trip_planner = TripPlannerService()
+    route_result = stored_route_result(trip_plan)
+    coordinates = route_result['coordinates']
+    known_locations = {
+        (stop.is_fuel_stop, round(stop.mile_marker)): stop.location
+        for stop in trip_plan.rest_stops.all() if stop.mile_marker is not None
+    }
+
+    rest_stops_result = trip_planner.plan_rest_stops(
+        route_result,
+        current_cycle_used,
+        current_location_coordinates=coordinates['current'],
+        pickup_location_coordinates=coordinates['pickup'],
+        dropoff_location_coordinates=coordinates['dropoff'],
+        departure_time=departure_time,
+        known_locations=known_locations,
+        remote_lookup=False,
+    )
+    eld_logs_result = trip_planner.generate_eld_logs(route_result, rest_stops_result, current_cycle_used)
+
+    revision = TripPlan(
+        driver_id=trip_plan.driver_id,
+        current_location=trip_plan.current_location,
+        current_location_coordinates=coordinates['current'],
+        pickup_location=trip_plan.pickup_location,
+        pickup_location_coordinates=coordinates['pickup'],
+        dropoff_location=trip_plan.dropoff_location,
+        dropoff_location_coordinates=coordinates['dropoff'],
+        current_cycle_used=current_cycle_used,
+        estimated_miles=trip_plan.estimated_miles,
+        estimated_duration=trip_plan.estimated_duration,
+        parent=trip_plan,
+        root_id=trip_plan.root_id or trip_plan.id,
+        # Copy the compact route columns as they are; no need to decompress them
+        **{name: getattr(trip_plan, name) for name in TripPlan.ROUTE_COLUMNS}
+    )
+    eld_logs = build_eld_logs(revision, eld_logs_result)
+    with transaction.atomic():
+        # Number from the whole lineage, not the plan replanned, so replanning
+        # the same plan twice can't reuse a revision; locking the root row
+        # serialises concurrent replans where the database supports it
+        list(TripPlan.objects.select_for_update().filter(id=revision.root_id).values_list('id', flat=True))
+        latest = TripPlan.objects.filter(
+            Q(id=revision.root_id) | Q(root_id=revision.root_id)
+        ).aggregate(latest=Max('revision'))['latest']
+        revision.revision = (latest or trip_plan.revision) + 1
+        persist_trip_plans([(revision, build_rest_stops(revision, rest_stops_result), eld_logs)])
+
+    drawing_data = trip_planner.generate_eld_drawing_data(eld_logs_result)
+    previous = {
+        eld_log.date: trip_planner.drawing_entries(eld_log.log_data.get('entries', []))
+        for eld_log in trip_plan.eld_logs.all()
+    }
+    changed_dates = [day['date'] for day in drawing_data if previous.get(day['date']) != day['entries']]
+
+    response_data = TripPlanSerializer(
+        revision, fields=fields, expand=expand, context={'absolute_url': absolute_url}
+    ).data
+    return {
+        "trip_plan": response_data,
+        "drawing_data": drawing_data,
+        "image_path": [absolute_url(reverse('eld-log-image', args=[eld_log.id])) for eld_log in eld_logs],
+        "changed_dates": changed_dates,
+    }
@@ -0,0 +1,193 @@
+import csv
+import json
+import logging
+import math
+import os
+import threading
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .geometry import haversine_miles
+from .models import PointOfInterest
+
+logger = logging.getLogger(__name__)
+
+# Which POI categories can serve each kind of planned stop
+FUEL_STOP_CATEGORIES = (PointOfInterest.FUEL, PointOfInterest.TRUCK_STOP)
+REST_STOP_CATEGORIES = (PointOfInterest.REST_AREA, PointOfInterest.TRUCK_STOP)
+
+MILES_PER_DEGREE_LAT = 69.0
+
+
+class POIIndex:
+    """
+    In-memory grid index over PointOfInterest rows.
+    Points are bucketed into cells of `cell_degrees`; a nearest-neighbour
+    query scans rings of cells outward from the query point and stops once
+    no unscanned cell can hold anything closer than the best match.
+    """
+
+    def __init__(self, ids, names, categories, lons, lats, cell_degrees=0.5):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.names = list(names)
+        self.categories = list(categories)
+        self.category_codes = {category: code for code, category in enumerate(sorted(set(self.categories)))}
+        self.codes = np.asarray([self.category_codes[c] for c in self.categories], dtype=np.int16)
+        self.lons = np.asarray(lons, dtype=float)
+        self.lats = np.asarray(lats, dtype=float)
+        self.cell_degrees = cell_degrees
+
+        buckets = defaultdict(list)
+        for position, cell in enumerate(zip(self._cells(self.lons), self._cells(self.lats))):
+            buckets[cell].append(position)
+        self.cells = {cell: np.asarray(positions) for cell, positions in buckets.items()}
+
+    @classmethod
+    def from_database(cls, cell_degrees=0.5):
+        rows = list(PointOfInterest.objects.values_list('id', 'name', 'category', 'longitude', 'latitude'))
+        columns = list(zip(*rows)) if rows else [[], [], [], [], []]
+        return cls(*columns, cell_degrees=cell_degrees)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cells(self, values):
+        return np.floor(np.asarray(values) / self.cell_degrees).astype(int).tolist()
+
+    def nearest(self, lon, lat, categories=None, max_miles=50):
+        """Return the closest POI to (lon, lat) within max_miles, or None"""
+        if not len(self):
+            return None
+
+        if categories is not None:
+            wanted = [self.category_codes[c] for c in categories if c in self.category_codes]
+            if not wanted:
+                return None
+
+        cx = math.floor(lon / self.cell_degrees)
+        cy = math.floor(lat / self.cell_degrees)
+        best = None
+        best_miles = max_miles
+
+        ring = 0
+        while True:
+            # Anything in this ring or beyond is at least this far away
+            ring_lat = min(89.0, abs(lat) + (ring + 1) * self.cell_degrees)
+            ring_miles = max(ring - 1, 0) * self.cell_degrees * MILES_PER_DEGREE_LAT * math.cos(math.radians(ring_lat))
+            if ring_miles > best_miles:
+                break
+
+            candidates = [
+                self.cells[cell] for cell in self._ring(cx, cy, ring) if cell in self.cells
+            ]
+            if candidates:
+                positions = np.concatenate(candidates)
+                if categories is not None:
+                    positions = positions[np.isin(self.codes[positions], wanted)]
+                if len(positions):
+                    distances = haversine_miles(lon, lat, self.lons[positions], self.lats[positions])
+                    closest = int(np.argmin(distances))
+                    if distances[closest] <= best_miles:
+                        best = positions[closest]
+                        best_miles = float(distances[closest])
+            ring += 1
+
+        if best is None:
+            return None
+        return {
+            'id': int(self.ids[best]),
+            'name': self.names[best],
+            'category': self.categories[best],
+            'longitude': float(self.lons[best]),
+            'latitude': float(self.lats[best]),
+            'distance_miles': best_miles,
+        }
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_poi_index():
+    """Return this worker's POI index, building it from the database on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = POIIndex.from_database(cell_degrees=getattr(settings, 'POI_INDEX_CELL_DEGREES', 0.5))
+            if not len(_index):
+                fallback = "ORS searches" if getattr(settings, 'POI_REMOTE_FALLBACK', True) else "placeholder names"
+                logger.warning("The POI index is empty, so planned stops get %s; "
+                               "load POIs with `manage.py rebuild_poi_index`", fallback)
+        return _index
+
+
+def reset_poi_index():
+    """Drop the cached index so the next query rebuilds it"""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def read_poi_file(path):
+    """
+    Read POIs from a CSV (name, category, latitude, longitude, address, source)
+    or a GeoJSON FeatureCollection of Points with the same properties.
+    """
+    source = os.path.basename(path)
+    if path.endswith(('.geojson', '.json')):
+        with open(path) as f:
+            features = json.load(f).get('features', [])
+        for feature in features:
+            properties = feature.get('properties') or {}
+            lon, lat = feature['geometry']['coordinates'][:2]
+            yield PointOfInterest(
+                name=properties.get('name') or '',
+                category=properties['category'],
+                longitude=float(lon),
+                latitude=float(lat),
+                address=properties.get('address') or '',
+                source=properties.get('source') or source,
+            )
+    else:
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                yield PointOfInterest(
+                    name=row.get('name') or '',
+                    category=row['category'],
+                    longitude=float(row['longitude']),
+                    latitude=float(row['latitude']),
+                    address=row.get('address') or '',
+                    source=row.get('source') or source,
+                )
+
+
+def load_pois(path, replace=True):
+    """Load a POI file into the database and return the number of rows written"""
+    valid_categories = {choice for choice, _ in PointOfInterest.CATEGORY_CHOICES}
+    pois = []
+    for poi in read_poi_file(path):
+        if poi.category not in valid_categories:
+            raise ValueError(f"Unknown POI category '{poi.category}' in {path}")
+        pois.append(poi)
+
+    with transaction.atomic():
+        if replace:
+            PointOfInterest.objects.all().delete()
+        PointOfInterest.objects.bulk_create(pois, batch_size=1000)
+    reset_poi_index()
+    return len(pois)
@@ -0,0 +1,285 @@
+import abc
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+from django.conf import settings
+
+from .log_templates import get_log_template
+from .metrics import record_renders, span
+
+matplotlib.use('Agg')
+
+# Geometry of the matplotlib output the raster renderer reproduces: a 10x6 in
+# figure saved at 300 dpi, where the template fills the default axes height
+# (0.77 of the figure) and bbox_inches="tight" pads it by 0.1 in
+OUTPUT_DPI = 300
+AXES_HEIGHT_INCHES = 6 * (0.88 - 0.11)
+PAD_PIXELS = round(0.1 * OUTPUT_DPI)
+POINTS_TO_PIXELS = OUTPUT_DPI / 72
+
+
+def duty_totals(hours):
+    """Hours per status as printed beside the grid"""
+    total_hours = {"off_duty": 0, "sleeper": 0, "driving": 0, "on_duty": 0}
+    prev_hour = None
+    for hour, status in hours:
+        if prev_hour is not None:
+            total_hours[status] += hour - prev_hour
+        prev_hour = hour
+    return total_hours
+
+
+class ELDRenderer(abc.ABC):
+    """Draws a day's duty-status points onto the log template and returns PNG bytes"""
+    name = None
+    version = 1
+
+    @abc.abstractmethod
+    def render(self, hours, template=None):
+        pass
+
+
+class MatplotlibRenderer(ELDRenderer):
+    name = 'matplotlib'
+
+    def render(self, hours, template=None):
+        template = get_log_template(template)
+        layout = template.layout
+        graph_left = layout['graph_left']
+        graph_right = layout['graph_right']
+        graph_bottom = layout['graph_bottom']
+        hour_step = layout['hour_step']
+        status_levels = layout['status_levels']
+
+        # Create a figure
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.imshow(template.image)
+
+        # Draw ELD lines
+        prev_x, prev_y = None, None
+        for hour, status in hours:
+            x = graph_left + hour * hour_step
+            y = status_levels[status]
+
+            if prev_x is not None and prev_y is not None:
+                ax.scatter([x, x], [prev_y, y], color='red', s=10, zorder=2)
+                ax.scatter(prev_x, prev_y, color='red', s=10, zorder=2)
+                ax.scatter(x, y, color='red', s=10, zorder=2)
+                ax.plot([x, x], [prev_y, y], color='black', linewidth=1, zorder=1)
+                ax.plot([prev_x, x], [prev_y, prev_y], color='black', linewidth=1, zorder=1)
+
+            prev_x, prev_y = x, y
+
+        # Ensure the last point extends to the end
+        last_x = graph_right
+        ax.plot([prev_x, last_x], [prev_y, prev_y], color='black', linewidth=1, zorder=1)
+        ax.scatter(last_x, prev_y, color='red', s=10, zorder=2)
+
+        # Display total hours beside the logs
+        total_hours = duty_totals(hours)
+        for status, status_hours in total_hours.items():
+            y_pos = status_levels[status] + 5
+            ax.text(graph_right + 20, y_pos, f"{status_hours:.2f}", fontsize=6, color='black', ha='center')
+
+        # Draw red circle around total on-duty and driving time
+        total_on_duty = total_hours["on_duty"] + total_hours["driving"]
+        circle_x = graph_right - 50
+        circle_y = graph_bottom + 60
+        circle_radius = 30
+        ax.add_patch(plt.Circle((circle_x, circle_y), circle_radius, color='red', fill=False, linewidth=2))
+        ax.text(circle_x, circle_y, f"{total_on_duty:.2f}", fontsize=10, color='black', weight='bold', ha='center', va='center')
+
+        # Save to in-memory buffer
+        buffer = io.BytesIO()
+        plt.axis("off")
+        plt.savefig(buffer, format="png", bbox_inches="tight", dpi=OUTPUT_DPI)
+        plt.close(fig)
+        return buffer.getvalue()
+
+
+class RasterRenderer(ELDRenderer):
+    """
+    Draws straight onto a scaled copy of the template with OpenCV primitives.
+    Coordinates, sizes and padding follow MatplotlibRenderer's output so the
+    two produce the same layout, without building a figure per day.
+    """
+    name = 'raster'
+
+    BLACK = (0, 0, 0)
+    RED = (0, 0, 255)  # BGR
+    LINE_THICKNESS = round(1 * POINTS_TO_PIXELS)
+    MARKER_RADIUS = round((np.sqrt(10) / 2 + 0.5) * POINTS_TO_PIXELS)
+    CIRCLE_THICKNESS = round(2 * POINTS_TO_PIXELS)
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    PNG_COMPRESSION = 3
+
+    def render(self, hours, template=None):
+        template = get_log_template(template)
+        layout = template.layout
+        scale = AXES_HEIGHT_INCHES * OUTPUT_DPI / layout['height']
+        # Copy-on-write from the shared, pre-scaled template
+        canvas = template.scaled_bgr((int(layout['width'] * scale), int(layout['height'] * scale))).copy()
+
+        def point(x, y):
+            return (round(x * scale), round(y * scale))
+
+        graph_left = layout['graph_left']
+        graph_right = layout['graph_right']
+        graph_bottom = layout['graph_bottom']
+        hour_step = layout['hour_step']
+        status_levels = layout['status_levels']
+
+        # Lines first, then markers on top (matplotlib zorder 1 and 2)
+        lines = []
+        markers = []
+        prev_x, prev_y = None, None
+        for hour, status in hours:
+            x = graph_left + hour * hour_step
+            y = status_levels[status]
+            if prev_x is not None:
+                lines.append((point(x, prev_y), point(x, y)))
+                lines.append((point(prev_x, prev_y), point(x, prev_y)))
+                markers.extend([point(x, prev_y), point(x, y), point(prev_x, prev_y)])
+            prev_x, prev_y = x, y
+        lines.append((point(prev_x, prev_y), point(graph_right, prev_y)))
+        markers.append(point(graph_right, prev_y))
+
+        for start, end in lines:
+            cv2.line(canvas, start, end, self.BLACK, self.LINE_THICKNESS, cv2.LINE_AA)
+        for center in markers:
+            cv2.circle(canvas, center, self.MARKER_RADIUS, self.RED, -1, cv2.LINE_AA)
+
+        # Totals beside the grid: 6 pt, centred on x with the baseline at y
+        total_hours = duty_totals(hours)
+        for status, status_hours in total_hours.items():
+            self._text(canvas, f"{status_hours:.2f}", point(graph_right + 20, status_levels[status] + 5), 6)
+
+        # Red circle around total on-duty and driving time
+        total_on_duty = total_hours["on_duty"] + total_hours["driving"]
+        center = point(graph_right - 50, graph_bottom + 60)
+        cv2.circle(canvas, center, round(30 * scale), self.RED, self.CIRCLE_THICKNESS, cv2.LINE_AA)
+        self._text(canvas, f"{total_on_duty:.2f}", center, 10, bold=True, vcenter=True)
+
+        canvas = cv2.copyMakeBorder(canvas, PAD_PIXELS, PAD_PIXELS, PAD_PIXELS, PAD_PIXELS,
+                                    cv2.BORDER_CONSTANT, value=(255, 255, 255))
+        ok, png = cv2.imencode('.png', canvas, [cv2.IMWRITE_PNG_COMPRESSION, self.PNG_COMPRESSION])
+        if not ok:
+            raise RuntimeError("Failed to encode ELD log image")
+        return png.tobytes()
+
+    def _text(self, canvas, text, anchor, fontsize, bold=False, vcenter=False):
+        # Size the Hershey font so its cap height matches a sans-serif font at `fontsize` pt
+        cap_height = 0.73 * fontsize * POINTS_TO_PIXELS
+        font_scale = cap_height / cv2.getTextSize("0", self.FONT, 1, 1)[0][1]
+        thickness = max(1, round(font_scale * (3 if bold else 1.5)))
+        (width, height), _ = cv2.getTextSize(text, self.FONT, font_scale, thickness)
+        x = anchor[0] - width // 2
+        y = anchor[1] + height // 2 if vcenter else anchor[1]
+        cv2.putText(canvas, text, (x, y), self.FONT, font_scale, self.BLACK, thickness, cv2.LINE_AA)
+
+
+RENDERERS = {
+    RasterRenderer.name: RasterRenderer,
+    MatplotlibRenderer.name: MatplotlibRenderer,
+}
+
+
+def get_renderer(name=None):
+    """Return the renderer called `name`, defaulting to settings.ELD_RENDERER"""
+    name = name or getattr(settings, 'ELD_RENDERER', RasterRenderer.name)
+    try:
+        return RENDERERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown ELD renderer '{name}', expected one of {sorted(RENDERERS)}")
+
+
+def _init_render_worker(template_names):
+    # Decode templates up front so the first render in each worker doesn't pay for it
+    for name in template_names:
+        get_log_template(name)
+
+
+def _render_in_worker(hours, renderer_name, template):
+    return get_renderer(renderer_name).render(hours, template)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def render_workers():
+    workers = getattr(settings, 'ELD_RENDER_WORKERS', None)
+    return workers if workers is not None else min(4, os.cpu_count() or 1)
+
+
+def get_render_pool():
+    """Return this process's rendering pool, starting it on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            context = multiprocessing.get_context(getattr(settings, 'ELD_RENDER_START_METHOD', 'spawn'))
+            _pool = ProcessPoolExecutor(
+                max_workers=render_workers(),
+                mp_context=context,
+                initializer=_init_render_worker,
+                initargs=(list(getattr(settings, 'ELD_LOG_TEMPLATES', {})),),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+@span('render')
+def render_many(days, renderer=None, template=None, timeout=None):
+    """
+    Render several days' entries, in parallel when a render pool is configured.
+    Returns PNG bytes in the same order as `days`. Each render gets `timeout`
+    seconds (default settings.ELD_RENDER_TIMEOUT) before TimeoutError is raised.
+    """
+    renderer_name = renderer or getattr(settings, 'ELD_RENDERER', RasterRenderer.name)
+    timeout = timeout if timeout is not None else getattr(settings, 'ELD_RENDER_TIMEOUT', 60)
+    days = [list(hours) for hours in days]
+    record_renders(renderer_name, len(days))
+
+    if len(days) <= 1 or render_workers() <= 1:
+        instance = get_renderer(renderer_name)
+        return [instance.render(hours, template) for hours in days]
+
+    pool = get_render_pool()
+    futures = [pool.submit(_render_in_worker, hours, renderer_name, template) for hours in days]
+    try:
+        # Days queue behind each other once every worker is busy, so the n-th
+        # day is allowed one timeout per batch of renders ahead of it
+        started = time.monotonic()
+        workers = render_workers()
+        images = []
+        for index, future in enumerate(futures):
+            deadline = started + timeout * (index // workers + 1)
+            images.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+        return images
+    except FuturesTimeoutError:
+        for future in futures:
+            future.cancel()
+        raise TimeoutError(f"Rendering ELD logs took longer than {timeout}s")
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); start a fresh pool next time and render here
+        shutdown_render_pool()
+        instance = get_renderer(renderer_name)
+        return [instance.render(hours, template) for hours in days]
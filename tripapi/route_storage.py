@@ -0,0 +1,86 @@
+import json
+import zlib
+
+# Column values filled back into the first route when a stored route is rebuilt
+ROUTE_COLUMN_KEYS = ('geometry', 'bbox', 'way_points')
+SUMMARY_COLUMN_KEYS = ('distance', 'duration')
+
+COMPRESSION_LEVEL = 6
+
+
+def compress_json(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress_json(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def pack_route_data(route_data):
+    """
+    Split an ORS directions response into TripPlan's compact route columns.
+    The first route's encoded polyline, summary, bbox and way points become
+    real columns, and everything else (segments with their turn-by-turn
+    instructions, extras, metadata, any other routes) is kept as compressed
+    JSON that is only read when the full response is needed. The extracted
+    values are left as None placeholders so unpack_route_data can rebuild the
+    response exactly.
+    """
+    columns = {
+        'route_geometry': None,
+        'route_distance': None,
+        'route_duration': None,
+        'route_bbox': None,
+        'route_way_points': None,
+        'route_details': None,
+    }
+    if route_data is None:
+        return columns
+
+    details = json.loads(json.dumps(route_data))  # Deep copy, as stored by a JSONField
+    routes = details.get('routes') if isinstance(details, dict) else None
+    if routes and isinstance(routes[0], dict):
+        route = routes[0]
+        if isinstance(route.get('geometry'), str):
+            columns['route_geometry'] = route['geometry']
+            route['geometry'] = None
+        for key in ('bbox', 'way_points'):
+            if route.get(key) is not None:
+                columns[f'route_{key}'] = route[key]
+                route[key] = None
+        summary = route.get('summary')
+        if isinstance(summary, dict):
+            for key in SUMMARY_COLUMN_KEYS:
+                if isinstance(summary.get(key), (int, float)):
+                    columns[f'route_{key}'] = summary[key]
+                    summary[key] = None
+
+    columns['route_details'] = compress_json(details)
+    return columns
+
+
+def unpack_route_data(route_details, route_geometry=None, route_distance=None, route_duration=None,
+                      route_bbox=None, route_way_points=None):
+    """Rebuild the ORS directions response from TripPlan's compact route columns"""
+    if route_details is None:
+        return None
+
+    route_data = decompress_json(route_details)
+    routes = route_data.get('routes') if isinstance(route_data, dict) else None
+    if routes and isinstance(routes[0], dict):
+        route = routes[0]
+        values = {
+            'geometry': route_geometry,
+            'bbox': route_bbox,
+            'way_points': route_way_points,
+        }
+        for key in ROUTE_COLUMN_KEYS:
+            if key in route and route[key] is None:
+                route[key] = values[key]
+        summary = route.get('summary')
+        if isinstance(summary, dict):
+            for key, value in (('distance', route_distance), ('duration', route_duration)):
+                if key in summary and summary[key] is None:
+                    summary[key] = value
+    return route_data
+
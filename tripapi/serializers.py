@@ -1,29 +1,138 @@
 # tripplanner/tripapi/serializers.py
+from django.conf import settings
+from django.db.models import Prefetch
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Driver, TripPlan, RestStop, ELDLog
+from .hos import DEPARTURE_OBJECTIVES
+from .models import Driver, TripPlan, RestStop, ELDLog, PlanTripJob
 
-class DriverSerializer(serializers.ModelSerializer):
+def field_params(request, name):
+    """Names passed in ?<name>=a,b.c (repeatable) as a set of dotted paths"""
+    if request is None:
+        return None
+    # DRF requests have query_params; plain Django requests (async views) only GET
+    values = getattr(request, 'query_params', request.GET).getlist(name)
+    if not values:
+        return None
+    return {
+        path.strip()
+        for value in values
+        for path in value.split(',') if path.strip()
+    }
+
+def _nested_paths(paths, name):
+    if paths is None:
+        return None
+    nested = {path.split('.', 1)[1] for path in paths if path.startswith(name + '.')}
+    return nested or None
+
+class DynamicFieldsMixin:
+    """
+    Lets the client choose the fields it gets back.
+    `fields` keeps only the named fields and `expand` adds ones listed in
+    Meta.expandable_fields, which are left out by default. Both are sets of
+    dotted paths ("eld_logs.date") and are read from ?fields= / ?expand= on
+    the request when not passed in.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if fields is None:
+            fields = field_params(request, 'fields')
+        if expand is None:
+            expand = field_params(request, 'expand')
+        restrict_fields(self, fields, expand)
+
+def restrict_fields(serializer, fields=None, expand=None):
+    """Drop the fields of `serializer` (and its nested serializers) that weren't asked for"""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    top_fields = {path.split('.', 1)[0] for path in fields} if fields else None
+    top_expand = {path.split('.', 1)[0] for path in expand} if expand else set()
+    expandable = getattr(getattr(serializer, 'Meta', None), 'expandable_fields', ())
+
+    for name in list(serializer.fields):
+        if top_fields is not None:
+            keep = name in top_fields
+        else:
+            keep = name not in expandable or name in top_expand
+        if not keep:
+            serializer.fields.pop(name)
+
+    for name, field in serializer.fields.items():
+        if isinstance(field, serializers.BaseSerializer):
+            restrict_fields(field, _nested_paths(fields, name), _nested_paths(expand, name))
+
+def restrict_queryset(queryset, serializer):
+    """
+    Defer the columns `serializer` won't output and only prefetch the nested
+    relations it includes, so unrequested JSON is never read from the database
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    model = queryset.model
+    sources = {field.source for field in serializer.fields.values()}
+    # Model properties stored across several columns, e.g. TripPlan.route_data
+    for name, columns in getattr(model, 'property_columns', {}).items():
+        if name in sources:
+            sources.update(columns)
+    deferred = [
+        field.name for field in model._meta.concrete_fields
+        # Keep primary and foreign keys: prefetching joins on them
+        if not field.primary_key and not field.is_relation and field.name not in sources
+    ]
+
+    prefetches = []
+    related = {rel.get_accessor_name(): rel for rel in model._meta.related_objects}
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.BaseSerializer) and field.source in related:
+            child = field.child if isinstance(field, serializers.ListSerializer) else field
+            child_queryset = related[field.source].related_model._default_manager.all()
+            prefetches.append(Prefetch(field.source, queryset=restrict_queryset(child_queryset, child)))
+
+    return queryset.prefetch_related(None).prefetch_related(*prefetches).defer(*deferred)
+
+class DriverSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Driver
         fields = '__all__'
 
-class RestStopSerializer(serializers.ModelSerializer):
+class RestStopSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = RestStop
         fields = '__all__'
 
-class ELDLogSerializer(serializers.ModelSerializer):
+class ELDLogSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    image_url = serializers.SerializerMethodField()
+
+    def get_image_url(self, obj):
+        url = reverse('eld-log-image', args=[obj.id])
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(url)
+        absolute_url = self.context.get('absolute_url')
+        return absolute_url(url) if absolute_url else url
+
     class Meta:
         model = ELDLog
         fields = '__all__'
 
-class TripPlanSerializer(serializers.ModelSerializer):
+class TripPlanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     rest_stops = RestStopSerializer(many=True, read_only=True)
     eld_logs = ELDLogSerializer(many=True, read_only=True)
+    route_data = serializers.JSONField(required=False, allow_null=True)
     
     class Meta:
         model = TripPlan
-        fields = '__all__'
+        # The compact route columns are exposed through route_data
+        exclude = TripPlan.ROUTE_COLUMNS
+
+class TripPlanListSerializer(TripPlanSerializer):
+    """Trip plans for listing: route_data is only included with ?expand=route_data"""
+
+    class Meta(TripPlanSerializer.Meta):
+        expandable_fields = ('route_data',)
         
 class TripInputSerializer(serializers.Serializer):
     current_location = serializers.CharField(max_length=200)
@@ -34,3 +143,29 @@ class TripInputSerializer(serializers.Serializer):
     dropoff_location_coordinates = serializers.JSONField(required=False)
     current_cycle_used = serializers.FloatField()
     driver_id = serializers.IntegerField(required=False)
+    departure_objective = serializers.ChoiceField(choices=DEPARTURE_OBJECTIVES, required=False, default='elapsed')
+
+class ReplanInputSerializer(serializers.Serializer):
+    current_cycle_used = serializers.FloatField(required=False, min_value=0)
+    departure_time = serializers.DateTimeField(required=False)
+
+class HOSSimulationInputSerializer(serializers.Serializer):
+    """Scenario inputs; lists are broadcast against each other, or crossed with grid=true"""
+    distance_miles = serializers.ListField(
+        child=serializers.FloatField(min_value=0, max_value=getattr(settings, 'HOS_SIMULATION_MAX_MILES', 10000)),
+        allow_empty=False, max_length=getattr(settings, 'HOS_SIMULATION_MAX_SCENARIOS', 100000)
+    )
+    cycle_used = serializers.ListField(
+        child=serializers.FloatField(min_value=0, max_value=70),
+        allow_empty=False, max_length=getattr(settings, 'HOS_SIMULATION_MAX_SCENARIOS', 100000)
+    )
+    departure_hour = serializers.ListField(
+        child=serializers.FloatField(min_value=0, max_value=24), required=False, default=[0.0],
+        max_length=getattr(settings, 'HOS_SIMULATION_MAX_SCENARIOS', 100000)
+    )
+    grid = serializers.BooleanField(required=False, default=False)
+
+class PlanTripJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PlanTripJob
+        fields = ['id', 'status', 'stage', 'progress', 'result', 'error', 'created_at', 'started_at', 'finished_at']
@@ -1,17 +1,24 @@
-import requests
+import asyncio
 import json
 from datetime import datetime, timedelta
-import math
-import os
-import io
 import base64
-import matplotlib.pyplot as plt
-import cv2
-import matplotlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.http import JsonResponse
+from .asyncdb import db_sync_to_async
+from .caches import get_cache_stats, get_route_cache
+from .geocoding import GeocodeCache, normalize_address
+from .geometry import RouteGeometry
+from .hos import CLOCK_EPSILON, CYCLE_EPSILON, DRIVING_WINDOW, MILES_EPSILON, RULE_NAMES, recommend_departures
+from .image_cache import render_days
+from .metrics import in_request_context, record_renders, span
+from .ors import ORSError, get_async_ors_client, get_ors_client
+from .poi import FUEL_STOP_CATEGORIES, REST_STOP_CATEGORIES, get_poi_index
+from .rendering import get_renderer
+
+logger = logging.getLogger(__name__)
 
-matplotlib.use('Agg')
 
 class TripPlannerService:
     def __init__(self):
@@ -20,27 +27,96 @@ class TripPlannerService:
         self.MAX_DAILY_DUTY = 14     # Max on-duty hours per day
         self.MIN_REST_PERIOD = 10    # Min consecutive rest hours per day
         self.MAX_CYCLE_HOURS = 70    # Max duty hours in 8-day cycle
+        self.CYCLE_RESTART_HOURS = 34  # Off-duty hours that reset the cycle
         self.FUEL_DISTANCE = 1000    # Miles between fuel stops
+        self.FUEL_STOP_HOURS = 0.5   # On-duty hours per fuel stop
         self.PICKUP_DROPOFF_TIME = 1  # Hour for pickup/dropoff
         self.AVG_SPEED = 55          # Average speed in miles/hour
-        
-        # OpenRouteService API key and endpoint
-        self.ORS_API_KEY = '5b3ce3597851110001cf6248de17e0ce4e6a47d980377adb0d23441b'
-        self.ORS_ENDPOINT = 'https://api.openrouteservice.org/v2/directions/driving-hgv'
+        self.DRIVING_WINDOW = DRIVING_WINDOW  # (start, end) hour of the day driving is allowed
+        
+        # OpenRouteService API key and routing profile
+        self.ORS_API_KEY = settings.ORS_API_KEY
+        self.ORS_PROFILE = 'driving-hgv'
+        self.ors = get_ors_client()
+
+        # Geocode lookups are memoized for the lifetime of this service (one request)
+        # and persisted across requests in the geocode cache table
+        self.geocode_cache = GeocodeCache()
+        self._geocode_memo = {}
+        # Directions responses are cached per process for ROUTE_CACHE_TTL seconds
+        self.route_cache = get_route_cache()
     
     def _get_coordinates(self, location):
+        """Convert address to coordinates, using the geocode cache before hitting the API"""
+        stats = get_cache_stats('geocode')
+        key = normalize_address(location)
+        if key in self._geocode_memo:
+            stats.hit()
+            stats.incr('memo_hits')
+            return self._geocode_memo[key]
+
+        coordinates = self.geocode_cache.get(key)
+        if coordinates is not None:
+            stats.hit()
+        else:
+            stats.miss()
+            coordinates = self._geocode(location)
+            self.geocode_cache.set(key, coordinates)
+
+        self._geocode_memo[key] = coordinates
+        return coordinates
+
+    def get_coordinates_many(self, locations, max_workers=8):
+        """
+        Geocode several addresses at once, calling the API once per distinct
+        address. Cache reads and writes stay on this thread; only the API calls
+        run concurrently. Returns {normalized address: (coordinates, error)}.
+        """
+        stats = get_cache_stats('geocode')
+        results = {}
+        misses = {}
+        for location in locations:
+            key = normalize_address(location)
+            if key in results or key in misses:
+                continue
+            if key in self._geocode_memo:
+                stats.hit()
+                stats.incr('memo_hits')
+                results[key] = (self._geocode_memo[key], None)
+                continue
+            coordinates = self.geocode_cache.get(key)
+            if coordinates is not None:
+                stats.hit()
+                self._geocode_memo[key] = coordinates
+                results[key] = (coordinates, None)
+            else:
+                stats.miss()
+                misses[key] = location
+
+        def geocode(location):
+            try:
+                return self._geocode(location), None
+            except Exception as e:
+                return None, str(e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for key, (coordinates, error) in zip(misses, executor.map(in_request_context(geocode), misses.values())):
+                if error is None:
+                    self.geocode_cache.set(key, coordinates)
+                    self._geocode_memo[key] = coordinates
+                results[key] = (coordinates, error)
+        return results
+
+    def _geocode(self, location):
         """Convert address to coordinates using OpenRouteService geocoding API"""
-        geocode_url = 'https://api.openrouteservice.org/geocode/search'
-        response = requests.get(
-            geocode_url,
-            params={
-                'api_key': self.ORS_API_KEY,
-                'text': location,
-                'size': 1
-            },
-            timeout=300
-        )
-        
+        response = self.ors.geocode({
+            'text': location,
+            'size': 1
+        })
+        return self._parse_geocode(location, response)
+
+    @staticmethod
+    def _parse_geocode(location, response):
         if response.status_code != 200:
             raise Exception(f"Failed to geocode address: {response.text}")
         
@@ -51,19 +127,46 @@ class TripPlannerService:
         else:
             raise Exception(f"No coordinates found for location: {location}")
     
+    @span('route')
     def calculate_route(self, current_location, pickup_location, dropoff_location):
         """Calculate route using OpenRouteService API"""
         # Get coordinates for locations
         current_coords = self._get_coordinates(current_location)
         pickup_coords = self._get_coordinates(pickup_location)
         dropoff_coords = self._get_coordinates(dropoff_location)
-        
+        return self.route_between(current_coords, pickup_coords, dropoff_coords)
+
+    @staticmethod
+    def route_cache_key(profile, payload):
+        """Route cache key: the directions request with coordinates rounded to ROUTE_CACHE_PRECISION"""
+        precision = getattr(settings, 'ROUTE_CACHE_PRECISION', 5)
+        payload = dict(payload, coordinates=[
+            [round(float(value), precision) for value in point] for point in payload['coordinates']
+        ])
+        return json.dumps({'profile': profile, 'payload': payload}, sort_keys=True)
+
+    def route_between(self, current_coords, pickup_coords, dropoff_coords):
+        """Route through already geocoded current, pickup and dropoff coordinates"""
+        payload = self.directions_payload(current_coords, pickup_coords, dropoff_coords)
+
+        # Re-plans of the same trip (e.g. with a different cycle) reuse the route
+        cache_key = self.route_cache_key(self.ORS_PROFILE, payload)
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            route_data, geometry = cached
+        else:
+            response = self.ors.directions(self.ORS_PROFILE, payload)
+            route_data, geometry = self._parse_directions(response), None
+        return self._route_result(route_data, geometry, cache_key, payload['coordinates'])
+
+    def directions_payload(self, current_coords, pickup_coords, dropoff_coords):
+        """ORS directions request body for a trip"""
         # Build coordinates list for the API request
         # First leg: Current to Pickup
         # Second leg: Pickup to Dropoff
         coordinates = [current_coords, pickup_coords, dropoff_coords]
         
-        # Make API request to get the route
+        # Request options
         payload = {
             "coordinates": coordinates,
             "instructions": True,         # Include turn-by-turn directions
@@ -74,19 +177,18 @@ class TripPlannerService:
             "units": "m",                 # Meters
             "radiuses": [1000, 1000, 5000]
         }
+        return payload
 
-        headers = {
-            "Authorization": self.ORS_API_KEY,  # API Key in Authorization Header
-            "Content-Type": "application/json"
-        }
-
-        response = requests.post(self.ORS_ENDPOINT, json=payload, headers=headers, timeout=300)
-        
+    @staticmethod
+    def _parse_directions(response):
         if response.status_code != 200:
             raise Exception(f"Failed to calculate route: {response.text}")
-        
-        route_data = response.json()
-        
+        return response.json()
+
+    def _route_result(self, route_data, geometry, cache_key, coordinates):
+        """calculate_route's result for a directions response; caches it if it wasn't cached yet"""
+        current_coords, pickup_coords, dropoff_coords = coordinates
+
         # Extract distance and duration from the route data
         total_distance_meters = 0
         total_duration_seconds = 0
@@ -101,11 +203,21 @@ class TripPlannerService:
         
         # Add time for pickup and dropoff
         total_duration_hours += (2 * self.PICKUP_DROPOFF_TIME)  # 1 hour each for pickup and dropoff
+
+        if geometry is None:
+            geometry = RouteGeometry.from_route_data(route_data, total_miles=total_distance_miles)
+            self.route_cache.set(cache_key, (route_data, geometry))
         
         return {
             'route_data': route_data,
+            'geometry': geometry,
             'distance_miles': total_distance_miles,
-            'duration_hours': total_duration_hours
+            'duration_hours': total_duration_hours,
+            'coordinates': {
+                'current': current_coords,
+                'pickup': pickup_coords,
+                'dropoff': dropoff_coords
+            }
         }
         
     def get_stop_coordinates(self, query, lon=None, lat=None):
@@ -113,10 +225,18 @@ class TripPlannerService:
         Get coordinates of a fuel stop or rest stop using ORS API.
         - query: "fuel stop" or "rest stop"
         - lon, lat: Optional coordinates for better accuracy
+        Returns None when the lookup fails, so one bad stop doesn't sink the plan.
         """
-        url = f"https://api.openrouteservice.org/geocode/search"
+        try:
+            response = self.ors.geocode(self._stop_params(query, lon, lat))
+            return self._parse_stop(response)
+        except (ORSError, ValueError):
+            logger.warning("POI lookup for %s near %s, %s failed", query, lon, lat, exc_info=True)
+            return None
+
+    @staticmethod
+    def _stop_params(query, lon=None, lat=None):
         params = {
-            "api_key": self.ORS_API_KEY,
             "text": query,
             "boundary.country": "USA",
             "size": 1  # Get the top result
@@ -124,8 +244,12 @@ class TripPlannerService:
         if lon and lat:
             params["focus.point.lon"] = lon
             params["focus.point.lat"] = lat  # Improve accuracy
-        
-        response = requests.get(url, params=params)
+        return params
+
+    @staticmethod
+    def _parse_stop(response):
+        if response.status_code != 200:
+            return None
         data = response.json()
 
         if data.get("features"):
@@ -133,10 +257,42 @@ class TripPlannerService:
             return {"longitude": location[0], "latitude": location[1]}
         return None
     
-    def plan_rest_stops(self, route_data, current_cycle_used, current_location_coordinates, pickup_location_coordinates, dropoff_location_coordinates):
-        """Plan rest stops based on route data and HOS regulations"""
-        
+    @span('rest_stops')
+    def plan_rest_stops(self, route_data, current_cycle_used, current_location_coordinates, pickup_location_coordinates, dropoff_location_coordinates,
+                        departure_time=None, known_locations=None, remote_lookup=True):
+        """
+        Plan rest stops based on route data and HOS regulations.
+        `known_locations` maps (is_fuel_stop, rounded mile marker) to a location
+        found earlier, and remote_lookup=False keeps POI lookups off the network.
+        """
+        plan = self._schedule_rest_stops(
+            route_data, current_cycle_used,
+            [current_location_coordinates, pickup_location_coordinates, dropoff_location_coordinates],
+            departure_time, known_locations
+        )
+        self.resolve_stop_locations(plan['rest_stops'], remote_lookup=remote_lookup)
+        return plan
+
+    def _schedule_rest_stops(self, route_data, current_cycle_used, waypoints, departure_time=None, known_locations=None):
+        """plan_rest_stops up to the POI lookups"""
+        plan = self.simulate_rest_stops(route_data, current_cycle_used, departure_time=departure_time)
+        self.place_stops_on_route(plan['rest_stops'], route_data, waypoints)
+        if known_locations:
+            for stop in plan['rest_stops']:
+                stop['location'] = known_locations.get((stop['is_fuel_stop'], round(stop['mile_marker'])))
+        return plan
+
+    def simulate_rest_stops(self, route_data, current_cycle_used, departure_time=None):
+        """
+        Run the HOS simulation without any network calls.
+        Stops are emitted with location=None and their mile marker;
+        place_stops_on_route and resolve_stop_locations fill in the rest.
+        Driving only happens inside DRIVING_WINDOW, as in generate_eld_logs:
+        a departure outside it waits for it to open, and a driver on the road
+        when it closes rests until it opens again (at least MIN_REST_PERIOD).
+        """
         total_miles = route_data['distance_miles']
+        window_open, window_close = self.DRIVING_WINDOW
         
         # Initialize planning variables
         remaining_daily_driving = self.MAX_DAILY_DRIVING
@@ -145,7 +301,7 @@ class TripPlannerService:
         miles_since_last_fuel = 0
         
         # Calculate initial departure time
-        start_time = datetime.now().replace(minute=0, second=0, microsecond=0)
+        start_time = departure_time or self.default_departure_time()
         current_time = start_time
         
         # List to store rest stops
@@ -159,24 +315,60 @@ class TripPlannerService:
         while miles_traveled < total_miles:
             # Calculate how many miles can be driven before HOS limits
             drivable_hours = min(remaining_daily_driving, remaining_daily_duty, remaining_cycle_hours)
+
+            clock = self.clock_hour(current_time)
+            if not window_open - CLOCK_EPSILON <= clock < window_close - CLOCK_EPSILON:
+                # Outside the driving window: wait at the start, otherwise rest until it opens
+                wait_hours = (window_open - clock) % 24
+                if miles_traveled > 0 or rest_stops:
+                    wait_hours = max(wait_hours, self.MIN_REST_PERIOD)
+                    rest_stops.append({
+                        'location': None,  # Resolved by resolve_stop_locations
+                        'poi_query': "coffee shop",
+                        'mile_marker': miles_traveled,
+                        'arrival_time': current_time,
+                        'departure_time': current_time + timedelta(hours=wait_hours),
+                        'rest_duration': wait_hours,
+                        'is_fuel_stop': False
+                    })
+                    remaining_daily_driving = self.MAX_DAILY_DRIVING
+                    remaining_daily_duty = self.MAX_DAILY_DUTY
+                current_time += timedelta(hours=wait_hours)
+                continue
+            drivable_hours = min(drivable_hours, window_close - clock)
             drivable_miles = drivable_hours * self.AVG_SPEED
-            
-            # Dynamically calculate stop coordinates based on progress
-            current_lon = (
-                pickup_location_coordinates[0] +
-                ((dropoff_location_coordinates[0] - pickup_location_coordinates[0]) * (miles_traveled / total_miles))
-            )
-            current_lat = (
-                pickup_location_coordinates[1] +
-                ((dropoff_location_coordinates[1] - pickup_location_coordinates[1]) * (miles_traveled / total_miles))
-            )
 
-            # Check if we need a fuel stop
-            if miles_since_last_fuel + drivable_miles > self.FUEL_DISTANCE:
-                # Calculate where the fuel stop will be
-                miles_to_fuel = self.FUEL_DISTANCE - miles_since_last_fuel
-                hours_to_fuel = miles_to_fuel / self.AVG_SPEED
-                
+            if remaining_cycle_hours < CYCLE_EPSILON:
+                # Cycle exhausted (e.g. by a fuel stop): take a 34-hour restart
+                restart_hours = self.rest_until_window(current_time, self.CYCLE_RESTART_HOURS)
+                rest_stops.append({
+                    'location': None,  # Resolved by resolve_stop_locations
+                    'poi_query': "coffee shop",
+                    'mile_marker': miles_traveled,
+                    'arrival_time': current_time,
+                    'departure_time': current_time + timedelta(hours=restart_hours),
+                    'rest_duration': restart_hours,
+                    'is_fuel_stop': False
+                })
+                current_time += timedelta(hours=restart_hours)
+                remaining_cycle_hours = self.MAX_CYCLE_HOURS
+                remaining_daily_driving = self.MAX_DAILY_DRIVING
+                remaining_daily_duty = self.MAX_DAILY_DUTY
+                continue
+
+            # Check if we need a fuel stop before reaching the destination
+            miles_to_fuel = self.FUEL_DISTANCE - miles_since_last_fuel
+            hours_to_fuel = miles_to_fuel / self.AVG_SPEED
+            fuel_due = (miles_since_last_fuel + drivable_miles > self.FUEL_DISTANCE
+                        and miles_traveled + miles_to_fuel < total_miles)
+            # The fuel stop is on duty, so the cycle has to last until it's done
+            fuel_fits = hours_to_fuel + self.FUEL_STOP_HOURS <= remaining_cycle_hours + CYCLE_EPSILON
+            if fuel_due and not fuel_fits:
+                # Drive to the pump and take the restart there; refuel after it
+                drivable_hours = hours_to_fuel
+                drivable_miles = miles_to_fuel
+
+            if fuel_due and fuel_fits:
                 # Update trackers
                 miles_traveled += miles_to_fuel
                 hours_driven += hours_to_fuel
@@ -184,21 +376,20 @@ class TripPlannerService:
                 
                 remaining_daily_driving -= hours_to_fuel
                 remaining_daily_duty -= hours_to_fuel
-                remaining_cycle_hours -= hours_to_fuel
+                # Driving and the on-duty fuel stop both count towards the cycle
+                remaining_cycle_hours -= hours_to_fuel + self.FUEL_STOP_HOURS
                 
                 # Add a short rest/fuel stop (30 min)
                 fuel_stop_arrival = current_time + timedelta(hours=hours_to_fuel)
-                fuel_stop_departure = fuel_stop_arrival + timedelta(minutes=30)
+                fuel_stop_departure = fuel_stop_arrival + timedelta(hours=self.FUEL_STOP_HOURS)
 
-                # Get actual fuel stop location
-                fuel_stop_coords = self.get_stop_coordinates("gas station", lon=current_lon, lat=current_lat)
-                fuel_stop_location = fuel_stop_coords if fuel_stop_coords else "Unknown fuel stop"
-                
                 rest_stops.append({
-                    'location': fuel_stop_location,
+                    'location': None,  # Resolved by resolve_stop_locations
+                    'poi_query': "gas station",
+                    'mile_marker': miles_traveled,
                     'arrival_time': fuel_stop_arrival,
                     'departure_time': fuel_stop_departure,
-                    'rest_duration': 0.5,  # 30 minutes
+                    'rest_duration': self.FUEL_STOP_HOURS,
                     'is_fuel_stop': True
                 })
                 
@@ -206,7 +397,7 @@ class TripPlannerService:
                 current_time = fuel_stop_departure
                 
                 # Subtract rest time from daily duty
-                remaining_daily_duty -= 0.5
+                remaining_daily_duty -= self.FUEL_STOP_HOURS
             
             else:
                 # Check if we can complete the remainder of the journey
@@ -217,6 +408,7 @@ class TripPlannerService:
                     # We can complete the journey without another rest
                     miles_traveled = total_miles
                     hours_driven += hours_needed
+                    remaining_cycle_hours -= hours_needed
                     current_time += timedelta(hours=hours_needed)
                 else:
                     # Drive as far as allowed by HOS, then take required rest
@@ -227,19 +419,24 @@ class TripPlannerService:
                     # Update time
                     current_time += timedelta(hours=drivable_hours)
                     
-                    # Calculate rest duration
-                    rest_hours = self.MIN_REST_PERIOD
+                    # When the cycle is what stopped the driver, only a 34-hour restart
+                    # lets them drive again; a 10-hour rest would leave them stuck
+                    cycle_exhausted = fuel_due or drivable_hours >= remaining_cycle_hours - CYCLE_EPSILON
+                    remaining_cycle_hours -= drivable_hours
+                    if cycle_exhausted:
+                        rest_hours = self.rest_until_window(current_time, self.CYCLE_RESTART_HOURS)
+                        remaining_cycle_hours = self.MAX_CYCLE_HOURS
+                    else:
+                        rest_hours = self.rest_until_window(current_time, self.MIN_REST_PERIOD)
                     
                     # Add rest stop
                     rest_stop_arrival = current_time
                     rest_stop_departure = rest_stop_arrival + timedelta(hours=rest_hours)
 
-                    # Get actual rest stop location
-                    rest_stop_coords = self.get_stop_coordinates("coffee shop", lon=current_lon, lat=current_lat)
-                    rest_stop_location = rest_stop_coords if rest_stop_coords else "Unknown rest stop"
-                    
                     rest_stops.append({
-                        'location': rest_stop_location,
+                        'location': None,  # Resolved by resolve_stop_locations
+                        'poi_query': "coffee shop",
+                        'mile_marker': miles_traveled,
                         'arrival_time': rest_stop_arrival,
                         'departure_time': rest_stop_departure,
                         'rest_duration': rest_hours,
@@ -262,21 +459,214 @@ class TripPlannerService:
             'rest_stops': rest_stops
         }
     
+    @staticmethod
+    def clock_hour(moment):
+        """Hour of the day of a datetime, with the minutes and seconds as a fraction"""
+        return moment.hour + moment.minute / 60 + (moment.second + moment.microsecond / 1e6) / 3600
+
+    def rest_until_window(self, start, hours):
+        """Length of a rest of at least `hours` from `start` that ends inside DRIVING_WINDOW"""
+        window_open, window_close = self.DRIVING_WINDOW
+        clock = (self.clock_hour(start) + hours) % 24
+        if window_open - CLOCK_EPSILON <= clock < window_close - CLOCK_EPSILON:
+            return hours
+        return hours + (window_open - clock) % 24
+
+    @staticmethod
+    def default_departure_time():
+        """Departure assumed when none is given: the start of the current hour"""
+        return datetime.now().replace(minute=0, second=0, microsecond=0)
+
+    def recommend_departures(self, route_data, current_cycle_used, earliest=None, objective='elapsed'):
+        """
+        Best departure times over the search window for this route, ranked by
+        `objective` ('elapsed' or 'rests'). All candidates are simulated in one
+        vectorized pass with this service's HOS limits, so it is cheap enough
+        to run on every plan.
+        """
+        return recommend_departures(
+            route_data['distance_miles'],
+            current_cycle_used,
+            earliest or self.default_departure_time(),
+            window_hours=getattr(settings, 'DEPARTURE_SEARCH_HOURS', 48),
+            step_minutes=getattr(settings, 'DEPARTURE_SEARCH_STEP_MINUTES', 15),
+            objective=objective,
+            limit=getattr(settings, 'DEPARTURE_RECOMMENDATIONS', 5),
+            rules={name: getattr(self, name) for name in RULE_NAMES},
+            driving_window=self.DRIVING_WINDOW,
+        )
+
+    def place_stops_on_route(self, rest_stops, route_data, waypoints):
+        """
+        Set each stop's search point to the route coordinate at its mile marker.
+        Falls back to straight lines between the waypoints when the route has
+        no geometry.
+        """
+        if not rest_stops:
+            return rest_stops
+
+        geometry = route_data.get('geometry')
+        if geometry is None:
+            geometry = RouteGeometry(waypoints, total_miles=route_data['distance_miles'])
+
+        points = geometry.points_at([stop['mile_marker'] for stop in rest_stops])
+        for stop, point in zip(rest_stops, points.tolist()):
+            stop['search_point'] = point
+        return rest_stops
+
+    @span('poi')
+    def resolve_stop_locations(self, rest_stops, remote_lookup=True):
+        """
+        Find the POI for every planned stop. Stops the local index can't serve
+        are looked up on ORS in parallel (unless remote_lookup or the
+        POI_REMOTE_FALLBACK setting is False) and merged back in stop order;
+        stops without a match get a placeholder name as before.
+        """
+        pending = self._resolve_locally(rest_stops)
+        if not pending:
+            return rest_stops
+
+        if not remote_lookup or not getattr(settings, 'POI_REMOTE_FALLBACK', True):
+            return self._apply_stop_lookups(pending, [None] * len(pending))
+
+        def lookup(stop):
+            lon, lat = stop['search_point']
+            return self.get_stop_coordinates(stop['poi_query'], lon=lon, lat=lat)
+
+        max_workers = min(len(pending), getattr(settings, 'POI_LOOKUP_WORKERS', 8))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(in_request_context(lookup), pending))
+        self._apply_stop_lookups(pending, results)
+        return rest_stops
+
+    def _resolve_locally(self, rest_stops):
+        """Fill in stops the local POI index can serve; returns the stops still without a location"""
+        # Nearest stop from the local POI index first, ORS search for the rest
+        index = get_poi_index()
+        max_miles = getattr(settings, 'POI_MAX_DISTANCE_MILES', 25)
+        for stop in rest_stops:
+            if stop['location'] is None:
+                lon, lat = stop['search_point']
+                categories = FUEL_STOP_CATEGORIES if stop['is_fuel_stop'] else REST_STOP_CATEGORIES
+                poi = index.nearest(lon, lat, categories=categories, max_miles=max_miles)
+                if poi:
+                    stop['location'] = {"longitude": poi['longitude'], "latitude": poi['latitude']}
+
+        return [stop for stop in rest_stops if stop['location'] is None]
+
+    @staticmethod
+    def _apply_stop_lookups(stops, results):
+        """Set each stop's looked-up location, or a placeholder name when nothing was found"""
+        for stop, coords in zip(stops, results):
+            if coords:
+                stop['location'] = coords
+            else:
+                stop['location'] = "Unknown fuel stop" if stop['is_fuel_stop'] else "Unknown rest stop"
+        return stops
+    
+    # Async counterparts of the network-bound steps, for the async views. They
+    # share parsing and caching with the sync methods above; the geocode cache
+    # and POI index live in the database, so they go through db_sync_to_async.
+
+    @property
+    def aors(self):
+        return get_async_ors_client()
+
+    async def aget_coordinates(self, location):
+        stats = get_cache_stats('geocode')
+        key = normalize_address(location)
+        if key in self._geocode_memo:
+            stats.hit()
+            stats.incr('memo_hits')
+            return self._geocode_memo[key]
+
+        coordinates = await db_sync_to_async(self.geocode_cache.get)(key)
+        if coordinates is not None:
+            stats.hit()
+        else:
+            stats.miss()
+            response = await self.aors.geocode({'text': location, 'size': 1})
+            coordinates = self._parse_geocode(location, response)
+            await db_sync_to_async(self.geocode_cache.set)(key, coordinates)
+
+        self._geocode_memo[key] = coordinates
+        return coordinates
+
+    @span('route')
+    async def acalculate_route(self, current_location, pickup_location, dropoff_location):
+        """calculate_route with the distinct addresses geocoded concurrently"""
+        locations = [current_location, pickup_location, dropoff_location]
+        distinct = {normalize_address(location): location for location in locations}
+        coordinates = dict(zip(distinct, await asyncio.gather(*map(self.aget_coordinates, distinct.values()))))
+        return await self.aroute_between(*(coordinates[normalize_address(location)] for location in locations))
+
+    async def aroute_between(self, current_coords, pickup_coords, dropoff_coords):
+        payload = self.directions_payload(current_coords, pickup_coords, dropoff_coords)
+        cache_key = self.route_cache_key(self.ORS_PROFILE, payload)
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            route_data, geometry = cached
+        else:
+            response = await self.aors.directions(self.ORS_PROFILE, payload)
+            route_data, geometry = self._parse_directions(response), None
+        return self._route_result(route_data, geometry, cache_key, payload['coordinates'])
+
+    async def aget_stop_coordinates(self, query, lon=None, lat=None):
+        try:
+            return self._parse_stop(await self.aors.geocode(self._stop_params(query, lon, lat)))
+        except (ORSError, ValueError):
+            logger.warning("POI lookup for %s near %s, %s failed", query, lon, lat, exc_info=True)
+            return None
+
+    @span('rest_stops')
+    async def aplan_rest_stops(self, route_data, current_cycle_used, current_location_coordinates, pickup_location_coordinates,
+                               dropoff_location_coordinates, departure_time=None, known_locations=None, remote_lookup=True):
+        # The HOS simulation is CPU work, so it runs on the executor rather than the event loop
+        plan = await sync_to_async(self._schedule_rest_stops, thread_sensitive=False)(
+            route_data, current_cycle_used,
+            [current_location_coordinates, pickup_location_coordinates, dropoff_location_coordinates],
+            departure_time, known_locations
+        )
+        await self.aresolve_stop_locations(plan['rest_stops'], remote_lookup=remote_lookup)
+        return plan
+
+    @span('poi')
+    async def aresolve_stop_locations(self, rest_stops, remote_lookup=True):
+        """resolve_stop_locations with every remote lookup in flight at once"""
+        await db_sync_to_async(get_poi_index)()  # Built from the database on first use
+        pending = self._resolve_locally(rest_stops)
+        if not pending:
+            return rest_stops
+
+        if not remote_lookup or not getattr(settings, 'POI_REMOTE_FALLBACK', True):
+            results = [None] * len(pending)
+        else:
+            results = await asyncio.gather(*(
+                self.aget_stop_coordinates(stop['poi_query'], lon=stop['search_point'][0], lat=stop['search_point'][1])
+                for stop in pending
+            ))
+        self._apply_stop_lookups(pending, results)
+        return rest_stops
+
+    @span('eld_logs')
     def generate_eld_logs(self, trip_plan_data, rest_stops_data, current_cycle_used):
         """
         Generate structured ELD logs ensuring each day totals 24 hours.
         Includes on-duty, off-duty, driving, and rest periods while enforcing compliance.
         """
-        print(rest_stops_data)
         departure_time = rest_stops_data['departure_time']
         rest_stops = rest_stops_data['rest_stops']
         total_miles_remaining = rest_stops_data['total_miles']
+        logger.debug(
+            "Generating ELD logs for %.1f miles with %d rest stops", total_miles_remaining, len(rest_stops),
+            extra={'total_miles': total_miles_remaining, 'rest_stops': len(rest_stops), 'departure_time': departure_time},
+        )
         total_cycle_hours_used = current_cycle_used
 
         current_day = departure_time.date()
         eld_logs = []
 
-        while total_miles_remaining > 0 and total_cycle_hours_used < self.MAX_CYCLE_HOURS:
+        while total_miles_remaining > MILES_EPSILON and total_cycle_hours_used < self.MAX_CYCLE_HOURS:
             day_log = {
                 'date': current_day,
                 'log_entries': [],
@@ -346,33 +736,6 @@ class TripPlannerService:
                 total_miles_remaining -= (driving_hours_today * 55)
                 current_time = driving_end_time
 
-            # Process rest stops
-            # day_rest_stops = [stop for stop in rest_stops if stop['arrival_time'].date() == current_day]
-            # for stop in day_rest_stops:
-            #     if current_time < stop['arrival_time']:
-            #         # Add driving until the rest stop if applicable
-            #         day_log['log_entries'].append({
-            #             'status': 'driving',
-            #             'start_hour': current_time.hour + current_time.minute / 60.0,
-            #             'end_hour': stop['arrival_time'].hour + stop['arrival_time'].minute / 60.0
-            #         })
-            #         day_log['total_driving_hours'] += (stop['arrival_time'] - current_time).total_seconds() / 3600
-            #         current_time = stop['arrival_time']
-
-            #     # Add rest stop
-            #     day_log['log_entries'].append({
-            #         'status': 'off_duty' if not stop['is_fuel_stop'] else 'on_duty',
-            #         'start_hour': stop['arrival_time'].hour + stop['arrival_time'].minute / 60.0,
-            #         'end_hour': stop['departure_time'].hour + stop['departure_time'].minute / 60.0
-            #     })
-
-            #     if stop['is_fuel_stop']:
-            #         day_log['total_on_duty_hours'] += 0.5
-            #     else:
-            #         day_log['total_off_duty_hours'] += stop['rest_duration']
-
-            #     current_time = stop['departure_time']
-
             # Ensure no off-duty period starts before the last activity ends
             last_end_hour = max(entry["end_hour"] for entry in day_log["log_entries"])
 
@@ -397,7 +760,10 @@ class TripPlannerService:
             )
 
             if round(day_log['total_hours'], 2) != 24.0:
-                print(f"Warning: Total hours for {current_day} is {day_log['total_hours']}, should be 24.")
+                logger.warning(
+                    "ELD log for %s totals %.3f hours instead of 24", current_day, day_log['total_hours'],
+                    extra={'date': current_day, 'total_hours': day_log['total_hours']},
+                )
 
             eld_logs.append(day_log)
             total_cycle_hours_used += (day_log['total_driving_hours'] + day_log['total_on_duty_hours'])
@@ -405,85 +771,6 @@ class TripPlannerService:
 
         return eld_logs
 
-
-    def _add_driving_entry(self, day_log, start_time, end_time):
-        """ Helper to add driving entries ensuring compliance with daily limits """
-        start_hour = start_time.hour + start_time.minute / 60.0
-        end_hour = end_time.hour + end_time.minute / 60.0
-
-        driving_hours = end_hour - start_hour
-
-        # Ensure driving does not go past 24.0 (end of day)
-        if end_hour > 24.0:
-            driving_hours = 24.0 - start_hour
-            end_hour = 24.0
-
-        # Ensure driving does not start after 22.0
-        if start_hour >= 22.0:
-            return  # No driving allowed past 22.0
-
-        # Ensure driving does not exceed max daily limit
-        if day_log['total_driving_hours'] + driving_hours > self.MAX_DAILY_DRIVING:
-            driving_hours = self.MAX_DAILY_DRIVING - day_log['total_driving_hours']
-            end_hour = start_hour + driving_hours
-
-        # Ensure valid driving hours
-        if driving_hours > 0:
-            day_log['log_entries'].append({
-                'status': 'driving',
-                'start_hour': start_hour,
-                'end_hour': end_hour
-            })
-            day_log['total_driving_hours'] += driving_hours
-            day_log['total_on_duty_hours'] += driving_hours
-
-
-    def _add_rest_entry(self, day_log, stop):
-        """ Helper to add rest entries correctly handling fuel stops and sleep breaks """
-        rest_start_hour = stop['arrival_time'].hour + stop['arrival_time'].minute / 60.0
-        rest_end_hour = stop['departure_time'].hour + stop['departure_time'].minute / 60.0
-
-        # Ensure rest period does not exceed 24.0 (end of day)
-        if rest_end_hour > 24.0:
-            rest_end_hour = 24.0
-
-        # Ensure valid rest times
-        if rest_start_hour >= rest_end_hour:
-            return  # Skip invalid entries
-
-        if stop['is_fuel_stop']:
-            # Fuel stops are on-duty for 30 min, then off-duty if time allows
-            fuel_end = min(rest_start_hour + 0.5, rest_end_hour)
-            day_log['log_entries'].append({
-                'status': 'on_duty',
-                'start_hour': rest_start_hour,
-                'end_hour': fuel_end
-            })
-            day_log['total_on_duty_hours'] += fuel_end - rest_start_hour
-
-            # If there's remaining time, switch to off-duty
-            if fuel_end < rest_end_hour:
-                day_log['log_entries'].append({
-                    'status': 'off_duty',
-                    'start_hour': fuel_end,
-                    'end_hour': rest_end_hour
-                })
-                day_log['total_off_duty_hours'] += rest_end_hour - fuel_end
-        else:
-            # Regular rest stops
-            day_log['log_entries'].append({
-                'status': 'off_duty',
-                'start_hour': rest_start_hour,
-                'end_hour': rest_end_hour
-            })
-            
-            rest_duration = rest_end_hour - rest_start_hour
-            if stop.get('is_sleeper_berth', False):
-                day_log['total_sleeper_hours'] += rest_duration
-            else:
-                day_log['total_off_duty_hours'] += rest_duration
-
-            
     def generate_eld_drawing_data(self, eld_logs):
         """
         Convert ELD logs into a structured format for drawing logs on a PNG.
@@ -491,106 +778,32 @@ class TripPlannerService:
         formatted_logs = []
         
         for log in eld_logs:
-            day_data = []
-            for entry in log['log_entries']:
-                day_data.append((entry['start_hour'], entry['status']))
-                day_data.append((entry['end_hour'], entry['status']))
-            formatted_logs.append({'date': log['date'], 'entries': day_data})
+            formatted_logs.append({'date': log['date'], 'entries': self.drawing_entries(log['log_entries'])})
         
         return formatted_logs
+
+    @staticmethod
+    def drawing_entries(log_entries):
+        """Turn one day's log entries into the (hour, status) points the renderers draw"""
+        day_data = []
+        for entry in log_entries:
+            day_data.append((entry['start_hour'], entry['status']))
+            day_data.append((entry['end_hour'], entry['status']))
+        return day_data
     
     def generate_image_url(self, image_filename):
         """Generate a media URL for the image."""
         return f"{settings.MEDIA_URL}{image_filename}"
     
-    def draw_eld_lines(self, hours):
-        # Define media directory
-        media_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media")
-        if not os.path.exists(media_dir):
-            os.makedirs(media_dir)
-        # Load the image
-        image_path = os.path.abspath("blank-paper-log.png")
-        img = cv2.imread(image_path)
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Define the log graph area coordinates
-        height, width, _ = img.shape
-        graph_top = int(height * 0.376)
-        graph_bottom = int(height * 0.47)
-        graph_left = int(width * 0.1265)
-        graph_right = int(width * 0.885)
-        hour_step = (graph_right - graph_left) / 24
-        
-        # Define duty status levels (approximate pixel positions)
-        status_levels = {
-            'off_duty': graph_top,
-            'sleeper': graph_top + (graph_bottom - graph_top) * 0.35,
-            'driving': graph_top + (graph_bottom - graph_top) * 0.645,
-            'on_duty': graph_bottom
-        }
-        
-        # Create a figure
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.imshow(img)
-        
-        # Draw ELD lines
-        prev_x, prev_y = None, None
-        prev_hour = None
-        total_hours = {"off_duty": 0, "sleeper": 0, "driving": 0, "on_duty": 0}
-        for i, (hour, status) in enumerate(hours):
-            x = graph_left + hour * hour_step
-            y = status_levels[status]
-            
-            if prev_x is not None and prev_y is not None:
-                ax.scatter([x, x], [prev_y, y], color='red', s=10, zorder=2)
-                ax.scatter(prev_x, prev_y, color='red', s=10, zorder=2)
-                ax.scatter(x, y, color='red', s=10, zorder=2)
-                ax.plot([x, x], [prev_y, y], color='black', linewidth=1, zorder=1)
-                ax.plot([prev_x, x], [prev_y, prev_y], color='black', linewidth=1, zorder=1)
-                
-                # Correctly calculate the duration for each status
-            if prev_hour is not None:
-                duration = hour - prev_hour
-                total_hours[status] += duration
-            
-            prev_x, prev_y = x, y
-            prev_hour = hour
-        
-        # Ensure the last point extends to the end
-        last_x = graph_right
-        ax.plot([prev_x, last_x], [prev_y, prev_y], color='black', linewidth=1, zorder=1)
-        ax.scatter(last_x, prev_y, color='red', s=10, zorder=2)
-        
-        # Display total hours beside the logs
-        for status, hours in total_hours.items():
-            y_pos = status_levels[status] + 5
-            ax.text(graph_right + 20, y_pos, f"{hours:.2f}", fontsize=6, color='black', ha='center')
-            
-        # Calculate total on-duty and driving time
-        total_on_duty = total_hours["on_duty"] + total_hours["driving"]
-        
-        # Draw red circle around total on-duty and driving time
-        circle_x = graph_right - 50
-        circle_y = graph_bottom + 60
-        circle_radius = 30
-        ax.add_patch(plt.Circle((circle_x, circle_y), circle_radius, color='red', fill=False, linewidth=2))
-        ax.text(circle_x, circle_y, f"{total_on_duty:.2f}", fontsize=10, color='black', weight='bold', ha='center', va='center')
-        
-        # Generate filename & save the image in MEDIA_ROOT
-        image_filename = f"eld_log_{datetime.now().strftime('%Y%m%d%H%M%S')}{i}.png"
-        # Save to in-memory buffer
-        buffer = io.BytesIO()
-        plt.axis("off")
-        plt.savefig(buffer, format="png", bbox_inches="tight", dpi=300)
-        plt.close(fig)
-        
-        buffer.seek(0)
-        
-        # Convert to base64
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    def draw_eld_lines(self, hours, renderer=None):
+        """Render one day's log with the configured ELD renderer and return it base64-encoded"""
+        renderer = renderer or get_renderer()
+        with span('render'):
+            png = renderer.render(hours)
+        record_renders(renderer.name, 1)
 
-        # Return JSON response instead of HttpResponse
-        return image_base64
+        # Convert to base64
+        return base64.b64encode(png).decode('utf-8')
         
     def generate_and_draw_eld_logs(self, eld_logs):
         """
@@ -598,15 +811,11 @@ class TripPlannerService:
         Generate a separate PNG file for each day's ELD log.
         """
         drawing_data = self.generate_eld_drawing_data(eld_logs)
-        image_paths = []
-
-        for log in drawing_data:
-            date_str = log['date'].strftime('%Y-%m-%d')  # Ensure date format is correct
-            print(f"Drawing log for date: {date_str}")
 
-            # Save a separate image for each day's ELD log
-            image_path = self.draw_eld_lines(log['entries'])  
-            image_paths.append(image_path)  # Append each day's image path separately
+        # Previously rendered days come from the image cache; the rest are
+        # rendered concurrently on the render pool, in date order
+        images = render_days([log['entries'] for log in drawing_data])
+        image_paths = [base64.b64encode(png).decode('utf-8') for png in images]
 
-        print(f"✅ Total images saved: {len(image_paths)}")
+        logger.info("Rendered %d ELD log images", len(image_paths), extra={'days': len(image_paths)})
         return drawing_data, image_paths
\ No newline at end of file
@@ -0,0 +1,72 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+
+def format_sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, cls=DjangoJSONEncoder)}\n\n"
+
+
+def format_ndjson(event, payload):
+    return json.dumps({'event': event, 'data': payload}, cls=DjangoJSONEncoder) + "\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Server-Sent Events; a non-streamed response (e.g. a 400) is sent as one 'error' event"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    @staticmethod
+    def format_event(event, payload):
+        return format_sse(event, payload)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return self.format_event('error', data).encode('utf-8')
+
+
+class NDJSONRenderer(EventStreamRenderer):
+    """One {"event", "data"} JSON object per line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    @staticmethod
+    def format_event(event, payload):
+        return format_ndjson(event, payload)
+
+
+def event_stream(events, renderer=None, asynchronous=False):
+    """
+    StreamingHttpResponse that writes each (event, payload) pair from `events`
+    as it is produced, in the format of `renderer` (Server-Sent Events by
+    default). A failure part way through becomes a final 'error' event since
+    the status line has already been sent. Under ASGI pass asynchronous=True:
+    Django reads a synchronous stream to the end before sending any of it
+    there, so the events are pulled one at a time on the executor instead.
+    """
+    if not isinstance(renderer, EventStreamRenderer):
+        renderer = EventStreamRenderer()
+
+    def stream():
+        try:
+            for event, payload in events:
+                yield renderer.format_event(event, payload)
+        except Exception as e:
+            yield renderer.format_event('error', {'error': str(e)})
+            return
+        yield renderer.format_event('done', {})
+
+    async def astream():
+        parts = stream()
+        next_part = sync_to_async(next, thread_sensitive=False)
+        while (part := await next_part(parts, None)) is not None:
+            yield part
+
+    content = astream() if asynchronous else stream()
+    response = StreamingHttpResponse(content, content_type=f"{renderer.media_type}; charset={renderer.charset}")
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let a proxy buffer the stream
+    return response
@@ -1,3 +1,1243 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+import warnings
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .benchmarks import compare_results
+from .caches import get_cache_stats, get_route_cache
+from .geocoding import normalize_address
+from .geometry import RouteGeometry, decode_polyline, encode_polyline, haversine_miles
+from .hos import recommend_departures, simulate_hos
+from .image_cache import ImageCache, render_days
+from .jobs import claim_job, claim_next_job, run_job
+from .models import Driver, GeocodeCacheEntry, PlanTripJob, PointOfInterest, TripPlan, RestStop, ELDLog
+from .metrics import span, start_timings, stop_timings
+from .mock_ors import ROAD_FACTOR, MockORS, start_in_thread
+from .ors import AsyncORSClient, ORSClient, ORSError
+from .poi import REST_STOP_CATEGORIES, POIIndex, load_pois, reset_poi_index
+from .rendering import ELDRenderer, get_renderer, render_many
+from .services import TripPlannerService
+
+
+class MockORSMixin:
+    """Runs the local ORS stand-in for the duration of a test"""
+
+    def serve_mock_ors(self, mock_ors=None):
+        """Start `mock_ors` (a synthetic MockORS by default) and return an ORSClient for it"""
+        server, base_url = start_in_thread(mock_ors or MockORS())
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return ORSClient(base_url=base_url, max_retries=0)
+
+    def use_mock_ors(self, mock_ors=None):
+        """serve_mock_ors, with TripPlannerService sending its requests there"""
+        client = self.serve_mock_ors(mock_ors)
+        patcher = mock.patch('tripapi.services.get_ors_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client
+
+
+class TempImageCacheMixin:
+    """Points the ELD image cache at a temporary directory for the duration of a test"""
+
+    def use_temp_image_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(ELD_IMAGE_CACHE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # get_image_cache builds a fresh cache from the overridden settings
+        patcher = mock.patch('tripapi.image_cache._image_cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return directory.name
+
+
+class TripPlanFixtureMixin:
+    """Five trip plans with two rest stops and two ELD logs each"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = Driver.objects.create(
+            name="Test Driver", license_number="T1", carrier_name="Carrier", home_terminal="Terminal"
+        )
+        for _ in range(5):
+            cls.create_trip_plan()
+
+    @classmethod
+    def create_trip_plan(cls):
+        trip = TripPlan.objects.create(
+            driver=cls.driver,
+            current_location="A",
+            pickup_location="B",
+            dropoff_location="C",
+            current_cycle_used=0,
+            route_data={'routes': [{'geometry': 'abc'}]},
+        )
+        arrival = timezone.make_aware(datetime(2025, 1, 6, 17, 0))
+        for day in range(2):
+            RestStop.objects.create(
+                trip=trip,
+                location="Rest Area",
+                arrival_time=arrival + timedelta(days=day),
+                departure_time=arrival + timedelta(days=day, hours=10),
+                rest_duration=10,
+            )
+            ELDLog.objects.create(trip=trip, date=date(2025, 1, 6 + day), log_data={'entries': []})
+        return trip
+
+
+class TripPlanListQueryTests(TripPlanFixtureMixin, TestCase):
+    """Listing trip plans must not issue queries per trip"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('tripplan-list')
+
+    def test_list_query_count_does_not_grow_with_trips(self):
+        # trip plans + rest stops + ELD logs
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['results']), 5)
+
+        for _ in range(5):
+            self.create_trip_plan()
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_list_is_cursor_paginated(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(len(next_page.data['results']), 2)
+        self.assertTrue(next_page.data['results'][0]['id'] < response.data['results'][-1]['id'])
+
+    def test_route_data_only_when_expanded(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('route_data', response.data['results'][0])
+        self.assertIn('rest_stops', response.data['results'][0])
+
+        response = self.client.get(self.url, {'expand': 'route_data'})
+        self.assertEqual(response.data['results'][0]['route_data'], {'routes': [{'geometry': 'abc'}]})
+
+    def test_detail_includes_route_data(self):
+        trip = TripPlan.objects.first()
+        response = self.client.get(reverse('tripplan-detail', args=[trip.id]))
+        self.assertIn('route_data', response.data)
+
+
+class SparseFieldsetTests(TripPlanFixtureMixin, TestCase):
+    """?fields= and ?expand= on the trips and drivers APIs"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.trip = TripPlan.objects.first()
+
+    def test_fields_limits_trip_plan_output(self):
+        response = self.client.get(reverse('tripplan-detail', args=[self.trip.id]), {'fields': 'id,eld_logs.date'})
+        self.assertEqual(set(response.data), {'id', 'eld_logs'})
+        self.assertEqual(set(response.data['eld_logs'][0]), {'date'})
+
+    def test_unrequested_columns_and_relations_are_not_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('tripplan-detail', args=[self.trip.id]), {'fields': 'id,pickup_location'})
+        self.assertEqual(response.data, {'id': self.trip.id, 'pickup_location': 'B'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('route_details', queries[0]['sql'])
+        self.assertNotIn('route_geometry', queries[0]['sql'])
+
+    def test_nested_json_is_deferred(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('tripplan-list'), {'fields': 'id,eld_logs.date'})
+        self.assertFalse(any('log_data' in query['sql'] for query in queries))
+
+    def test_fields_can_name_an_expandable_field(self):
+        response = self.client.get(reverse('tripplan-list'), {'fields': 'id,route_data'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'route_data'})
+
+    def test_driver_fields(self):
+        response = self.client.get(reverse('driver-detail', args=[self.driver.id]), {'fields': 'name'})
+        self.assertEqual(response.data, {'name': 'Test Driver'})
+
+
+class ReplanTests(TestCase):
+    """Re-planning reuses the stored route and saves a new revision"""
+
+    def setUp(self):
+        self.client = APIClient()
+        driver = Driver.objects.create(
+            name="Test Driver", license_number="T1", carrier_name="Carrier", home_terminal="Terminal"
+        )
+        coordinates = [[-74.0, 40.7], [-87.6, 41.9], [-104.9, 39.7]]
+        self.trip = TripPlan.objects.create(
+            driver=driver,
+            current_location="New York, NY",
+            current_location_coordinates=coordinates[0],
+            pickup_location="Chicago, IL",
+            pickup_location_coordinates=coordinates[1],
+            dropoff_location="Denver, CO",
+            dropoff_location_coordinates=coordinates[2],
+            current_cycle_used=10,
+            route_data={'routes': [{'geometry': encode_polyline(coordinates), 'summary': {'distance': 2900000}}]},
+            estimated_miles=1800,
+            estimated_duration=34,
+        )
+        self.url = reverse('tripplan-replan', args=[self.trip.id])
+
+    def test_replan_saves_revision_without_network(self):
+        with mock.patch('tripapi.services.get_ors_client') as get_ors_client:
+            response = self.client.post(self.url, {
+                'current_cycle_used': 20, 'departure_time': '2025-01-06T06:00:00Z'
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        get_ors_client.return_value.geocode.assert_not_called()
+        get_ors_client.return_value.directions.assert_not_called()
+
+        revision = TripPlan.objects.get(id=response.data['trip_plan']['id'])
+        self.assertEqual((revision.parent_id, revision.revision), (self.trip.id, 2))
+        self.assertEqual(revision.current_cycle_used, 20)
+        self.assertEqual(revision.route_data, self.trip.route_data)
+        self.assertEqual(str(revision.rest_stops.order_by('arrival_time').first().arrival_time), '2025-01-06 17:00:00+00:00')
+
+    def test_unchanged_days_are_not_reported(self):
+        body = {'current_cycle_used': 20, 'departure_time': '2025-01-06T06:00:00Z'}
+        first = self.client.post(self.url, body, format='json')
+        self.assertEqual(len(first.data['changed_dates']), len(first.data['image_path']))
+
+        second = self.client.post(reverse('tripplan-replan', args=[first.data['trip_plan']['id']]), body, format='json')
+        self.assertEqual(second.data['changed_dates'], [])
+        self.assertEqual(second.data['trip_plan']['revision'], 3)
+
+    def test_replanning_the_same_plan_twice_numbers_the_lineage(self):
+        body = {'current_cycle_used': 20}
+        revisions = [self.client.post(self.url, body, format='json').data['trip_plan']['revision'] for _ in range(2)]
+        self.assertEqual(revisions, [2, 3])
+        branch = TripPlan.objects.get(revision=2, root=self.trip)
+        response = self.client.post(reverse('tripplan-replan', args=[branch.id]), body, format='json')
+        self.assertEqual(response.data['trip_plan']['revision'], 4)
+
+        duplicate = TripPlan.objects.get(revision=3, root=self.trip)
+        duplicate.pk = None
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            duplicate.save()
+
+    def test_exhausted_cycle_takes_a_restart(self):
+        # Used to loop forever once the fuel legs used up the remaining cycle
+        TripPlan.objects.filter(id=self.trip.id).update(estimated_miles=2969)
+        response = self.client.post(self.url, {'current_cycle_used': 60}, format='json')
+        self.assertEqual(response.status_code, 201)
+        # A restart is 34 hours, longer if it would end before the driving window opens
+        self.assertGreaterEqual(max(stop['rest_duration'] for stop in response.data['trip_plan']['rest_stops']), 34)
+
+
+class PlanTripBatchTests(MockORSMixin, TestCase):
+    """A batch geocodes each address once, reports failures per item and saves all plans or none"""
+
+    def setUp(self):
+        get_route_cache().clear()
+        self.use_mock_ors()
+
+    def post(self, trips, geocode=TripPlannerService._geocode):
+        with mock.patch.object(TripPlannerService, '_geocode', autospec=True, side_effect=geocode) as geocode_mock:
+            response = APIClient().post(reverse('plan-trip-batch'), {'trips': trips}, format='json')
+        return response, [call.args[1] for call in geocode_mock.call_args_list]
+
+    @staticmethod
+    def trip(current, pickup, dropoff, **extra):
+        return {'current_location': current, 'pickup_location': pickup, 'dropoff_location': dropoff,
+                'current_cycle_used': 10, **extra}
+
+    def test_each_distinct_address_is_geocoded_once(self):
+        response, geocoded = self.post([
+            self.trip('Dallas, TX', 'Fort Worth, TX', 'Austin, TX'),
+            self.trip(' dallas,  TX', 'Austin, TX', 'Houston, TX'),
+            self.trip('Houston, TX', 'Fort Worth, TX', 'Dallas, TX'),
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all('result' in item for item in response.data['results']))
+        self.assertEqual(sorted(normalize_address(address) for address in geocoded),
+                         ['austin, tx', 'dallas, tx', 'fort worth, tx', 'houston, tx'])
+        self.assertEqual(TripPlan.objects.count(), 3)
+
+    def test_failed_items_are_reported_next_to_the_successes(self):
+        real_geocode = TripPlannerService._geocode
+
+        def geocode(service, location):
+            if location == 'Atlantis':
+                raise Exception("Failed to geocode address: Atlantis")
+            return real_geocode(service, location)
+
+        response, _ = self.post([
+            self.trip('Dallas, TX', 'Fort Worth, TX', 'Austin, TX'),
+            {'current_location': 'Dallas, TX'},
+            self.trip('Dallas, TX', 'Fort Worth, TX', 'Austin, TX', driver_id=9999),
+            self.trip('Dallas, TX', 'Atlantis', 'Austin, TX'),
+        ], geocode=geocode)
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([item['index'] for item in results], [0, 1, 2, 3])
+        self.assertEqual(results[0]['result']['trip_plan']['current_location'], 'Dallas, TX')
+        self.assertIn('pickup_location', results[1]['error'])
+        self.assertEqual(results[2]['error'], "Driver not found")
+        self.assertEqual(results[3]['error'], "Failed to geocode address: Atlantis")
+        self.assertEqual(TripPlan.objects.count(), 1)
+
+    def test_results_match_plan_trip(self):
+        trip = self.trip('Dallas, TX', 'Fort Worth, TX', 'Austin, TX', departure_objective='rests')
+        response, _ = self.post([trip])
+        single = APIClient().post(reverse('plan-trip'), trip, format='json')
+        result = response.data['results'][0]['result']
+        self.assertEqual(set(result), set(single.data))
+        self.assertEqual(len(result['departure_options']), settings.DEPARTURE_RECOMMENDATIONS)
+        self.assertEqual(set(result['departure_options'][0]), set(single.data['departure_options'][0]))
+        rests = [option['rests'] for option in result['departure_options']]
+        self.assertEqual(rests, sorted(rests))
+
+    def test_a_failed_insert_saves_nothing(self):
+        trips = [self.trip('Dallas, TX', 'Fort Worth, TX', 'Austin, TX'), self.trip('Austin, TX', 'Houston, TX', 'Dallas, TX')]
+        with mock.patch.object(ELDLog.objects, 'bulk_create', side_effect=IntegrityError("insert failed")):
+            response, _ = self.post(trips)
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(TripPlan.objects.exists())
+        self.assertFalse(RestStop.objects.exists())
+
+
+class GeometryTests(SimpleTestCase):
+    """Polylines decode like the reference algorithm and mile markers land on the route"""
+
+    # The worked example from Google's polyline format documentation
+    GOOGLE_POLYLINE = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    GOOGLE_POINTS = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+
+    @staticmethod
+    def decode_reference(encoded):
+        """Character-by-character decoder, as in the format documentation"""
+        values, value, shift = [], 0, 0
+        for char in encoded:
+            chunk = ord(char) - 63
+            value |= (chunk & 0x1f) << shift
+            shift += 5
+            if chunk < 0x20:
+                values.append(~(value >> 1) if value & 1 else value >> 1)
+                value, shift = 0, 0
+        lat = lon = 0
+        points = []
+        for dlat, dlon in zip(values[::2], values[1::2]):
+            lat, lon = lat + dlat, lon + dlon
+            points.append([lon / 1e5, lat / 1e5])
+        return points
+
+    def test_decode_known_polyline(self):
+        np.testing.assert_allclose(decode_polyline(self.GOOGLE_POLYLINE), self.GOOGLE_POINTS)
+        self.assertEqual(decode_polyline('').shape, (0, 2))
+
+    def test_encode_known_polyline(self):
+        self.assertEqual(encode_polyline(self.GOOGLE_POINTS), self.GOOGLE_POLYLINE)
+
+    def test_round_trip_matches_the_reference_decoder(self):
+        rng = np.random.default_rng(0)
+        # A long wandering route with large jumps and both signs of every delta
+        points = np.round(np.cumsum(rng.uniform(-2, 2, size=(2000, 2)), axis=0) + [-100, 40], 5)
+        encoded = encode_polyline(points)
+        np.testing.assert_allclose(decode_polyline(encoded), points, atol=1e-9)
+        np.testing.assert_allclose(decode_polyline(encoded), self.decode_reference(encoded), atol=1e-9)
+
+    def test_points_at(self):
+        # Along the equator, so a degree of longitude is the same distance everywhere
+        geometry = RouteGeometry([[0, 0], [1, 0], [3, 0]])
+        degree = geometry.length_miles / 3
+        np.testing.assert_allclose(geometry.point_at(0), [0, 0])
+        np.testing.assert_allclose(geometry.point_at(-5), [0, 0])
+        np.testing.assert_allclose(geometry.point_at(degree / 2), [0.5, 0], atol=1e-9)
+        np.testing.assert_allclose(geometry.point_at(degree), [1, 0], atol=1e-9)
+        np.testing.assert_allclose(geometry.point_at(2 * degree), [2, 0], atol=1e-9)
+        np.testing.assert_allclose(geometry.point_at(geometry.length_miles), [3, 0])
+        np.testing.assert_allclose(geometry.point_at(geometry.length_miles + 100), [3, 0])
+        self.assertEqual(geometry.points_at([0, degree, 1e6]).shape, (3, 2))
+
+    def test_points_at_scales_to_the_routed_distance(self):
+        geometry = RouteGeometry([[0, 0], [1, 0], [3, 0]], total_miles=300)
+        np.testing.assert_allclose(geometry.point_at(150), [1.5, 0], atol=1e-9)
+        np.testing.assert_allclose(geometry.point_at(300), [3, 0])
+
+
+class RendererTests(SimpleTestCase):
+    """Renderers must implement render to be created at all"""
+
+    def test_a_renderer_without_render_cannot_be_created(self):
+        class Incomplete(ELDRenderer):
+            name = 'incomplete'
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+        self.assertIsInstance(get_renderer('raster'), ELDRenderer)
+
+
+class ELDLogImageTests(TempImageCacheMixin, TripPlanFixtureMixin, TestCase):
+    """Log images are served with an ETag and revalidated with If-None-Match"""
+
+    def setUp(self):
+        self.use_temp_image_cache()
+        self.eld_log = ELDLog.objects.first()
+        self.eld_log.log_data = {'entries': [
+            {'start_hour': 0, 'end_hour': 6, 'status': 'off_duty'},
+            {'start_hour': 6, 'end_hour': 24, 'status': 'driving'},
+        ]}
+        self.eld_log.save()
+        self.url = reverse('eld-log-image', args=[self.eld_log.id])
+
+    def test_image_is_served_with_an_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertRegex(response['ETag'], r'^"[0-9a-f]{64}"$')
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_matching_validators_are_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        for header in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+
+    def test_stale_validator_gets_the_image(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_log_is_not_found(self):
+        response = self.client.get(reverse('eld-log-image', args=[ELDLog.objects.order_by('-id').first().id + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ImageCacheTests(TempImageCacheMixin, SimpleTestCase):
+    """The on-disk image cache counts hits, stays under its size bound and never exposes partial files"""
+
+    def setUp(self):
+        self.root = self.use_temp_image_cache()
+        self.stats = get_cache_stats('eld_images')
+
+    def counters(self):
+        snapshot = self.stats.snapshot()
+        return snapshot['hits'], snapshot['misses']
+
+    def test_hits_and_misses(self):
+        days = [[(0, 'off_duty'), (24, 'off_duty')], [(0, 'driving'), (24, 'driving')]]
+        hits, misses = self.counters()
+        with mock.patch('tripapi.image_cache.render_many', wraps=render_many) as rendered:
+            first = render_days(days + days[:1])
+            self.assertEqual(self.counters(), (hits, misses + 2))
+            self.assertEqual(first[0], first[2])
+
+            self.assertEqual(render_days(days), first[:2])
+            self.assertEqual(self.counters(), (hits + 2, misses + 2))
+        self.assertEqual(rendered.call_count, 1)
+        self.assertEqual(len(list(Path(self.root).glob('*/*.png'))), 2)
+
+    @override_settings(ELD_IMAGE_CACHE_MAX_BYTES=250)
+    def test_least_recently_used_images_are_evicted(self):
+        cache = ImageCache()
+        cache.put('aa01', b'a' * 100)
+        cache.put('bb02', b'b' * 100)
+        for age, key in enumerate(['aa01', 'bb02']):
+            os.utime(cache.path(key), (1000 + age, 1000 + age))
+        self.assertEqual(cache.get('aa01'), b'a' * 100)  # Now the most recently used of the two
+
+        cache.put('cc03', b'c' * 100)
+        self.assertEqual([cache.path(key).exists() for key in ('aa01', 'bb02', 'cc03')], [True, False, True])
+        self.assertLessEqual(cache._disk_usage(), 250)
+
+    def test_writes_are_atomic(self):
+        cache = ImageCache()
+        path = cache.path('dd04')
+
+        def replace(source, target):
+            # The complete image is written before it appears under its name
+            self.assertFalse(path.exists())
+            self.assertEqual(Path(source).read_bytes(), b'png')
+            real_replace(source, target)
+
+        real_replace = os.replace
+        with mock.patch('tripapi.image_cache.os.replace', side_effect=replace):
+            cache.put('dd04', b'png')
+        self.assertEqual(path.read_bytes(), b'png')
+
+        with mock.patch('tripapi.image_cache.os.replace', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                cache.put('ee05', b'png')
+        self.assertFalse(cache.path('ee05').exists())
+        self.assertEqual(list(Path(self.root).glob('*/*.tmp')), [])
+
+
+class POIIndexTests(TestCase):
+    """The grid index finds the same nearest POI as a scan over every row"""
+
+    def setUp(self):
+        load_pois(str(settings.BASE_DIR / 'tripapi' / 'fixtures' / 'test_pois.csv'))
+        self.addCleanup(reset_poi_index)
+        self.index = POIIndex.from_database(cell_degrees=0.5)
+
+    def test_nearest_across_a_cell_boundary(self):
+        # Boundary Fuel is in the next cell east; Weatherford Truck Stop shares the query's cell but is farther
+        nearest = self.index.nearest(-97.26, 32.74)
+        self.assertEqual(nearest['name'], 'Boundary Fuel')
+        self.assertAlmostEqual(nearest['distance_miles'], float(haversine_miles(-97.26, 32.74, -96.99, 32.74)))
+
+    def test_matches_a_full_scan(self):
+        pois = list(PointOfInterest.objects.all())
+        for lon, lat in [(-97.26, 32.74), (-97.0, 31.0), (-100.5, 34.2), (-97.6, 35.0), (-98.1, 32.5)]:
+            expected = min(pois, key=lambda poi: haversine_miles(lon, lat, poi.longitude, poi.latitude))
+            self.assertEqual(self.index.nearest(lon, lat, max_miles=1000)['id'], expected.id)
+
+    def test_category_filter(self):
+        self.assertEqual(self.index.nearest(-97.26, 32.74, categories=REST_STOP_CATEGORIES)['name'],
+                         'Weatherford Truck Stop')
+        self.assertEqual(self.index.nearest(-97.26, 32.74, categories=[PointOfInterest.REST_AREA])['name'],
+                         'Brazos Rest Area')
+        self.assertIsNone(self.index.nearest(-97.26, 32.74, categories=['car_wash']))
+
+    def test_max_miles_cutoff(self):
+        self.assertEqual(self.index.nearest(-97.26, 32.74, max_miles=20)['name'], 'Boundary Fuel')
+        self.assertIsNone(self.index.nearest(-97.26, 32.74, max_miles=10))
+        self.assertIsNone(self.index.nearest(-90.0, 40.0))
+
+    def test_empty_index(self):
+        empty = POIIndex([], [], [], [], [])
+        self.assertEqual(len(empty), 0)
+        self.assertIsNone(empty.nearest(-97.26, 32.74))
+
+
+def cycle_overruns(plan, cycle_used, service):
+    """
+    On-duty hours (driving plus fuel stops) by which each stretch between
+    34-hour restarts of a simulate_rest_stops plan exceeds the 70-hour cycle
+    """
+    available = service.MAX_CYCLE_HOURS - cycle_used
+    used = 0.0
+    miles = 0.0
+    overruns = []
+    for stop in plan['rest_stops'] + [{'mile_marker': plan['total_miles'], 'is_fuel_stop': False, 'rest_duration': 0}]:
+        used += (stop['mile_marker'] - miles) / service.AVG_SPEED
+        miles = stop['mile_marker']
+        if stop['is_fuel_stop']:
+            used += service.FUEL_STOP_HOURS
+        elif stop['rest_duration'] >= service.CYCLE_RESTART_HOURS:
+            overruns.append(used - available)
+            available, used = service.MAX_CYCLE_HOURS, 0.0
+    return [overrun for overrun in overruns + [used - available] if overrun > 1e-6]
+
+
+class RestStopPlanningTests(SimpleTestCase):
+    """simulate_rest_stops stays inside the 70-hour cycle and restarts when it runs out"""
+
+    def test_nearly_exhausted_cycle_on_multi_day_trips(self):
+        # Both used to leave a sliver of cycle that was never charged or restarted,
+        # creeping forward a fraction of a mile a day for thousands of stops
+        service = TripPlannerService()
+        for distance, cycle_used, departure in [
+            (3962.4, 55.78, datetime(2025, 1, 6, 21, 54)),
+            (3723.98, 68.674, datetime(2025, 1, 6, 23, 30)),
+        ]:
+            plan = service.simulate_rest_stops({'distance_miles': distance}, cycle_used, departure_time=departure)
+            self.assertLess(len(plan['rest_stops']), 20)
+            self.assertLess(plan['estimated_arrival'] - departure, timedelta(days=9))
+            self.assertEqual(cycle_overruns(plan, cycle_used, service), [])
+            self.assertTrue(any(stop['rest_duration'] >= 34 for stop in plan['rest_stops']))
+
+    def test_cycle_ending_on_the_road_takes_one_restart(self):
+        # 1.3 hours of cycle left: drive them, then a single restart rather than a 10-hour rest first
+        service = TripPlannerService()
+        plan = service.simulate_rest_stops({'distance_miles': 300}, 68.7, departure_time=datetime(2025, 1, 6, 8))
+        first = plan['rest_stops'][0]
+        self.assertAlmostEqual(first['mile_marker'], 1.3 * 55)
+        self.assertEqual(first['rest_duration'], 34)
+        self.assertEqual([stop['rest_duration'] >= 34 for stop in plan['rest_stops']].count(True), 1)
+
+
+class StopLookupTests(TestCase):
+    """Remote POI lookups run concurrently but land on their own stops, and a failed one falls back"""
+
+    def setUp(self):
+        reset_poi_index()  # An empty index, so every stop is looked up remotely
+        self.addCleanup(reset_poi_index)
+        self.stops = [
+            {'location': None, 'search_point': [-100.0 + i, 35.0], 'poi_query': 'rest stop', 'is_fuel_stop': i % 2 == 1}
+            for i in range(6)
+        ]
+
+    def resolve(self, fail_lon=None):
+        def geocode(params):
+            lon, lat = params['focus.point.lon'], params['focus.point.lat']
+            time.sleep((-94.0 - lon) * 0.02)  # Later stops answer first
+            if lon == fail_lon:
+                raise ORSError("read timeout")
+            return mock.Mock(status_code=200, json=lambda: {'features': [{'geometry': {'coordinates': [lon, lat]}}]})
+
+        ors = mock.Mock(geocode=mock.Mock(side_effect=geocode))
+        with mock.patch('tripapi.services.get_ors_client', return_value=ors):
+            TripPlannerService().resolve_stop_locations(self.stops)
+        return ors
+
+    def test_results_keep_stop_order(self):
+        ors = self.resolve()
+        self.assertEqual(ors.geocode.call_count, len(self.stops))
+        for stop in self.stops:
+            self.assertEqual(stop['location'], {'longitude': stop['search_point'][0], 'latitude': 35.0})
+
+    def test_empty_index_falls_back_to_ors(self):
+        with self.assertLogs('tripapi.poi', 'WARNING') as logs:
+            ors = self.resolve()
+        self.assertIn("POI index is empty, so planned stops get ORS searches", logs.output[0])
+        self.assertEqual(ors.geocode.call_count, len(self.stops))
+
+    @override_settings(POI_REMOTE_FALLBACK=False)
+    def test_remote_fallback_can_be_turned_off(self):
+        with self.assertLogs('tripapi.poi', 'WARNING') as logs:
+            ors = self.resolve()
+        self.assertIn("placeholder names", logs.output[0])
+        ors.geocode.assert_not_called()
+        self.assertEqual([stop['location'] for stop in self.stops[:2]], ["Unknown rest stop", "Unknown fuel stop"])
+
+    def test_failed_lookup_falls_back(self):
+        with self.assertLogs('tripapi.services', 'WARNING'):
+            self.resolve(fail_lon=-97.0)
+        self.assertEqual(self.stops[3]['location'], "Unknown fuel stop")
+        for stop in self.stops[:3] + self.stops[4:]:
+            self.assertEqual(stop['location'], {'longitude': stop['search_point'][0], 'latitude': 35.0})
+
+
+class HOSSimulationTests(TestCase):
+    """The vectorized simulator matches TripPlannerService.simulate_rest_stops"""
+
+    def test_matches_scalar_simulation(self):
+        service = TripPlannerService()
+        departure = datetime(2025, 1, 6)
+        for distance in (100, 999, 1001, 2969, 6000):
+            for cycle_used in (0, 20, 60, 69.5):
+                for departure_hour in (0, 6.5, 23):
+                    start = departure + timedelta(hours=departure_hour)
+                    plan = service.simulate_rest_stops({'distance_miles': distance}, cycle_used, departure_time=start)
+                    result = simulate_hos(distance, cycle_used, departure_hour)
+
+                    arrival_hours = (plan['estimated_arrival'] - start).total_seconds() / 3600
+                    self.assertAlmostEqual(float(result['arrival_hours']), arrival_hours, places=6)
+                    self.assertAlmostEqual(float(result['driving_hours']), plan['total_driving_hours'], places=6)
+                    self.assertEqual(int(result['stops']), len(plan['rest_stops']))
+                    self.assertEqual(int(result['days']), (plan['estimated_arrival'].date() - start.date()).days + 1)
+
+    def test_nearly_exhausted_cycles_complete(self):
+        # The grid above never reaches a cycle left with a sliver of hours on a multi-day trip
+        service = TripPlannerService()
+        rng = np.random.default_rng(0)
+        distance = np.round(rng.uniform(500, 6000, 300), 2)
+        cycle_used = np.round(rng.uniform(50, 70, 300), 3)
+        departure_hour = np.round(rng.uniform(18, 24, 300), 2) % 24
+        result = simulate_hos(distance, cycle_used, departure_hour)
+
+        self.assertTrue(result['completed'].all())
+        # At most two rests a day, and no more driving and fuelling between restarts than the cycle allows
+        self.assertTrue((result['stops'] - result['fuel_stops'] <= 2 * result['days']).all())
+        on_duty = result['driving_hours'] + service.FUEL_STOP_HOURS * result['fuel_stops']
+        self.assertTrue((on_duty <= 70 - cycle_used + 70 * result['restarts'] + 1e-6).all())
+
+        departure = datetime(2025, 1, 6)
+        for i in range(0, 300, 10):
+            start = departure + timedelta(hours=float(departure_hour[i]))
+            plan = service.simulate_rest_stops({'distance_miles': distance[i]}, cycle_used[i], departure_time=start)
+            arrival_hours = (plan['estimated_arrival'] - start).total_seconds() / 3600
+            self.assertAlmostEqual(float(result['arrival_hours'][i]), arrival_hours, places=6)
+            self.assertEqual(int(result['stops'][i]), len(plan['rest_stops']))
+            self.assertEqual(cycle_overruns(plan, cycle_used[i], service), [])
+
+    def test_simulate_endpoint_grid(self):
+        response = APIClient().post(reverse('hos-simulate'), {
+            'distance_miles': [500, 2500],
+            'cycle_used': [0, 30, 60],
+            'departure_hour': [6, 18],
+            'grid': True,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['scenarios'], 12)
+        self.assertEqual(len(response.data['arrival_hours']), 12)
+        self.assertTrue(all(response.data['completed']))
+
+    def test_simulate_endpoint_rejects_mismatched_lengths(self):
+        response = APIClient().post(reverse('hos-simulate'), {
+            'distance_miles': [500, 2500, 900],
+            'cycle_used': [0, 30],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_simulate_endpoint_rejects_oversized_grid_before_building_it(self):
+        values = list(range(1000))
+        with mock.patch('tripapi.views.np.meshgrid') as meshgrid:
+            response = APIClient().post(reverse('hos-simulate'), {
+                'distance_miles': values, 'cycle_used': [v % 70 for v in values],
+                'departure_hour': [v % 24 for v in values], 'grid': True,
+            }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('scenarios', response.data['error'])
+        meshgrid.assert_not_called()
+
+    def test_simulate_endpoint_rejects_huge_distances(self):
+        response = APIClient().post(reverse('hos-simulate'), {
+            'distance_miles': [1e9], 'cycle_used': [0],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('distance_miles', response.data)
+
+    def test_eld_logs_end_with_the_last_mile(self):
+        # 245.618 miles doesn't come out to a whole number of microseconds of driving
+        rest_stops = {'total_miles': 245.61801732387192, 'departure_time': datetime(2025, 1, 6, 8), 'rest_stops': []}
+        eld_logs = TripPlannerService().generate_eld_logs({}, rest_stops, 20)
+        self.assertEqual(len(eld_logs), 1)
+
+
+class DepartureRecommendationTests(TestCase):
+    def test_driving_window_delays_late_departures(self):
+        # 700 miles leaving at 17:00: drive to 22:00, rest until 08:00, then 7.7 h more
+        result = simulate_hos(700, 10, [17, 23], driving_window=(6, 22))
+        self.assertAlmostEqual(float(result['arrival_hours'][0]), 5 + 10 + (700 - 5 * 55) / 55, places=6)
+        # Leaving at 23:00 waits until 06:00, then needs one rest
+        self.assertAlmostEqual(float(result['arrival_hours'][1]), 7 + 11 + 10 + 3 + (700 - 11 * 55) / 55, places=6)
+        self.assertEqual(list(result['stops']), [1, 1])
+
+    def test_recommend_departures_ranks_candidates(self):
+        earliest = datetime(2025, 1, 6, 17)
+        options = recommend_departures(700, 10, earliest, limit=3)
+        self.assertEqual(len(options), 3)
+        self.assertEqual(options[0]['departure_time'], earliest)
+        self.assertEqual(options[0]['rests'], 1)
+        self.assertLessEqual(options[0]['elapsed_hours'], options[1]['elapsed_hours'])
+
+        # A short trip needs no rest when it leaves inside the driving window
+        options = recommend_departures(300, 10, datetime(2025, 1, 6, 21), objective='rests', limit=1)
+        self.assertEqual(options[0]['rests'], 0)
+        self.assertEqual(options[0]['departure_time'], datetime(2025, 1, 7, 6))
+
+    def test_recommended_arrival_matches_the_plan(self):
+        service = TripPlannerService()
+        route = {'distance_miles': 1200}
+        options = service.recommend_departures(route, 10, earliest=datetime(2025, 1, 6, 20))
+        for option in options:
+            plan = service.simulate_rest_stops(route, 10, departure_time=option['departure_time'])
+            self.assertAlmostEqual((plan['estimated_arrival'] - option['arrival_time']).total_seconds(), 0, delta=1)
+            self.assertEqual(len(plan['rest_stops']) - option['fuel_stops'], option['rests'])
+
+    def test_no_option_exceeds_the_cycle_without_a_restart(self):
+        service = TripPlannerService()
+        for distance, cycle_used, earliest in [
+            (3723.98, 68.674, datetime(2025, 1, 6, 23, 30)),
+            (3962.4, 55.78, datetime(2025, 1, 6, 21, 54)),
+            (2500, 62.5, datetime(2025, 1, 6, 18)),
+        ]:
+            options = service.recommend_departures({'distance_miles': distance}, cycle_used, earliest=earliest)
+            self.assertTrue(options)
+            for option in options:
+                on_duty = option['driving_hours'] + service.FUEL_STOP_HOURS * option['fuel_stops']
+                self.assertLessEqual(on_duty, 70 - cycle_used + 70 * option['restarts'] + 0.01)
+                self.assertLess(option['elapsed_hours'], 10 * 24)
+
+    def test_unfinished_scenarios_are_not_recommended(self):
+        # Too few iterations for any departure to finish a 5000 mile trip
+        def simulate(*args, **kwargs):
+            return simulate_hos(*args, max_iterations=2, **kwargs)
+
+        with mock.patch('tripapi.hos.simulate_hos', side_effect=simulate):
+            self.assertEqual(recommend_departures(5000, 0, datetime(2025, 1, 6, 8)), [])
+        self.assertTrue(recommend_departures(5000, 0, datetime(2025, 1, 6, 8)))
+
+    def test_service_uses_its_own_limits(self):
+        service = TripPlannerService()
+        service.AVG_SPEED = 50
+        options = service.recommend_departures({'distance_miles': 300}, 0, earliest=datetime(2025, 1, 6, 8))
+        self.assertAlmostEqual(options[0]['driving_hours'], 6.0)
+
+
+def stub_route_result():
+    """calculate_route result for a 300 mile New York - Philadelphia - Washington trip"""
+    coordinates = [[-74.0, 40.7], [-75.2, 40.0], [-77.0, 38.9]]
+    return {
+        'route_data': {'routes': [{'geometry': encode_polyline(coordinates), 'summary': {'distance': 482803}}]},
+        'geometry': None,
+        'distance_miles': 300,
+        'duration_hours': 5.5,
+        'coordinates': dict(zip(('current', 'pickup', 'dropoff'), coordinates)),
+    }
+
+
+class PlanTripStreamTests(TestCase):
+    """The streaming endpoint sends each stage's result as its own event"""
+
+    def post(self, accept, query=''):
+        body = {
+            'current_location': 'New York, NY', 'pickup_location': 'Philadelphia, PA',
+            'dropoff_location': 'Washington, DC', 'current_cycle_used': 10,
+        }
+        with mock.patch.object(TripPlannerService, 'calculate_route', return_value=stub_route_result()):
+            response = APIClient().post(reverse('plan-trip-stream') + query, body, format='json', HTTP_ACCEPT=accept)
+            # The pipeline runs as the body is consumed
+            content = b''.join(response.streaming_content).decode('utf-8')
+        return response, content
+
+    def test_ndjson_events_in_stage_order(self):
+        response, content = self.post('application/x-ndjson', '?images=0')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        events = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([event['event'] for event in events], ['route', 'rest_stops', 'eld_logs', 'trip_plan', 'done'])
+        self.assertEqual(events[0]['data']['distance_miles'], 300)
+        self.assertTrue(TripPlan.objects.filter(id=events[3]['data']['trip_plan']['id']).exists())
+
+    def test_server_sent_events(self):
+        response, content = self.post('text/event-stream', '?images=0')
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        self.assertTrue(content.startswith('event: route\ndata: {'))
+        self.assertTrue(content.endswith('event: done\ndata: {}\n\n'))
+
+    def test_invalid_input_is_an_error_event(self):
+        response = APIClient().post(reverse('plan-trip-stream'), {}, format='json', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.content.startswith(b'event: error\n'))
+
+
+class PlanTripJobTests(TestCase):
+    """Workers claim queued jobs once, record stage progress and recover jobs whose worker died"""
+
+    input_data = {
+        'current_location': 'New York, NY', 'pickup_location': 'Philadelphia, PA',
+        'dropoff_location': 'Washington, DC', 'current_cycle_used': 10,
+    }
+
+    def setUp(self):
+        # Jobs run inline here; closing connections would end the test transaction
+        patcher = mock.patch('tripapi.jobs.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_a_job_is_claimed_once_oldest_first(self):
+        first = PlanTripJob.objects.create(input_data=self.input_data)
+        second = PlanTripJob.objects.create(input_data=self.input_data)
+        self.assertEqual(claim_next_job(), (first.id, 1))
+        self.assertIsNone(claim_job(first.id))
+        self.assertEqual(claim_next_job(), (second.id, 1))
+        self.assertIsNone(claim_next_job())
+
+    def test_progress_and_result(self):
+        job = PlanTripJob.objects.create(input_data=self.input_data)
+        with mock.patch.object(TripPlannerService, 'calculate_route', return_value=stub_route_result()):
+            run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlanTripJob.SUCCEEDED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(list(job.progress['stages']), ['route', 'rest_stops', 'eld_logs', 'persist'])
+        self.assertTrue(all(stage['status'] == 'done' for stage in job.progress['stages'].values()))
+        self.assertTrue(TripPlan.objects.filter(id=job.result['trip_plan']['id']).exists())
+
+    def test_failed_stage_is_recorded(self):
+        job = PlanTripJob.objects.create(input_data=self.input_data)
+        with mock.patch.object(TripPlannerService, 'calculate_route', return_value=stub_route_result()), \
+                mock.patch.object(TripPlannerService, 'generate_eld_logs', side_effect=ValueError("bad log")), \
+                self.assertLogs('tripapi.jobs', 'ERROR'):
+            run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlanTripJob.FAILED)
+        self.assertEqual(job.error, "bad log")
+        self.assertEqual(job.stage, 'eld_logs')
+        self.assertEqual(job.progress['stages']['rest_stops']['status'], 'done')
+        self.assertEqual(job.progress['stages']['eld_logs']['status'], 'failed')
+
+    @override_settings(PLAN_JOB_LEASE_SECONDS=60, PLAN_JOB_MAX_ATTEMPTS=2)
+    def test_jobs_with_expired_leases_are_requeued_then_failed(self):
+        job = PlanTripJob.objects.create(input_data=self.input_data)
+        expired = timezone.now() - timedelta(minutes=5)
+
+        # A worker claimed the job and died; the next claim picks it up again
+        self.assertEqual(claim_next_job(), (job.id, 1))
+        PlanTripJob.objects.filter(id=job.id).update(heartbeat_at=expired)
+        with self.assertLogs('tripapi.jobs', 'WARNING'):
+            self.assertEqual(claim_next_job(), (job.id, 2))
+
+        # A live lease is left alone
+        self.assertIsNone(claim_next_job())
+
+        # Out of attempts, the job fails instead of being retried forever
+        PlanTripJob.objects.filter(id=job.id).update(heartbeat_at=expired)
+        with self.assertLogs('tripapi.jobs', 'WARNING'):
+            self.assertIsNone(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlanTripJob.FAILED)
+        self.assertIn("stopped responding", job.error)
+
+    def test_a_requeued_job_is_not_overwritten_by_its_old_worker(self):
+        job = PlanTripJob.objects.create(input_data=self.input_data)
+        claim_job(job.id)
+        PlanTripJob.objects.filter(id=job.id).update(status=PlanTripJob.QUEUED)
+        claim_job(job.id)
+        with mock.patch.object(TripPlannerService, 'calculate_route', side_effect=ValueError("late")), \
+                self.assertLogs('tripapi.jobs', 'ERROR'):
+            run_job(job.id, attempt=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlanTripJob.RUNNING)
+        self.assertEqual(job.attempts, 2)
+
+
+class AsyncPlanTripTests(TransactionTestCase):
+    """The async view plans a trip with the ORS calls made on httpx"""
+
+    def ors_transport(self, fail_first=0):
+        calls = []
+        coordinates = [[-74.0, 40.7], [-75.2, 40.0], [-77.0, 38.9]]
+
+        def handler(request):
+            calls.append(request.url.path)
+            if len(calls) <= fail_first:
+                return httpx.Response(503, text="busy")
+            if request.url.path == '/geocode/search':
+                index = ['New York, NY', 'Philadelphia, PA', 'Washington, DC'].index(request.url.params['text'])
+                return httpx.Response(200, json={'features': [{'geometry': {'coordinates': coordinates[index]}}]})
+            return httpx.Response(200, json={'routes': [{
+                'geometry': encode_polyline(coordinates),
+                'summary': {'distance': 482803, 'duration': 19800},
+            }]})
+        return httpx.MockTransport(handler), calls
+
+    async def test_async_plan_trip(self):
+        transport, calls = self.ors_transport(fail_first=1)
+        client = AsyncORSClient(transport=transport, backoff_factor=0)
+        with mock.patch('tripapi.services.get_async_ors_client', return_value=client):
+            response = await AsyncClient().post(reverse('async-plan-trip'), {
+                'current_location': 'New York, NY', 'pickup_location': 'Philadelphia, PA',
+                'dropoff_location': 'Washington, DC', 'current_cycle_used': 10,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertAlmostEqual(body['trip_plan']['estimated_miles'], 300, places=0)
+        self.assertTrue(body['departure_options'])
+        # Three geocodes (one retried after the 503) and one directions call
+        self.assertEqual(sorted(calls).count('/geocode/search'), 4)
+        self.assertEqual(calls[-1], '/v2/directions/driving-hgv')
+        self.assertTrue(await TripPlan.objects.filter(id=body['trip_plan']['id']).aexists())
+        # Spans recorded on the event loop, the executor and the database thread all reach the header
+        self.assertIn('ors.directions;', response['Server-Timing'])
+        self.assertIn('rest_stops;', response['Server-Timing'])
+        self.assertIn('eld_logs;', response['Server-Timing'])
+        self.assertIn('persist;', response['Server-Timing'])
+
+    async def test_stream_is_not_buffered_under_asgi(self):
+        body = {
+            'current_location': 'New York, NY', 'pickup_location': 'Philadelphia, PA',
+            'dropoff_location': 'Washington, DC', 'current_cycle_used': 10,
+        }
+        with mock.patch.object(TripPlannerService, 'calculate_route', return_value=stub_route_result()):
+            response = await AsyncClient().post(reverse('plan-trip-stream') + '?images=0', body,
+                                                content_type='application/json', headers={'Accept': 'application/x-ndjson'})
+            self.assertTrue(response.is_async)
+            # Django warns when it has to read a synchronous stream to the end first
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                lines = [json.loads(part) async for part in response.streaming_content]
+        self.assertEqual([line['event'] for line in lines], ['route', 'rest_stops', 'eld_logs', 'trip_plan', 'done'])
+
+    async def test_async_plan_trip_rejects_invalid_input(self):
+        response = await AsyncClient().post(reverse('async-plan-trip'), {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('current_location', response.json())
+
+
+class GeocodeCacheTests(MockORSMixin, TestCase):
+    """Addresses are geocoded once, then served from the memo and the cache table until they expire or are evicted"""
+
+    def setUp(self):
+        self.mock_ors = MockORS()
+        self.use_mock_ors(self.mock_ors)
+
+    def geocode(self, *locations):
+        """Geocode with a fresh service, as a new request would; returns the ORS requests it made"""
+        requests_before = self.mock_ors.requests
+        service = TripPlannerService()
+        for location in locations:
+            service._get_coordinates(location)
+        return self.mock_ors.requests - requests_before
+
+    def test_equivalent_addresses_share_an_entry(self):
+        self.assertEqual(self.geocode('Dallas, TX', '  dallas ,tx ', 'DALLAS,   TX'), 1)
+        self.assertEqual(list(GeocodeCacheEntry.objects.values_list('query', flat=True)), ['dallas, tx'])
+        self.assertEqual(self.geocode('Dallas,TX'), 0)
+
+    def test_memo_answers_repeats_within_a_request(self):
+        service = TripPlannerService()
+        coordinates = service._get_coordinates('Tulsa, OK')
+        GeocodeCacheEntry.objects.all().delete()
+        requests_before = self.mock_ors.requests
+        self.assertEqual(service._get_coordinates('tulsa, ok'), coordinates)
+        self.assertEqual(self.mock_ors.requests, requests_before)
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+
+    @override_settings(GEOCODE_CACHE_TTL=60)
+    def test_expired_entries_are_geocoded_again(self):
+        self.assertEqual(self.geocode('Denver, CO'), 1)
+        self.assertEqual(self.geocode('Denver, CO'), 0)
+
+        GeocodeCacheEntry.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(self.geocode('Denver, CO'), 1)
+        self.assertGreater(GeocodeCacheEntry.objects.get().created_at, timezone.now() - timedelta(seconds=60))
+
+    @override_settings(GEOCODE_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        self.geocode('Dallas, TX', 'Tulsa, OK')
+        self.geocode('Dallas, TX')  # Now more recently used than Tulsa
+        self.geocode('Denver, CO')
+        self.assertEqual(set(GeocodeCacheEntry.objects.values_list('query', flat=True)), {'dallas, tx', 'denver, co'})
+        self.assertEqual(self.geocode('Tulsa, OK'), 1)
+
+
+class FlakyORS(MockORS):
+    """MockORS that answers its first requests with the given error statuses"""
+
+    def __init__(self, statuses, **kwargs):
+        super().__init__(**kwargs)
+        self.statuses = list(statuses)
+
+    def handle(self, method, path, query, body, headers=None):
+        with self._random_lock:
+            status = self.statuses.pop(0) if self.statuses else None
+        if status is None:
+            return super().handle(method, path, query, body, headers)
+        with self._random_lock:
+            self.requests += 1
+        return status, {'error': {'code': status, 'message': "Injected failure"}}
+
+
+class ORSClientTests(MockORSMixin, TestCase):
+    """ORSClient retries transient failures with backoff and gives up on timeouts with ORSError"""
+
+    def client_for(self, mock_ors, **kwargs):
+        base_url = self.serve_mock_ors(mock_ors).base_url
+        return ORSClient(base_url=base_url, **{'backoff_factor': 0.01, **kwargs})
+
+    def test_transient_failures_are_retried(self):
+        flaky = FlakyORS([429, 502])
+        response = self.client_for(flaky, max_retries=3).geocode({'text': 'Denver, CO', 'size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['features']), 1)
+        self.assertEqual(flaky.requests, 3)
+
+        flaky.statuses = [503]
+        response = self.client_for(flaky, max_retries=3).directions('driving-hgv', {
+            'coordinates': [[-104.99, 39.74], [-97.74, 30.27]]
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(flaky.requests, 5)
+
+    def test_retries_run_out(self):
+        flaky = FlakyORS([502, 502, 502, 502])
+        response = self.client_for(flaky, max_retries=2).geocode({'text': 'Denver, CO'})
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(flaky.requests, 3)
+
+    def test_timeout_raises_ors_error(self):
+        client = self.client_for(MockORS(latency=1.0), max_retries=0, timeouts={'geocode': (1, 0.1)})
+        started = time.perf_counter()
+        with mock.patch('tripapi.services.get_ors_client', return_value=client):
+            with self.assertRaises(ORSError):
+                TripPlannerService()._get_coordinates('Denver, CO')
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+
+class RouteCacheTests(MockORSMixin, SimpleTestCase):
+    """Directions are cached per request body until they expire or are evicted"""
+
+    POINTS = [[-96.8, 32.78], [-95.99, 36.15], [-104.99, 39.74]]
+
+    def setUp(self):
+        self.mock_ors = MockORS()
+        self.use_mock_ors(self.mock_ors)
+        # get_route_cache builds a fresh cache from the current settings
+        patcher = mock.patch('tripapi.caches._route_cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def route(self, points=POINTS, **options):
+        """Route with a fresh service, as a new request would; returns the ORS requests it made"""
+        requests_before = self.mock_ors.requests
+        service = TripPlannerService()
+        payload = service.directions_payload
+        service.directions_payload = lambda *coordinates: dict(payload(*coordinates), **options)
+        service.route_between(*points)
+        return self.mock_ors.requests - requests_before
+
+    def test_identical_requests_hit(self):
+        self.assertEqual(self.route(), 1)
+        self.assertEqual(self.route(), 0)
+        # Differences below ROUTE_CACHE_PRECISION are the same request
+        self.assertEqual(self.route([[lon + 1e-7, lat] for lon, lat in self.POINTS]), 0)
+
+    def test_different_options_miss(self):
+        self.route()
+        self.assertEqual(self.route(preference='fastest'), 1)
+        self.assertEqual(self.route(radiuses=[1000, 1000, 10000]), 1)
+        self.assertEqual(self.route(self.POINTS[:2] + [[-97.74, 30.27]]), 1)
+        self.assertEqual(self.route(preference='fastest'), 0)
+
+    @override_settings(ROUTE_CACHE_TTL=60)
+    def test_entries_expire(self):
+        now = time.monotonic()
+        with mock.patch('tripapi.caches.time.monotonic', return_value=now):
+            self.route()
+        with mock.patch('tripapi.caches.time.monotonic', return_value=now + 59):
+            self.assertEqual(self.route(), 0)
+        with mock.patch('tripapi.caches.time.monotonic', return_value=now + 61):
+            self.assertEqual(self.route(), 1)
+
+    @override_settings(ROUTE_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        self.route(preference='fastest')
+        self.route(preference='shortest')
+        self.route(preference='fastest')  # Now more recently used than shortest
+        self.route(preference='recommended')
+        self.assertEqual(len(get_route_cache()), 2)
+        self.assertEqual(self.route(preference='fastest'), 0)
+        self.assertEqual(self.route(preference='shortest'), 1)
+
+
+class MockORSTests(MockORSMixin, TestCase):
+    """The local ORS stand-in serves synthetic, recorded and replayed responses"""
+
+    def test_synthetic_route_through_the_service(self):
+        self.use_mock_ors()
+        route = TripPlannerService().calculate_route('New York, NY', 'Chicago, IL', 'Denver, CO')
+        self.assertGreater(route['distance_miles'], 0)
+        # Synthetic routes are the straight lines between the waypoints, stretched by ROAD_FACTOR
+        self.assertAlmostEqual(route['geometry'].length_miles * ROAD_FACTOR, route['distance_miles'], delta=route['distance_miles'] * 0.01)
+
+    def test_injected_errors(self):
+        client = self.serve_mock_ors(MockORS(error_rate=1.0, error_status=429))
+        self.assertEqual(client.geocode({'text': 'Denver, CO'}).status_code, 429)
+
+    def test_record_then_replay(self):
+        upstream = self.serve_mock_ors()
+        fixtures = tempfile.mkdtemp()
+        recorder = self.serve_mock_ors(MockORS(mode='record', fixtures_dir=fixtures, upstream=upstream.base_url))
+        recorded = recorder.geocode({'text': 'Denver, CO', 'size': 1}).json()
+
+        replay = self.serve_mock_ors(MockORS(mode='replay', fixtures_dir=fixtures))
+        self.assertEqual(replay.geocode({'text': 'Denver, CO', 'size': 1}).json(), recorded)
+        self.assertEqual(replay.geocode({'text': 'Boise, ID', 'size': 1}).status_code, 404)
+
+
+class BenchmarkPlanTripTests(TransactionTestCase):
+    """benchmark_plan_trip reports every stage and leaves other rows as they were"""
+
+    def test_report_and_cleanup(self):
+        # Rows that look like the benchmark's own must survive it
+        namesake = Driver.objects.create(name="Benchmark Driver", license_number="BENCH", carrier_name="Carrier",
+                                         home_terminal="Terminal")
+        TripPlan.objects.create(driver=namesake, current_location="A", pickup_location="B", dropoff_location="C",
+                                current_cycle_used=0)
+        GeocodeCacheEntry.objects.create(query='austin, tx', coordinates=[-97.74, 30.27], hits=5)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = f"{directory.name}/report.json"
+        call_command('benchmark_plan_trip', trip=['short'], repeat=1, concurrency=[2], requests=2, latency=0,
+                     output=output, stdout=io.StringIO(), stderr=io.StringIO())
+        with open(output) as f:
+            report = json.load(f)
+
+        stages = report['trips']['short']['stages']
+        self.assertEqual(set(stages), {'calculate_route', 'plan_rest_stops', 'generate_eld_logs',
+                                       'generate_eld_drawing_data', 'draw_eld_lines', 'persistence', 'plan_trip'})
+        self.assertGreater(stages['persistence']['queries'], 0)
+        self.assertEqual(report['concurrency']['2']['requests'], 2)
+        self.assertIn('commit', report)
+        self.assertEqual(list(Driver.objects.all()), [namesake])
+        self.assertEqual(TripPlan.objects.get().driver, namesake)
+        entry = GeocodeCacheEntry.objects.get()
+        self.assertEqual((entry.query, entry.coordinates, entry.hits), ('austin, tx', [-97.74, 30.27], 5))
+
+    def test_compare_flags_slower_sections_and_extra_queries(self):
+        baseline = {'trips': {'short': {'stages': {
+            'route': {'p95_ms': 100.0, 'queries': 4},
+            'persistence': {'p95_ms': 10.0, 'queries': 6},
+            'draw': {'p95_ms': 50.0},
+        }}}}
+        current = {'trips': {'short': {'stages': {
+            'route': {'p95_ms': 105.0, 'queries': 4},
+            'persistence': {'p95_ms': 10.0, 'queries': 7},
+            'draw': {'p95_ms': 80.0},
+        }}}}
+        rows = {row['section']: row for row in compare_results(baseline, current, threshold_pct=10)}
+        self.assertFalse(rows['trips.short.stages.route']['regressed'])
+        self.assertTrue(rows['trips.short.stages.persistence']['regressed'])
+        self.assertTrue(rows['trips.short.stages.draw']['regressed'])
+        self.assertEqual(rows['trips.short.stages.draw']['change_pct'], 60.0)
+
+
+class MetricsTests(MockORSMixin, TestCase):
+    """Spans reach the Server-Timing header, the request log and /api/metrics/"""
+
+    def setUp(self):
+        self.use_mock_ors()
+
+    def test_plan_trip_timings_and_metrics(self):
+        with self.assertLogs('tripapi.requests', 'INFO') as logs:
+            response = APIClient().post(reverse('plan-trip'), {
+                'current_location': 'Dallas, TX',
+                'pickup_location': 'Tulsa, OK',
+                'dropoff_location': 'Denver, CO',
+                'current_cycle_used': 10,
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        spans = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for name in ('route', 'ors.geocode', 'ors.directions', 'rest_stops', 'eld_logs', 'persist', 'db', 'total'):
+            self.assertIn(name, spans)
+        self.assertIn('route', logs.records[-1].spans)
+        self.assertEqual(logs.records[-1].status, 201)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE tripapi_ors_requests_total counter', text)
+        self.assertIn('tripapi_ors_requests_total{endpoint="geocode",status="200"}', text)
+        self.assertIn('tripapi_http_requests_total{method="POST",status="201",view="plan-trip"}', text)
+        self.assertIn('tripapi_span_duration_seconds_count{span="persist"}', text)
+        self.assertIn('tripapi_cache_requests_total{cache="geocode",result="miss"}', text)
+
+    def test_span_times_async_functions(self):
+        @span('sleep')
+        async def sleep():
+            await asyncio.sleep(0.01)
+
+        timings, token = start_timings()
+        try:
+            asyncio.run(sleep())
+        finally:
+            stop_timings(token)
+        self.assertEqual(timings.as_dict()['sleep']['count'], 1)
+        self.assertGreaterEqual(timings.as_dict()['sleep']['ms'], 10)
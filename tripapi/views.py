@@ -1,20 +1,86 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, action
+from rest_framework.decorators import api_view, action, renderer_classes
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
-from django.http import HttpResponse
-from .models import Driver, TripPlan, RestStop, ELDLog
-from .serializers import DriverSerializer, TripPlanSerializer, RestStopSerializer, ELDLogSerializer, TripInputSerializer
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from .models import Driver, TripPlan, RestStop, ELDLog, PlanTripJob
+from .serializers import DriverSerializer, TripPlanSerializer, TripPlanListSerializer, RestStopSerializer, ELDLogSerializer, TripInputSerializer, ReplanInputSerializer, HOSSimulationInputSerializer, PlanTripJobSerializer, field_params, restrict_queryset
 from .services import TripPlannerService
+from .asyncdb import db_sync_to_async
+from .caches import all_cache_stats
+from .hos import simulate_hos
+from .image_cache import image_cache_key, render_days
+from .jobs import submit_plan_job
+from .metrics import PROMETHEUS_CONTENT_TYPE, prometheus_text
+from .pagination import TripPlanCursorPagination
+from .pipeline import arun_plan_trip, get_plan_driver, iter_plan_trip, replan_trip, run_plan_trip, run_plan_trip_batch
+from .streaming import EventStreamRenderer, NDJSONRenderer, event_stream
 import json
+import math
 from datetime import datetime
+import numpy as np
 
 class DriverViewSet(viewsets.ModelViewSet):
     queryset = Driver.objects.all()
     serializer_class = DriverSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            queryset = restrict_queryset(queryset, self.get_serializer())
+        return queryset
+
 class TripPlanViewSet(viewsets.ModelViewSet):
-    queryset = TripPlan.objects.all()
+    queryset = TripPlan.objects.prefetch_related('rest_stops', 'eld_logs')
     serializer_class = TripPlanSerializer
+    pagination_class = TripPlanCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            # Only load the columns and relations the response will include;
+            # route geometry is most of each row
+            queryset = restrict_queryset(queryset, self.get_serializer())
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return TripPlanListSerializer
+        return super().get_serializer_class()
+
+    @action(detail=True, methods=['post'])
+    def replan(self, request, pk=None):
+        """
+        Recompute the HOS schedule with a new current_cycle_used and/or
+        departure_time, reusing the stored route, and save it as a new revision
+        """
+        serializer = ReplanInputSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        trip_plan = self.get_object()
+        try:
+            result = replan_trip(
+                trip_plan,
+                current_cycle_used=serializer.validated_data.get('current_cycle_used'),
+                departure_time=serializer.validated_data.get('departure_time'),
+                absolute_url=request.build_absolute_uri,
+                fields=field_params(request, 'fields'),
+                expand=field_params(request, 'expand'),
+            )
+        except Exception as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(result, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
 def plan_trip(request):
@@ -27,127 +93,241 @@ def plan_trip(request):
     
     # Get validated data
     data = serializer.validated_data
-    current_location = data['current_location']
-    pickup_location = data['pickup_location']
-    dropoff_location = data['dropoff_location']
-    current_cycle_used = data['current_cycle_used']
     
     # Get driver (create default if not provided)
-    driver_id = data.get('driver_id')
-    if driver_id:
-        try:
-            driver = Driver.objects.get(id=driver_id)
-        except Driver.DoesNotExist:
-            return Response({"error": "Driver not found"}, status=status.HTTP_404_NOT_FOUND)
-    else:
-        # Create a default driver if not specified
-        driver, created = Driver.objects.get_or_create(
-            name="Default Driver",
-            defaults={
-                'license_number': 'DEFAULT123',
-                'carrier_name': 'Default Carrier',
-                'home_terminal': 'Default Terminal'
-            }
-        )
+    try:
+        driver = get_plan_driver(data.get('driver_id'))
+    except Driver.DoesNotExist:
+        return Response({"error": "Driver not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    inline_images = request.query_params.get('inline_images') in ('1', 'true')
+    # ?fields= and ?expand= shape the trip_plan object in the response
+    fields = field_params(request, 'fields')
+    expand = field_params(request, 'expand')
+
+    if request.query_params.get('async') in ('1', 'true'):
+        # Queue the pipeline and answer straight away; poll the job for the result
+        job = submit_plan_job({
+            **data,
+            'driver_id': driver.id,
+            'inline_images': inline_images,
+            'fields': sorted(fields) if fields else None,
+            'expand': sorted(expand) if expand else None,
+            'base_url': request.build_absolute_uri('/'),
+        })
+        return Response({
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": request.build_absolute_uri(reverse('plan-trip-job', args=[job.id])),
+        }, status=status.HTTP_202_ACCEPTED)
     
     try:
-        # Initialize trip planner service
-        trip_planner = TripPlannerService()
-        
-        # Calculate route
-        route_result = trip_planner.calculate_route(
-            current_location, 
-            pickup_location, 
-            dropoff_location
+        result = run_plan_trip(
+            data,
+            driver,
+            absolute_url=request.build_absolute_uri,
+            inline_images=inline_images,
+            fields=fields,
+            expand=expand,
         )
-        
-        # Plan rest stops
-        rest_stops_result = trip_planner.plan_rest_stops(
-            route_result,
-            current_cycle_used,
-            current_location_coordinates=trip_planner._get_coordinates(current_location),
-            pickup_location_coordinates=trip_planner._get_coordinates(pickup_location),
-            dropoff_location_coordinates=trip_planner._get_coordinates(dropoff_location),
+        return Response(result, status=status.HTTP_201_CREATED)
+    
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-        
-        # Generate ELD logs
-        eld_logs_result = trip_planner.generate_eld_logs(
-            route_result,
-            rest_stops_result,
-            current_cycle_used
+
+@api_view(['POST'])
+@renderer_classes([EventStreamRenderer, NDJSONRenderer])
+def plan_trip_stream(request):
+    """
+    Plan a trip like plan_trip, but stream each stage's result as soon as it
+    is ready: route, rest_stops, eld_logs, trip_plan, then one image event per
+    day with the base64 PNG (?images=0 leaves them to the image links). Sent
+    as Server-Sent Events, or as NDJSON for Accept: application/x-ndjson.
+    """
+    serializer = TripInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+
+    try:
+        driver = get_plan_driver(data.get('driver_id'))
+    except Driver.DoesNotExist:
+        return Response({"error": "Driver not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    events = iter_plan_trip(
+        data,
+        driver,
+        absolute_url=request.build_absolute_uri,
+        render_images=request.query_params.get('images') not in ('0', 'false'),
+        fields=field_params(request, 'fields'),
+        expand=field_params(request, 'expand'),
+    )
+    return event_stream(events, renderer=request.accepted_renderer, asynchronous=isinstance(request._request, ASGIRequest))
+
+@csrf_exempt
+@require_POST
+async def async_plan_trip(request):
+    """
+    plan_trip as a native async view, for ASGI servers (the Procfile's web
+    process runs uvicorn workers). Takes the same JSON body and ?inline_images/?fields/?expand
+    parameters, but holds no thread while ORS calls are in flight.
+    """
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = TripInputSerializer(data=body)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+
+    try:
+        driver = await db_sync_to_async(get_plan_driver)(data.get('driver_id'))
+    except Driver.DoesNotExist:
+        return JsonResponse({"error": "Driver not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        result = await arun_plan_trip(
+            data,
+            driver,
+            absolute_url=request.build_absolute_uri,
+            inline_images=request.GET.get('inline_images') in ('1', 'true'),
+            fields=field_params(request, 'fields'),
+            expand=field_params(request, 'expand'),
         )
-        
-        drawing_data, image_path = trip_planner.generate_and_draw_eld_logs(eld_logs_result)
-        
-        # Create trip plan object
-        trip_plan = TripPlan.objects.create(
-            driver=driver,
-            current_location=current_location,
-            current_location_coordinates=trip_planner._get_coordinates(current_location),
-            pickup_location=pickup_location,
-            pickup_location_coordinates=trip_planner._get_coordinates(pickup_location),
-            dropoff_location=dropoff_location,
-            dropoff_location_coordinates=trip_planner._get_coordinates(dropoff_location),
-            current_cycle_used=current_cycle_used,
-            route_data=route_result['route_data'],
-            estimated_miles=route_result['distance_miles'],
-            estimated_duration=route_result['duration_hours']
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return JsonResponse(result, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+def plan_trip_batch(request):
+    """
+    Plan a batch of trips in one request.
+    Takes {"trips": [...]} with each item shaped like a plan-trip request and
+    returns one {"index", "result"} or {"index", "error"} entry per item.
+    """
+    trips = request.data.get('trips') if isinstance(request.data, dict) else None
+    if not isinstance(trips, list) or not trips:
+        return Response({"trips": ["Expected a non-empty list of trips."]}, status=status.HTTP_400_BAD_REQUEST)
+    max_size = getattr(settings, 'BATCH_PLAN_MAX_SIZE', 50)
+    if len(trips) > max_size:
+        return Response({"trips": [f"At most {max_size} trips per batch."]}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = [None] * len(trips)
+    valid = []
+    for index, item in enumerate(trips):
+        serializer = TripInputSerializer(data=item)
+        if not serializer.is_valid():
+            results[index] = {"index": index, "error": serializer.errors}
+            continue
+        data = serializer.validated_data
+        try:
+            driver = get_plan_driver(data.get('driver_id'))
+        except Driver.DoesNotExist:
+            results[index] = {"index": index, "error": "Driver not found"}
+            continue
+        valid.append((index, data, driver))
+
+    try:
+        planned = run_plan_trip_batch(
+            [(data, driver) for _, data, driver in valid],
+            absolute_url=request.build_absolute_uri,
         )
-        
-        # Create rest stops
-        for stop_data in rest_stops_result['rest_stops']:
-            RestStop.objects.create(
-                trip=trip_plan,
-                location=stop_data['location'],
-                arrival_time=stop_data['arrival_time'],
-                departure_time=stop_data['departure_time'],
-                rest_duration=stop_data['rest_duration'],
-                is_fuel_stop=stop_data['is_fuel_stop']
-            )
-        
-        # Create ELD logs
-        for log_data in eld_logs_result:
-            # Generate drawing data for this log
-            
-            ELDLog.objects.create(
-                trip=trip_plan,
-                date=log_data['date'],
-                log_data={
-                    'entries': log_data['log_entries'],
-                },
-                total_off_duty_hours=log_data['total_off_duty_hours'],
-                total_sleeper_hours=log_data['total_sleeper_hours'],
-                total_driving_hours=log_data['total_driving_hours'],
-                total_on_duty_hours=log_data['total_on_duty_hours'],
-                total_hours=log_data['total_hours'],
-                total_miles_driven=log_data['total_miles']
-            )
-        
-        # Return complete trip plan with rest stops and ELD logs
-        response_data = TripPlanSerializer(trip_plan).data
-        
-        return Response({"trip_plan": response_data, "drawing_data": drawing_data, "image_path": image_path}, status=status.HTTP_201_CREATED)
-    
     except Exception as e:
         return Response(
             {"error": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-# @api_view(['GET'])
-# def generate_eld_log_image(request, log_id):
-#     """
-#     Generate an ELD log image for a specific log
-#     """
-#     try:
-#         eld_log = ELDLog.objects.get(id=log_id)
-        
-#         # In a real implementation, you'd generate an image here
-#         # For now, we'll just return the drawing data
-#         return Response(eld_log.log_data)
-    
-#     except ELDLog.DoesNotExist:
-#         return Response(
-#             {"error": "ELD log not found"},
-#             status=status.HTTP_404_NOT_FOUND
-#         )
\ No newline at end of file
+    for (index, _, _), item_result in zip(valid, planned):
+        results[index] = {**item_result, "index": index}
+    return Response({"results": results}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+def hos_simulate(request):
+    """
+    Run the HOS rest-stop simulation for many (distance_miles, cycle_used,
+    departure_hour) scenarios at once. Returns one list per output, in
+    scenario order.
+    """
+    serializer = HOSSimulationInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+
+    names = ('distance_miles', 'cycle_used', 'departure_hour')
+    lengths = [len(data[name]) for name in names]
+    if data['grid']:
+        scenarios = math.prod(lengths)
+    elif len(set(lengths) - {1}) > 1:
+        return Response(
+            {"error": "distance_miles, cycle_used and departure_hour must have the same length or length 1"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    else:
+        scenarios = max(lengths)
+
+    # Checked before the arrays are built so an oversized grid never gets allocated
+    max_scenarios = getattr(settings, 'HOS_SIMULATION_MAX_SCENARIOS', 100000)
+    if scenarios > max_scenarios:
+        return Response({"error": f"At most {max_scenarios} scenarios per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    inputs = [np.asarray(data[name], dtype=float) for name in names]
+    if data['grid']:
+        inputs = np.meshgrid(*inputs, indexing='ij')
+    inputs = np.broadcast_arrays(*inputs)
+
+    distance_miles, cycle_used, departure_hour = (values.ravel() for values in inputs)
+    result = simulate_hos(distance_miles, cycle_used, departure_hour)
+    return Response({
+        "scenarios": int(distance_miles.size),
+        "distance_miles": distance_miles.tolist(),
+        "cycle_used": cycle_used.tolist(),
+        "departure_hour": departure_hour.tolist(),
+        **{name: values.tolist() for name, values in result.items()},
+    })
+
+@api_view(['GET'])
+def plan_trip_job(request, job_id):
+    """
+    Progress and result of an asynchronous plan-trip job
+    """
+    job = get_object_or_404(PlanTripJob, id=job_id)
+    return Response(PlanTripJobSerializer(job).data)
+
+@api_view(['GET'])
+def cache_stats(request):
+    """
+    Hit/miss counters for the process-local caches
+    """
+    return Response(all_cache_stats())
+
+@require_GET
+def metrics(request):
+    """
+    Request, stage, ORS, database, render and cache counters for this worker
+    process in the Prometheus text format
+    """
+    return HttpResponse(prometheus_text(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@require_GET
+def eld_log_image(request, log_id):
+    """
+    PNG of an ELD log, rendered on first request from its stored entries.
+    Images are content-addressed, so the cache key doubles as the ETag.
+    """
+    eld_log = get_object_or_404(ELDLog, id=log_id)
+    entries = TripPlannerService.drawing_entries(eld_log.log_data.get('entries', []))
+    etag = f'"{image_cache_key(entries)}"'
+
+    # Handles lists, weak validators and `*` in If-None-Match
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        png = render_days([entries])[0]
+        response = HttpResponse(png, content_type='image/png')
+    response['ETag'] = etag
+    response['Cache-Control'] = f"public, max-age={settings.ELD_IMAGE_MAX_AGE}"
+    return response
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tripapi.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -111,3 +112,98 @@ CORS_ALLOW_HEADERS = [
     "Authorization",
     "X-CSRFToken",
 ]
+
+# Geocoding cache
+GEOCODE_CACHE_TTL = 60 * 60 * 24 * 30  # Seconds before a cached address is geocoded again
+GEOCODE_CACHE_MAX_ENTRIES = 5000       # Least recently used addresses are evicted past this
+
+# OpenRouteService client
+ORS_API_KEY = os.environ.get('ORS_API_KEY', '5b3ce3597851110001cf6248de17e0ce4e6a47d980377adb0d23441b')
+ORS_BASE_URL = os.environ.get('ORS_BASE_URL', 'https://api.openrouteservice.org')
+ORS_TIMEOUTS = {
+    'geocode': (5, 30),      # (connect, read) seconds
+    'directions': (5, 120),
+}
+ORS_MAX_RETRIES = 3          # Retries for connection errors, 429 and 5xx responses
+ORS_BACKOFF_FACTOR = 0.5     # Sleep 0.5s, 1s, 2s between retries
+ORS_MAX_CONCURRENCY = 8      # Max ORS requests in flight per worker process
+ORS_ASYNC_MAX_CONCURRENCY = 256  # Max ORS requests in flight per event loop (async views)
+
+# In-process cache of ORS directions responses, keyed by the request with
+# coordinates rounded to ROUTE_CACHE_PRECISION decimal places (~1 m)
+ROUTE_CACHE_TTL = 60 * 60
+ROUTE_CACHE_MAX_ENTRIES = 256
+ROUTE_CACHE_PRECISION = 5
+
+# Rest/fuel stop POI lookups run concurrently on this many threads per plan
+POI_LOOKUP_WORKERS = 8
+
+# Offline truck-stop POI store (see `manage.py rebuild_poi_index`)
+POI_DATA_FILE = BASE_DIR / 'tripapi' / 'data' / 'truck_stops.csv'
+POI_INDEX_CELL_DEGREES = 0.5   # Grid cell size of the in-memory spatial index
+POI_MAX_DISTANCE_MILES = 25    # Fall back to an ORS search if nothing is this close
+# The shipped truck_stops.csv has no rows, so until real data is loaded every
+# stop comes from the ORS search; False names them "Unknown ... stop" instead
+POI_REMOTE_FALLBACK = True
+
+# ELD log image rendering: 'raster' (OpenCV, default) or 'matplotlib'
+ELD_RENDERER = os.environ.get('ELD_RENDERER', 'raster')
+
+# Blank log images ELD renders are drawn on, decoded once per process
+ELD_LOG_TEMPLATES = {
+    'default': BASE_DIR / 'blank-paper-log.png',
+}
+ELD_LOG_TEMPLATE = 'default'
+
+# Multi-day ELD renders run on a per-worker process pool
+ELD_RENDER_WORKERS = int(os.environ.get('ELD_RENDER_WORKERS', min(4, os.cpu_count() or 1)))  # 1 renders inline
+ELD_RENDER_TIMEOUT = 60            # Seconds allowed per day's render
+ELD_RENDER_START_METHOD = 'spawn'  # Don't fork a process that holds open DB/HTTP connections
+
+# Rendered ELD images are cached on disk by content hash, shared by all workers
+ELD_IMAGE_CACHE_DIR = MEDIA_ROOT / 'eld_cache'
+ELD_IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used images are evicted past this
+ELD_IMAGE_MAX_AGE = 60 * 60  # Cache-Control max-age for /api/eld-logs/<id>/image.png
+
+# Asynchronous plan-trip jobs (POST /api/plan-trip/?async=1) run on this many
+# threads per worker; `manage.py run_plan_jobs` drains the queue out of process
+PLAN_JOB_WORKERS = 2
+# A running job whose worker hasn't reported progress for PLAN_JOB_LEASE_SECONDS
+# (e.g. it was killed mid-run) is queued again, up to PLAN_JOB_MAX_ATTEMPTS claims
+PLAN_JOB_LEASE_SECONDS = 10 * 60
+PLAN_JOB_MAX_ATTEMPTS = 3
+
+# Batch planning (POST /api/plan-trips/batch/): geocode and route calls run on
+# this many threads, and a batch may hold at most BATCH_PLAN_MAX_SIZE trips
+BATCH_PLAN_CONCURRENCY = 8
+BATCH_PLAN_MAX_SIZE = 50
+
+# Largest number of scenarios POST /api/hos/simulate/ evaluates in one request
+HOS_SIMULATION_MAX_SCENARIOS = 100000
+HOS_SIMULATION_MAX_MILES = 10000  # Longest trip a scenario may ask for
+
+# Departure recommendations returned with every plan: candidate departures
+# every DEPARTURE_SEARCH_STEP_MINUTES over the next DEPARTURE_SEARCH_HOURS
+DEPARTURE_SEARCH_HOURS = 48
+DEPARTURE_SEARCH_STEP_MINUTES = 15
+DEPARTURE_RECOMMENDATIONS = 5
+
+# tripapi logs one line per request with its Server-Timing spans (as `extra`
+# fields for structured handlers) at INFO; set TRIPAPI_LOG_LEVEL=INFO to see them
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'tripapi': {
+            'handlers': ['console'],
+            'level': os.environ.get('TRIPAPI_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
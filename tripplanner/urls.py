@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from tripapi.views import DriverViewSet, TripPlanViewSet, plan_trip
+from tripapi.views import DriverViewSet, TripPlanViewSet, plan_trip, plan_trip_stream, async_plan_trip, plan_trip_batch, plan_trip_job, hos_simulate, cache_stats, metrics, eld_log_image
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import HttpResponse
@@ -17,8 +17,15 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/plan-trip/', plan_trip, name='plan-trip'),
+    path('api/plan-trip/stream/', plan_trip_stream, name='plan-trip-stream'),
+    path('api/async/plan-trip/', async_plan_trip, name='async-plan-trip'),
+    path('api/plan-trips/batch/', plan_trip_batch, name='plan-trip-batch'),
+    path('api/plan-trip/jobs/<uuid:job_id>/', plan_trip_job, name='plan-trip-job'),
+    path('api/hos/simulate/', hos_simulate, name='hos-simulate'),
+    path('api/cache-stats/', cache_stats, name='cache-stats'),
+    path('api/metrics/', metrics, name='metrics'),
+    path('api/eld-logs/<int:log_id>/image.png', eld_log_image, name='eld-log-image'),
     path('', home),
-    # path('api/eld-log-image/<int:log_id>/', generate_eld_log_image, name='eld-log-image'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 # Add static and media URLs for development